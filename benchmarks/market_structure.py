@@ -0,0 +1,61 @@
+"""
+market_structure : time fitting the market graph of a large universe
+
+Variations come from a synthetic factor model with one factor per sector.
+Times a cold fit, the next day's fit warm started from it and a refresh of
+a day already fit, against the GraphicalLassoCV fit plot_stock_market.py
+used to run (skipped above 100 tickers, it takes minutes there).
+
+    python -m benchmarks.market_structure [tickers]
+"""
+import logging
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sklearn.covariance import GraphicalLassoCV
+
+from models.market_structure import MarketStructure, standardize
+
+TICKERS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+DAYS = 250
+SECTORS = 11
+
+
+def variations(n_tickers, n_days, seed=0):
+    rng = np.random.RandomState(seed)
+    factors = rng.normal(0, 1, (n_days, SECTORS))
+    loadings = np.zeros((SECTORS, n_tickers))
+    loadings[rng.randint(0, SECTORS, n_tickers), np.arange(n_tickers)] = rng.uniform(.5, 1.5, n_tickers)
+    return factors.dot(loadings) + rng.normal(0, 1, (n_days, n_tickers))
+
+
+def timed(fn, *args, **kwargs):
+    start = time.time()
+    result = fn(*args, **kwargs)
+    return time.time() - start, result
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+    X = variations(TICKERS, DAYS + 1)
+    tickers = ['T{}'.format(i) for i in range(TICKERS)]
+
+    directory = tempfile.mkdtemp()
+    try:
+        model = MarketStructure(directory=directory)
+        cold, structure = timed(model.fit, tickers, X[:-1], date='2017-01-03')
+        warm, _ = timed(model.fit, tickers, X[1:], date='2017-01-04')
+        cached, _ = timed(model.fit, tickers, X[1:], date='2017-01-04')
+    finally:
+        shutil.rmtree(directory)
+
+    print('{} tickers x {} days, {} clusters, {} edges'.format(
+        TICKERS, DAYS, len(structure.clusters()), len(structure.edges()[0])))
+    print('    cold fit {:.2f}s, next day warm {:.2f}s, same day cached {:.3f}s'.format(cold, warm, cached))
+
+    if TICKERS <= 100:
+        cv, _ = timed(GraphicalLassoCV().fit, standardize(X[:-1]))
+        print('    GraphicalLassoCV alone {:.2f}s'.format(cv))
@@ -0,0 +1,43 @@
+"""
+pairing : scale the index based buy/sell pairing against the per-buy scan
+
+Events are spaced like RSI direction changes, about one every ten bars.
+The scan is only timed while it finishes in reasonable time.
+
+    python -m benchmarks.pairing
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from models.directors import NumpyDecider
+from models.directors_test import Calc, numpy_pairs_loop
+
+LOOP_MAX_BARS = 10000
+
+
+def bench(stmt, number=1):
+    return min(timeit.repeat(stmt, number=number, repeat=3)) / number
+
+
+def events(n_bars, rng):
+    dataset = pd.DataFrame({'adj_close': 100. + np.cumsum(rng.normal(0, 1, n_bars))},
+                           index=pd.date_range('2000-01-01', periods=n_bars, freq='h'))
+    idx = np.sort(rng.choice(n_bars, size=n_bars // 10, replace=False))
+    is_buy = rng.rand(len(idx)) < .5
+    return dataset, idx[is_buy], idx[~is_buy]
+
+
+if __name__ == '__main__':
+    rng = np.random.RandomState(0)
+    for n_bars in (1000, 10000, 100000, 1000000):
+        dataset, buys, sells = events(n_bars, rng)
+        decider = NumpyDecider(dataset, Calc(None))
+
+        fast = bench(lambda: decider.filter_buysell(buys, sells))
+        line = '{:>8} bars {:>6} buys  indexed {:9.2f}ms'.format(n_bars, len(buys), 1e3 * fast)
+        if n_bars <= LOOP_MAX_BARS:
+            loop = bench(lambda: numpy_pairs_loop(dataset, buys, sells))
+            line += '  scan {:9.2f}ms  x{:.0f}'.format(1e3 * loop, loop / fast)
+        print(line)
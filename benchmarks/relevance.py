@@ -0,0 +1,64 @@
+"""
+relevance : time a Relevancy sweep serially and with worker pools
+
+Prices come from a local synthetic random walk with a fixed per-request
+latency standing in for the network, and the DataStore lives in a
+temporary directory, so nothing is fetched or cached for real.
+
+    python -m benchmarks.relevance [latency seconds]
+"""
+import logging
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import models.security
+import sort_securities
+from sort_securities import Relevancy
+
+LATENCY = float(sys.argv[1]) if len(sys.argv) > 1 else 0.05
+
+
+def synthetic_data(startdate, enddate, ticker, period='day'):
+    time.sleep(LATENCY)
+    index = pd.bdate_range(pd.Timestamp(startdate).normalize(), pd.Timestamp(enddate).normalize())
+    rng = np.random.RandomState(sum(map(ord, ticker)))
+    close = 100. + np.cumsum(rng.normal(0, 1, len(index)))
+    return pd.DataFrame({'open': close + rng.normal(0, .5, len(index)),
+                         'high': close + 1., 'low': close - 1., 'close': close,
+                         'volume': rng.randint(1000, 5000, len(index)).astype(float),
+                         'adj_close': close}, index=index)
+
+
+def sweep(workers):
+    start = time.time()
+    ranked = Relevancy(key='stocks', workers=workers).sortby_relevance()
+    return time.time() - start, ranked
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+    models.security.load_data = models.security.load_crypto_data = synthetic_data
+
+    n = len(sort_securities.tickers_lookup['stocks'])
+    for cached in (False, True):
+        store_dir = models.security.Security.store_dir = tempfile.mkdtemp()
+        try:
+            if cached:
+                sweep(None)  # populate the store, later syncs are no-ops
+
+            baseline, expected = sweep(None)
+            print('{} tickers ({}): serial {:.2f}s'.format(n, 'cached' if cached else 'cold', baseline))
+            for workers in (2, 4, 8):
+                if not cached:
+                    shutil.rmtree(store_dir)
+                    store_dir = models.security.Security.store_dir = tempfile.mkdtemp()
+                elapsed, ranked = sweep(workers)
+                assert ranked == expected
+                print('    workers={}: {:.2f}s x{:.1f}'.format(workers, elapsed, baseline / elapsed))
+        finally:
+            shutil.rmtree(store_dir)
@@ -0,0 +1,75 @@
+"""
+render : time and memory of rendering the evaluate chart
+
+Renders the web chart of a synthetic random walk, svg and png, for the
+rsi and macd strategies on a daily and an hourly sized history, then the
+same charts from several threads at once as the web service would.
+
+    python -m benchmarks.render
+"""
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from models.security import Security
+
+REPEAT = 10
+THREADS = 4
+
+
+def security(bars):
+    index = pd.bdate_range('2010-01-01', periods=bars)
+    prices = 100. + np.cumsum(np.random.RandomState(0).normal(0, 1, bars))
+    s = Security('SYN', sync=False)
+    s.daily = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1,
+                            'close': prices, 'volume': prices, 'adj_close': prices}, index=index)
+    return s
+
+
+def render(s, klass, fmt):
+    with s.span('daily', klass) as so:
+        so.eval.evaluate(so.decide.compute_orders())
+        return so.plot.plot_data(web=True, fmt=fmt).getvalue()
+
+
+def timed(fn, *args):
+    """seconds per call, then the python heap peak of one more traced call"""
+    start = time.time()
+    for _ in range(REPEAT):
+        fn(*args)
+    elapsed = (time.time() - start) / REPEAT
+
+    tracemalloc.start()
+    chart = fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, len(chart)
+
+
+if __name__ == '__main__':
+    Security.store_dir = tempfile.mkdtemp()
+    try:
+        for bars in (250, 2000):
+            s = security(bars)
+            for klass in ('rsi', 'macd'):
+                for fmt in ('svg', 'png'):
+                    render(s, klass, fmt)  # warm up the fonts and the template
+                    elapsed, peak, size = timed(render, s, klass, fmt)
+                    print('{:>5} bars {:>4} {}: {:7.1f}ms  peak {:6.1f}MB python heap  {:5.0f}kB'.format(
+                        bars, klass, fmt, 1e3 * elapsed, peak / 2**20, size / 1e3))
+
+        s = security(250)
+        start = time.time()
+        with ThreadPoolExecutor(THREADS) as pool:
+            charts = list(pool.map(lambda _: render(s, 'rsi', 'png'), range(THREADS * REPEAT)))
+        print('{} png charts on {} threads: {:.1f}ms each, {} distinct'.format(
+            len(charts), THREADS, 1e3 * (time.time() - start) / len(charts), len(set(charts))))
+        print('max rss {:.0f}MB'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10))
+    finally:
+        shutil.rmtree(Security.store_dir)
@@ -0,0 +1,57 @@
+"""
+resample : span bars from the Resampler bucket codes against pandas resample
+
+pandas is the chain add_week used to run, resample then last of the
+shifted closes, and a plain resample().agg for the other frequencies.
+update is the Resampler recomputing the buckets of one new bar.
+
+    python -m benchmarks.resample
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from models.timespan import Resampler, OHLCV, WEEKLY
+
+REPEAT = 10
+
+
+def timed(fn, *args):
+    start = time.time()
+    for _ in range(REPEAT):
+        fn(*args)
+    return (time.time() - start) / REPEAT
+
+
+def pandas_week(f):
+    ohlv = f.resample('W-MON').agg({'open': 'last', 'high': 'max', 'low': 'min', 'volume': 'sum'})
+    closes = f[['close', 'adj_close']].shift(3, freq='D').resample('W-MON').last()
+    return pd.concat([ohlv.open, closes.close, ohlv.high, ohlv.low, ohlv.volume, closes.adj_close], axis=1)
+
+
+def bars(index):
+    prices = 100. + np.cumsum(np.random.RandomState(0).normal(0, 1, len(index)))
+    return pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices,
+                         'volume': prices, 'adj_close': prices}, index=index)
+
+
+if __name__ == '__main__':
+    daily = bars(pd.bdate_range('1990-01-01', '2017-12-31'))
+    hourly = bars(pd.date_range('2014-01-01', '2017-12-31', freq='H'))
+
+    for name, f, freq in (('daily', daily, 'weekly'), ('daily', daily, 'QS'), ('daily', daily, '2B'),
+                          ('hourly', hourly, '4H'), ('hourly', hourly, 'D'), ('hourly', hourly, 'weekly')):
+        if freq == 'weekly':
+            resampler, pandas = WEEKLY, timed(pandas_week, f)
+        else:
+            resampler = Resampler(freq)
+            # pandas has no bucket of two sessions of a holiday calendar
+            pandas = timed(lambda: f.resample(freq, origin='epoch').agg(OHLCV)) if freq != '2B' else None
+
+        full = timed(resampler.resample, f)
+        view = resampler.resample(f[:-1])
+        update = timed(resampler.update, view, f, f.index[-1])
+
+        print('{:>6} {:>7} bars {:>6}: pandas {:>8}  buckets {:7.2f}ms  update {:6.2f}ms'.format(
+            name, len(f), freq, '-' if pandas is None else '{:.2f}ms'.format(1e3 * pandas), 1e3 * full, 1e3 * update))
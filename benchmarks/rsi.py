@@ -0,0 +1,31 @@
+"""
+rsi : microbenchmark the vectorized RSI engine against the per-bar loop
+
+    python -m benchmarks.rsi
+"""
+import timeit
+
+import numpy as np
+
+from util.indicators import relative_strength, relative_strength_periods
+from util.indicators_test import relative_strength_loop, random_walk
+
+
+def bench(stmt, number=5):
+    return min(timeit.repeat(stmt, number=number, repeat=3)) / number
+
+
+if __name__ == '__main__':
+    for n_bars in (500, 5000, 50000):
+        prices = random_walk(n_bars)
+        loop = bench(lambda: relative_strength_loop(prices, 7))
+        vect = bench(lambda: relative_strength(prices, 7))
+        print('{:>6} bars  loop {:8.2f}ms  vectorized {:8.3f}ms  x{:.0f}'.format(
+            n_bars, 1e3 * loop, 1e3 * vect, loop / vect))
+
+    n_tickers, n_bars = 500, 500
+    prices = random_walk((n_tickers, n_bars))
+    loop = bench(lambda: [relative_strength_loop(p, n) for p in prices for n in (7, 14, 21)], number=1)
+    vect = bench(lambda: relative_strength_periods(prices, (7, 14, 21)))
+    print('{} tickers x {} bars x 3 periods  loop {:8.2f}ms  batch {:8.3f}ms  x{:.0f}'.format(
+        n_tickers, n_bars, 1e3 * loop, 1e3 * vect, loop / vect))
@@ -0,0 +1,40 @@
+"""
+trailing : time relevance scoring over the full history against the trailing window
+
+score computes the RSI blend over every bar to average the last few,
+trailing_score only over the bars those depend on.  Histories are
+synthetic random walks with a weekly series of every fifth bar.
+
+    python -m benchmarks.trailing
+"""
+import time
+
+import numpy as np
+
+from sort_securities import score, trailing_score, trailing_bars, DEFAULT_WEIGHTING
+
+N_PERIODS = -5
+REPEAT = 20
+
+
+def timed(fn, *args):
+    start = time.time()
+    for _ in range(REPEAT):
+        result = fn(*args)
+    return (time.time() - start) / REPEAT, result
+
+
+if __name__ == '__main__':
+    rng = np.random.RandomState(0)
+    print('trailing window of {} bars'.format(trailing_bars(N_PERIODS)))
+
+    for bars in (2500, 25000, 250000, 2500000):
+        daily = 100. + np.cumsum(rng.normal(0, 1, bars))
+        weekly = daily[4::5]
+
+        full, expected = timed(score, daily, weekly, DEFAULT_WEIGHTING, N_PERIODS)
+        trailing, result = timed(trailing_score, daily, weekly, DEFAULT_WEIGHTING, N_PERIODS)
+        assert abs(result - expected) <= 1e-8 * abs(expected)
+
+        print('{:>8} bars: full {:8.3f}ms  trailing {:6.3f}ms  x{:.0f}'.format(
+            bars, 1e3 * full, 1e3 * trailing, full / trailing))
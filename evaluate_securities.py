@@ -8,19 +8,23 @@ When we set the span to week, we need to pull YTD data. While daily should be li
 """
 
 import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from optparse import OptionParser
 from pprint import pprint
-from sklearn.externals.joblib import Parallel, delayed
 
 from finance_ndx import NDX_constituents, my_faves
+from models.indicators import BatchEvaluator
 from models.security import Security
+from models.sweep import Sweep, best
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s %(levelname)s %(message)s')
 
 parser = OptionParser()
 parser.add_option("--span", dest="span", default='daily',
-                  help="Select a timespan to process on (daily, weekly, monthly)")
+                  help="Select a timespan to process on (daily, weekly, monthly, quarterly"
+                  " or a pandas frequency such as 2D, hourly and 4h for crypto)")
 parser.add_option("--verbose",
                   action="store_true", dest="verbose", default=False,
                   help="Print additional information to the console")
@@ -44,6 +48,16 @@ parser.add_option("--macd",
 parser.add_option("--start-date", dest="start_date",
                   default=None,
                   help="Truncate the plot, starting from given start date")
+parser.add_option("--score",
+                  action="store_true", dest="score", default=False,
+                  help="Only score the strategy on every ticker in one batch, no plots")
+parser.add_option("--sweep",
+                  action="store_true", dest="sweep", default=False,
+                  help="Backtest a grid of indicator settings and print the best ones")
+parser.add_option("--jobs", dest="jobs", type="int", default=None,
+                  help="Evaluate the tickers in this many worker processes and"
+                  " print a summary of timings and failures. With --sweep,"
+                  " the number of sweep processes (default: one per core)")
 
 # TODO span can be defined as the first argument instead of flag
 
@@ -58,32 +72,36 @@ elif len(args) == 0:
 raise_exception = True
 
 
-def run_one(ticker):
-    try:
-        s = Security.load(ticker, force_fetch=opts.force, crypto=opts.crypto)
+def evaluate(ticker):
+    s = Security.load(ticker, force_fetch=opts.force, crypto=opts.crypto)
+
+    # Create a view of the data for the timespan we are interested in
+    with s.span(opts.span, opts.indicator, start_date=opts.start_date) as so:
+
+        if opts.verbose:
+            print('Events for {} strategy'.format(so.span))
+            pprint(so.recent_events(last_n=5))
+            print('')
 
-        # Create a view of the data for the timespan we are interested in
-        with s.span(opts.span, opts.indicator, start_date=opts.start_date) as so:
+        # Use our strategy to figure out when to buy and sell
+        orders = so.decide.compute_orders()
+        if opts.verbose:
+            print('List of Buy/Sell')
+            pprint(list(zip(*orders)))
+            print('')
 
-            if opts.verbose:
-                print('Events for {} strategy'.format(so.span))
-                pprint(so.recent_events(last_n=5))
-                print('')
+        # Evaluate our strategy
+        so.eval.evaluate(orders)
 
-            # Use our strategy to figure out when to buy and sell
-            orders = so.decide.compute_orders()
-            if opts.verbose:
-                print('List of Buy/Sell')
-                pprint(zip(*orders))
-                print('')
+        # Save a plot of our work
+        so.plot.plot_data(save=opts.save_plot)
 
-            # Evaluate our strategy
-            so.eval.evaluate(orders)
+    s.save()
 
-            # Save a plot of our work
-            so.plot.plot_data(save=opts.save_plot)
 
-        s.save()
+def run_one(ticker):
+    try:
+        evaluate(ticker)
     except Exception as e:
         if not raise_exception:
             logging.error('{} blew up with {}'.format(ticker, e))
@@ -91,7 +109,85 @@ def run_one(ticker):
             raise e
 
 
+def headless():
+    """worker initializer, plots are only ever saved to files"""
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+
+
+def timed_run(ticker):
+    """(ticker, seconds, error) of evaluating ticker, error is None when it went fine"""
+    start = time.time()
+    try:
+        evaluate(ticker)
+        error = None
+    except Exception as e:
+        logging.error('{} blew up with {}'.format(ticker, e))
+        error = '{}: {}'.format(type(e).__name__, e)
+    return ticker, time.time() - start, error
+
+
+def run_batch(tickers, jobs):
+    """evaluate tickers over jobs worker processes, one result of timed_run each"""
+    results = []
+    with ProcessPoolExecutor(jobs, initializer=headless) as pool:
+        for future in as_completed([pool.submit(timed_run, ticker) for ticker in tickers]):
+            results.append(future.result())
+            logging.info('{} of {} tickers done'.format(len(results), len(tickers)))
+    return results
+
+
+def summary(results, elapsed):
+    """one line per ticker, slowest first, then the failures"""
+    lines = ['{:<10} {:8.2f}s  {}'.format(ticker, seconds, 'failed' if error else 'ok')
+             for ticker, seconds, error in sorted(results, key=lambda r: -r[1])]
+
+    failed = [(ticker, error) for ticker, _, error in results if error]
+    lines.append('')
+    lines.append('{} tickers, {} failed, {:.1f}s of work in {:.1f}s'.format(
+        len(results), len(failed), sum(r[1] for r in results), elapsed))
+    lines.extend('{:<10} {}'.format(ticker, error) for ticker, error in sorted(failed))
+    return '\n'.join(lines)
+
+
+def orders_of(ticker):
+    """open prices and orders of the strategy on ticker"""
+    s = Security.load(ticker, force_fetch=opts.force, crypto=opts.crypto)
+    with s.span(opts.span, opts.indicator, start_date=opts.start_date) as so:
+        orders = so.decide.compute_orders()
+        opens = so.dataset.open.values
+    s.save()
+    return opens, orders
+
+
+def score(tickers):
+    """BatchEvaluator table of the strategy over tickers, best first"""
+    scored, opens, orders = [], [], []
+    for ticker in tickers:
+        try:
+            o, order = orders_of(ticker)
+        except Exception as e:
+            logging.error('{} blew up with {}'.format(ticker, e))
+            continue
+        scored.append(ticker)
+        opens.append(o)
+        orders.append(order)
+
+    table = BatchEvaluator.from_orders(scored, opens, orders).evaluate()
+    return table.sort_values('performance', ascending=False)
+
+
 if __name__ == '__main__':
-    # Parallel(n_jobs=4)(delayed(run_one)(ticker) for ticker in args)
-    for ticker in args:
-        run_one(ticker)
+    if opts.score:
+        print(score(args).to_string())
+    elif opts.sweep:
+        table = Sweep(args, opts.indicator, span=opts.span, start_date=opts.start_date, crypto=opts.crypto,
+                      workers=opts.jobs).run()
+        print(best(table))
+        print(best(table, per_ticker=True))
+    elif opts.jobs and opts.jobs > 1:
+        start = time.time()
+        print(summary(run_batch(args, opts.jobs), time.time() - start))
+    else:
+        for ticker in args:
+            run_one(ticker)
@@ -0,0 +1,40 @@
+"""
+inventory : freshness of every security in DataStore/, read from the store headers only
+
+    python inventory.py [--stale] [--verify]
+
+--stale lists only the tickers load would refetch, one per line, so they
+can be fed straight back to evaluate_securities.py.  Unreadable stores are
+listed by their name.
+"""
+import logging
+from optparse import OptionParser
+
+from models.security import Security
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(message)s')
+
+parser = OptionParser()
+parser.add_option("--stale",
+                  action="store_true", dest="stale", default=False,
+                  help="Only print the tickers that need a sync")
+parser.add_option("--verify",
+                  action="store_true", dest="verify", default=False,
+                  help="Read every column and check it against the header checksum")
+
+
+if __name__ == '__main__':
+    (opts, args) = parser.parse_args()
+
+    table = Security.inventory(verify=opts.verify)
+    if opts.stale:
+        stale = table[table.stale.fillna(True).astype(bool)]
+        # unreadable stores have no ticker, load refetches them all the same
+        for ticker in stale.ticker.fillna(stale.index.to_series()).unique():
+            print(ticker)
+    else:
+        print(table.to_string())
+        print('')
+        print('{} stored, {} stale, {} unreadable'.format(
+            len(table), int(table.stale.fillna(False).sum()), int(table.error.notnull().sum())))
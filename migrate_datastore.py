@@ -0,0 +1,63 @@
+"""
+migrate_datastore : convert joblib-pickled Security objects in DataStore/ to the columnar store
+
+Pickles written before the column store are plain files named after the
+ticker (coin-prefixed for crypto).  Each one is unpickled once, its daily
+bars are written to <name>.cols/ and the pickle is removed unless --keep.
+
+    python migrate_datastore.py [--keep] [--dry-run]
+"""
+import logging
+import os
+from optparse import OptionParser
+
+import joblib
+
+from models.security import Security
+from models.store import ColumnStore
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(message)s')
+
+parser = OptionParser()
+parser.add_option("--keep",
+                  action="store_true", dest="keep", default=False,
+                  help="Keep the pickle files after converting them")
+parser.add_option("--dry-run",
+                  action="store_true", dest="dry_run", default=False,
+                  help="List the pickles that would be converted")
+
+
+def legacy_pickles(path):
+    for name in sorted(os.listdir(path)):
+        filename = os.path.join(path, name)
+        if os.path.isfile(filename) and not name.startswith('.') and not name.endswith('.lock'):
+            yield filename
+
+
+def migrate(filename, keep=False):
+    old = joblib.load(filename)
+
+    # caches older than class_version 3.0 predate crypto support
+    is_crypto = getattr(old, 'is_crypto', False)
+
+    store = ColumnStore(Security._filename(old.ticker, is_crypto))
+    store.write(old.daily.sort_index(), ticker=old.ticker, is_crypto=is_crypto, enddate=old.enddate)
+    logging.info('Migrated {} ({} rows) to {}'.format(filename, len(old.daily), store.path))
+
+    if not keep:
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    (opts, args) = parser.parse_args()
+
+    for filename in legacy_pickles(Security.store_dir):
+        if opts.dry_run:
+            print(filename)
+            continue
+
+        try:
+            migrate(filename, keep=opts.keep)
+        except Exception as e:
+            logging.error('Could not migrate {} ({})'.format(filename, e))
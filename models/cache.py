@@ -0,0 +1,259 @@
+"""
+cache : in-memory LRU caches bounded by the size of what they hold, and the
+precomputed relevance rankings served by /relevance
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from util import cwd
+from util.atomic import atomic_write
+
+CHARTDIR = os.path.join(cwd, 'Output', 'charts')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+RELEVANCEDIR = os.path.join(cwd, 'Output', 'relevance')
+
+
+class LRUCache(object):
+    """Least recently used mapping, evicts once the values exceed max_bytes"""
+
+    def __init__(self, max_bytes, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.items.pop(key)
+            except KeyError:
+                return default
+            self.items[key] = value
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.items:
+                self.nbytes -= self.sizeof(self.items.pop(key))
+            self.items[key] = value
+            self.nbytes += size
+
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.nbytes -= self.sizeof(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.nbytes = 0
+
+
+class ChartCache(LRUCache):
+    """
+    Rendered charts keyed by everything that changes the picture, the key
+    doubles as the HTTP ETag.  Charts are also written to directory when
+    one is given, so they survive restarts and are shared between processes.
+    svg charts are str, png charts bytes.  The oldest files are removed once
+    the directory holds more than max_disk_bytes, 4 * max_bytes by default.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, directory=None, max_disk_bytes=None):
+        super(ChartCache, self).__init__(max_bytes)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes or 4 * max_bytes
+        self.disk_bytes = 0
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        if directory:
+            self.prune()
+
+    @staticmethod
+    def key(ticker, span, klass, start_date, last_bar, fmt='svg'):
+        """last_bar is the timestamp of the newest bar, new data means a new key"""
+        ident = '|'.join(map(str, (ticker, span, klass, start_date, last_bar, fmt)))
+        return hashlib.sha1(ident.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def prune(self):
+        """remove the least recently written charts until the directory fits max_disk_bytes"""
+        files = []
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        self.disk_bytes = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if self.disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.disk_bytes -= size
+
+    def get(self, key, default=None):
+        chart = super(ChartCache, self).get(key)
+        if chart is not None or not self.directory:
+            return chart if chart is not None else default
+
+        try:
+            with open(self._path(key), 'rb') as f:
+                chart = f.read()
+        except IOError:
+            return default
+        if not chart.startswith(PNG_SIGNATURE):
+            chart = chart.decode('utf-8')
+
+        super(ChartCache, self).put(key, chart)
+        return chart
+
+    def put(self, key, chart):
+        super(ChartCache, self).put(key, chart)
+        if not self.directory:
+            return
+
+        data = chart if isinstance(chart, bytes) else chart.encode('utf-8')
+        try:
+            with atomic_write(self._path(key), 'wb') as f:
+                f.write(data)
+        except IOError as e:
+            logging.error('Could not write chart {} ({})'.format(key, e))
+            return
+
+        self.disk_bytes += len(data)
+        if self.disk_bytes > self.max_disk_bytes:
+            self.prune()
+
+
+class IndicatorCache(LRUCache):
+    """
+    Indicator arrays computed on one Security, keyed by (indicator, params,
+    span, data version) so every span and strategy on the ticker shares
+    them.  Values are tuples of arrays, they are shared so they are made
+    read-only.
+    """
+
+    def __init__(self, max_bytes=16 * 2**20):
+        super(IndicatorCache, self).__init__(max_bytes, sizeof=self.sizeof_values)
+
+    @staticmethod
+    def sizeof_values(values):
+        return sum(getattr(v, 'nbytes', 0) for v in values)
+
+    def compute(self, key, fn, *args):
+        """fn(*args) unless key is cached already"""
+        values = self.get(key)
+        if values is None:
+            values = tuple(fn(*args))
+            for v in values:
+                if isinstance(v, np.ndarray):
+                    v.flags.writeable = False
+            self.put(key, values)
+        return values
+
+
+class RelevanceIndex(object):
+    """
+    Relevance rankings per lookup key and weighting, computed off the
+    request path by rank(lookup_key, weighting) which returns the ranked
+    [(name, score), ...] and the timestamp of the newest bar it used.
+
+    Entries live in memory and as json in directory, so a restart or the
+    nightly job (sort_securities.py --index) fills them for the server.  A
+    stale entry is read again from directory before it counts as stale, and
+    at most max_entries weightings are held in memory.
+    """
+
+    def __init__(self, rank, directory=None, max_age=datetime.timedelta(days=1), max_entries=32):
+        self.rank = rank
+        self.directory = directory
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(lookup_key, weighting):
+        return '{}-{:g}-{:g}'.format(lookup_key, *weighting)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _remember(self, key, entry):
+        self.entries.pop(key, None)
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, lookup_key, weighting):
+        """entry with ranked, data_time and computed, None when never computed"""
+        key = self.key(lookup_key, weighting)
+        entry = self.entries.get(key)
+        if not self.directory or not self.is_stale(entry):
+            return entry
+
+        # the nightly job may have written a newer one since we read ours
+        try:
+            with open(self._path(key)) as f:
+                stored = json.load(f)
+        except (IOError, ValueError):
+            return entry
+
+        if entry is None or stored['computed'] > entry['computed']:
+            entry = stored
+            self._remember(key, entry)
+        return entry
+
+    def is_stale(self, entry, now=None):
+        if entry is None:
+            return True
+        computed = datetime.datetime.strptime(entry['computed'], '%Y-%m-%dT%H:%M:%S.%f')
+        return (now or datetime.datetime.now()) - computed >= self.max_age
+
+    def refresh(self, lookup_key, weighting):
+        """rank again and replace the entry, blocks for the whole sweep"""
+        ranked, data_time = self.rank(lookup_key, weighting)
+        entry = {
+            'key': lookup_key,
+            'weighting': list(weighting),
+            'ranked': [[name, float(value)] for name, value in ranked],
+            'data_time': None if data_time is None else data_time.isoformat(),
+            'computed': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f'),
+        }
+
+        key = self.key(lookup_key, weighting)
+        self._remember(key, entry)
+        if self.directory:
+            with atomic_write(self._path(key)) as f:
+                json.dump(entry, f)
+
+        logging.info('Ranked {} securities for {}'.format(len(entry['ranked']), key))
+        return entry
+
+    @staticmethod
+    def names(entry, limit=None):
+        return [name for name, _ in entry['ranked'][:limit]]
@@ -0,0 +1,136 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from models.cache import LRUCache, ChartCache, IndicatorCache, RelevanceIndex, PNG_SIGNATURE
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recent(self):
+        cache = LRUCache(10)
+        cache.put('a', 'xxxx')
+        cache.put('b', 'xxxx')
+        cache.get('a')
+        cache.put('c', 'xxxx')
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.nbytes, 8)
+
+    def test_oversized(self):
+        cache = LRUCache(3)
+        cache.put('a', 'xxxx')
+        self.assertEqual(len(cache), 0)
+
+
+class TestChartCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_key_changes_with_data(self):
+        k1 = ChartCache.key('GLD', 'daily', 'rsi', None, '2017-01-02')
+        k2 = ChartCache.key('GLD', 'daily', 'rsi', None, '2017-01-03')
+        self.assertNotEqual(k1, k2)
+        self.assertEqual(k1, ChartCache.key('GLD', 'daily', 'rsi', None, '2017-01-02'))
+
+    def test_disk_tier(self):
+        key = ChartCache.key('GLD', 'daily', 'rsi', None, '2017-01-02')
+        ChartCache(directory=self.path).put(key, '<svg/>')
+        self.assertEqual(ChartCache(directory=self.path).get(key), '<svg/>')
+
+        key = ChartCache.key('GLD', 'daily', 'rsi', None, '2017-01-02', 'png')
+        ChartCache(directory=self.path).put(key, PNG_SIGNATURE + b'\x00')
+        self.assertEqual(ChartCache(directory=self.path).get(key), PNG_SIGNATURE + b'\x00')
+
+    def test_disk_bound(self):
+        cache = ChartCache(max_bytes=100, directory=self.path, max_disk_bytes=250)
+        keys = [ChartCache.key('GLD', 'daily', 'rsi', None, day) for day in range(5)]
+        for i, key in enumerate(keys):
+            cache.put(key, 'x' * 100)
+            os.utime(os.path.join(self.path, key), (i, i))
+
+        self.assertEqual(sorted(os.listdir(self.path)), sorted(keys[-2:]))
+        self.assertEqual(ChartCache(directory=self.path).get(keys[-1]), 'x' * 100)
+        self.assertIsNone(ChartCache(directory=self.path).get(keys[0]))
+
+
+class TestRelevanceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def rank(self, lookup_key, weighting):
+        self.calls.append((lookup_key, weighting))
+        return [('GLD', 10.), ('SPY', 20.), ('QQQ', 30.)], pd.Timestamp('2017-01-03')
+
+    def test_refresh_and_serve(self):
+        index = RelevanceIndex(self.rank, self.path)
+        self.assertIsNone(index.get('stocks', (.4, .6)))
+        self.assertTrue(index.is_stale(None))
+
+        index.refresh('stocks', (.4, .6))
+        entry = index.get('stocks', (.4, .6))
+        self.assertEqual(index.names(entry, limit=2), ['GLD', 'SPY'])
+        self.assertEqual(entry['data_time'], '2017-01-03T00:00:00')
+        self.assertFalse(index.is_stale(entry))
+        self.assertTrue(index.is_stale(entry, datetime.datetime.now() + datetime.timedelta(days=1)))
+        self.assertIsNone(index.get('stocks', (.5, .5)))
+
+        # another process finds the entry on disk without ranking again
+        other = RelevanceIndex(self.rank, self.path)
+        self.assertEqual(other.get('stocks', (.4, .6)), entry)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_reads_newer_from_disk(self):
+        server = RelevanceIndex(self.rank, self.path)
+        server.refresh('stocks', (.4, .6))
+        server.entries['stocks-0.4-0.6']['computed'] = '2017-01-01T00:00:00.000000'
+        self.assertTrue(server.is_stale(server.entries['stocks-0.4-0.6']))
+
+        # the nightly job ranked again in another process
+        nightly = RelevanceIndex(self.rank, self.path).refresh('stocks', (.4, .6))
+        self.assertEqual(server.get('stocks', (.4, .6)), nightly)
+        self.assertFalse(server.is_stale(server.get('stocks', (.4, .6))))
+
+    def test_bounded(self):
+        index = RelevanceIndex(self.rank, max_entries=2)
+        for w in (.1, .2, .3):
+            index.refresh('stocks', (w, 1 - w))
+        self.assertEqual(list(index.entries), ['stocks-0.2-0.8', 'stocks-0.3-0.7'])
+
+
+class TestIndicatorCache(unittest.TestCase):
+
+    def test_computes_once(self):
+        calls = []
+
+        def square(x):
+            calls.append(x)
+            return x ** 2, x + 1
+
+        cache = IndicatorCache()
+        first = cache.compute(('square', ('daily', 3)), square, np.arange(3.))
+        second = cache.compute(('square', ('daily', 3)), square, np.arange(3.))
+
+        self.assertEqual(len(calls), 1)
+        self.assertIs(first[0], second[0])
+        self.assertFalse(first[0].flags.writeable)
+        self.assertEqual(cache.nbytes, 48)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,46 @@ import logging
 import numpy as np
 
 
+def block_maxima(values):
+    """levels[l][j] = max(values[j:j + 2**l]) for every power of two up to len(values)"""
+    levels = [values] if len(values) else []
+    width = 1
+    while 2 * width <= len(values):
+        prev = levels[-1]
+        levels.append(np.maximum(prev[:-width], prev[width:]))
+        width *= 2
+    return levels
+
+
+def first_beat(sell_pos, sell_values, buy_pos, threshold):
+    """
+    For every buy find the first sell at or after buy_pos whose value is
+    greater than the buy's threshold.  sell_pos must be in chronological
+    (non-decreasing) order, as the deciders produce them.
+
+    Returns (start, beat) arrays over the buys: start is the index of the
+    first candidate sell (len(sell_pos) when there is none) and beat the
+    index of the first beating sell or -1.  Each buy costs a searchsorted
+    plus a binary descent over block maxima, O((buys + sells) log sells).
+    """
+    sell_values = np.where(np.isnan(sell_values), -np.inf, sell_values)  # NaN never beats
+    m = len(sell_values)
+
+    start = np.searchsorted(sell_pos, buy_pos, side='left')
+    pos = start.copy()
+
+    # skip the largest blocks whose maximum does not beat the threshold
+    levels = block_maxima(sell_values)
+    for level in reversed(range(len(levels))):
+        width = 2 ** level
+        fits = pos + width <= m
+        skip = fits & (levels[level][np.where(fits, pos, 0)] <= threshold)
+        pos = np.where(skip, pos + width, pos)
+
+    # nothing beats a NaN threshold
+    return start, np.where((pos < m) & ~np.isnan(threshold), pos, -1)
+
+
 class TheDecider(object):
     """Decides Buy/Sell"""
     def __init__(self, d, calc):
@@ -24,6 +64,22 @@ class TheDecider(object):
         vol_buy = 10 - self.calc.rsi[clean_buy] // 10
         return vol_buy
 
+    def pair_events(self, buy_idx, sell_idx, values):
+        """
+        Index based pairing of buys to the sells on or after them, see first_beat.
+
+        Negative event indices count from the end of the dataset as usual.
+        Returns buy_idx, sell positions, first candidate and first beat.
+        """
+        n = len(self.dataset.index)
+        buy_idx = np.asarray(buy_idx, dtype=int)
+        sell_pos = np.asarray(sell_idx, dtype=int) % max(n, 1)
+        buy_pos = buy_idx % max(n, 1)
+
+        start, beat = first_beat(sell_pos, np.asarray(values, dtype=float)[sell_pos],
+                                 buy_pos, np.asarray(values, dtype=float)[buy_pos])
+        return buy_idx, sell_pos, start, beat
+
     def compute_possible_buysell(self):
         """
         buy_idx, sell_idx = [], []
@@ -108,69 +164,49 @@ class NumpyDecider(TheDecider):
         logging.info('RSI changed direction %d times' %
                      self.calc.rsi_prime_zeros.shape)
 
-        dir_change_dates = self.dataset.index[self.calc.rsi_prime_zeros]
-
-        buy_idx, sell_idx = [], []
-        for cross_index in self.calc.rsi_ma_cross:
-            cross_date = self.dataset.index[cross_index]
+        # the first direction change strictly after each cross, -1 when there is none
+        zeros = np.asarray(self.calc.rsi_prime_zeros, dtype=int)
+        crosses = np.asarray(self.calc.rsi_ma_cross, dtype=int)
+        dir_change = np.append(zeros, -1)[np.searchsorted(zeros, crosses, side='right')]
 
-            # get the next time the RSI changes directions
-            try:
-                dir_change_index = np.where(cross_date < dir_change_dates)[0][0]
-                dir_change_index = self.calc.rsi_prime_zeros[dir_change_index]
-            except IndexError:
-                dir_change_index = -1
+        # we know this direction change is important
+        # but should we buy or sell?
+        # if the ma is ^ shaped, buy
+        # if the ma is u shaped, sell
+        rsi = np.asarray(self.calc.rsi)
+        is_buy = rsi[dir_change] < rsi[crosses]
 
-            logging.info('%s %s %s' % (self.dataset.index[dir_change_index],
-                                       'buy' if self.calc.rsi[dir_change_index] < self.calc.rsi[cross_index] else 'sell',
-                                       self.dataset.open[dir_change_index]))
-
-            # we know this direction change is important
-            # but should we buy or sell?
-            # if the ma is ^ shaped, buy
-            # if the ma is u shaped, sell
-            if self.calc.rsi[dir_change_index] < self.calc.rsi[cross_index]:
-                buy_idx.append(dir_change_index)
-            else:
-                sell_idx.append(dir_change_index)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            for index, buy in zip(dir_change, is_buy):
+                logging.debug('%s %s %s' % (self.dataset.index[index], 'buy' if buy else 'sell',
+                                            self.dataset.open.values[index]))
 
-        return buy_idx, sell_idx
+        return dir_change[is_buy], dir_change[~is_buy]
 
     def filter_buysell(self, buy_idx, sell_idx):
-        """Sell when price is higher than when I bought"""
-        sell_dates = self.dataset.index[sell_idx]
-        clean_buy, clean_sell = [], []
+        """
+        Sell when price is higher than when I bought
 
-        # walk through the buy-events
-        for buy, buy_date in zip(buy_idx, self.dataset.index[buy_idx]):
-            price_at_buy = self.dataset.adj_close[buy]
+        Buys without a beating sell take the first sell after them, buys
+        without any later sell are place-held by a noop sell on the buy.
+        """
+        buy_idx, sell_pos, start, beat = self.pair_events(buy_idx, sell_idx, self.dataset.adj_close.values)
 
-            mask = np.where(sell_dates >= buy_date)
-            future_sell_dates = sell_dates[mask]
+        # no beating sell means argmax of all False, the first future sell
+        has_future = start < len(sell_pos)
+        chosen = np.where(beat >= 0, beat, start)[has_future]
 
-            # TODO can this argmax be done with a reverse-lookup?
-            future_sell_index = [np.argmax(self.dataset.index == future_sell_date)
-                                 for future_sell_date in future_sell_dates]
+        clean_sell = buy_idx.copy()
+        clean_sell[has_future] = sell_pos[chosen]
 
-            try:
-                # sometimes future index is empty
-                future_sell_price = self.dataset.adj_close[future_sell_index]
-
-                first_beat = np.argmax((future_sell_price > price_at_buy).values)
-                matching_sell = future_sell_index[first_beat]
-            except (ValueError, IndexError):
-                matching_sell = buy
-                logging.info(
-                    'Place-holding {} buy ({:0.2f}) with a noop sell'.format(
-                        buy_date, price_at_buy
-                    )
+        for buy in buy_idx[~has_future]:
+            logging.info(
+                'Place-holding {} buy ({:0.2f}) with a noop sell'.format(
+                    self.dataset.index[buy], self.dataset.adj_close.values[buy]
                 )
+            )
 
-            # look for a matching next sell-event
-            clean_buy.append(buy)
-            clean_sell.append(matching_sell)
-
-        return clean_buy, clean_sell
+        return buy_idx, clean_sell
 
 
 class MACDDecider(TheDecider):
@@ -243,44 +279,8 @@ class DirectionChangeDecider(TheDecider):
         return buy_idx, sell_idx
 
     def filter_buysell(self, buy_idx, sell_idx):
-        # buy_idx = filter(lambda x: x < 0, buy_idx)
-        # sell_idx = filter(lambda x: x < 0, sell_idx)
-
-        sell_dates = self.dataset.index[sell_idx]
-        clean_buy, clean_sell = [], []
-
-        # walk through the buy-events
-        for buy, buy_date in zip(buy_idx, self.dataset.index[buy_idx]):
-            rsi_at_buy = self.calc.rsi[buy]
-
-            mask = np.where(sell_dates >= buy_date)
-            future_sell_dates = sell_dates[mask]
-
-            future_sell_index = [np.argmax(self.dataset.index == future_sell_date)
-                                 for future_sell_date in future_sell_dates]
-            future_sell_rsi = self.calc.rsi[future_sell_index]
-
-            try:
-                first_beat = np.where(future_sell_rsi > rsi_at_buy)[0][0]  # argmax returns 0 even on failure
-                matching_sell = future_sell_index[first_beat]
-            except (ValueError, IndexError):
-                matching_sell = None
-
-            """
-            # look for a matching next sell-event
-            matching_sell = None
-            for sell_date in future_sell_dates:
-                sell = np.argmax(self.dataset.index == sell_date)
-                rsi_at_sell = self.rsi[sell]
-
-                if rsi_at_sell > rsi_at_buy:
-                    matching_sell = sell
-                    break  # don't get greedy
-            """
-
-            if matching_sell is not None:
-                clean_buy.append(buy)
-                clean_sell.append(matching_sell)
-
-        return clean_buy, clean_sell
+        """Sell on the first later direction change with a higher RSI, drop buys without one"""
+        buy_idx, sell_pos, _, beat = self.pair_events(buy_idx, sell_idx, self.calc.rsi)
 
+        matched = beat >= 0
+        return buy_idx[matched], sell_pos[beat[matched]]
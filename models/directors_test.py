@@ -0,0 +1,161 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from models.directors import NumpyDecider, DirectionChangeDecider, first_beat
+
+
+def numpy_pairs_loop(dataset, buy_idx, sell_idx):
+    """NumpyDecider.filter_buysell before the index based pairing"""
+    sell_dates = dataset.index[sell_idx]
+    clean_buy, clean_sell = [], []
+
+    for buy, buy_date in zip(buy_idx, dataset.index[buy_idx]):
+        price_at_buy = dataset.adj_close.iloc[buy]
+        future_sell_dates = sell_dates[np.where(sell_dates >= buy_date)]
+        future_sell_index = [np.argmax(dataset.index == d) for d in future_sell_dates]
+
+        try:
+            future_sell_price = dataset.adj_close.iloc[future_sell_index]
+            matching_sell = future_sell_index[np.argmax((future_sell_price > price_at_buy).values)]
+        except (ValueError, IndexError):
+            matching_sell = buy
+
+        clean_buy.append(buy)
+        clean_sell.append(matching_sell)
+
+    return clean_buy, clean_sell
+
+
+def direction_pairs_loop(dataset, rsi, buy_idx, sell_idx):
+    """DirectionChangeDecider.filter_buysell before the index based pairing"""
+    sell_dates = dataset.index[sell_idx]
+    clean_buy, clean_sell = [], []
+
+    for buy, buy_date in zip(buy_idx, dataset.index[buy_idx]):
+        future_sell_dates = sell_dates[np.where(sell_dates >= buy_date)]
+        future_sell_index = [np.argmax(dataset.index == d) for d in future_sell_dates]
+
+        try:
+            first = np.where(rsi[future_sell_index] > rsi[buy])[0][0]
+        except IndexError:
+            continue
+
+        clean_buy.append(buy)
+        clean_sell.append(future_sell_index[first])
+
+    return clean_buy, clean_sell
+
+
+def possible_buysell_loop(dataset, calc):
+    """NumpyDecider.compute_possible_buysell before the searchsorted mapping"""
+    dir_change_dates = dataset.index[calc.rsi_prime_zeros]
+
+    buy_idx, sell_idx = [], []
+    for cross_index in calc.rsi_ma_cross:
+        try:
+            dir_change_index = calc.rsi_prime_zeros[np.where(dataset.index[cross_index] < dir_change_dates)[0][0]]
+        except IndexError:
+            dir_change_index = -1
+
+        if calc.rsi[dir_change_index] < calc.rsi[cross_index]:
+            buy_idx.append(dir_change_index)
+        else:
+            sell_idx.append(dir_change_index)
+
+    return buy_idx, sell_idx
+
+
+class Calc(object):
+    def __init__(self, rsi, rsi_ma_cross=None, rsi_prime_zeros=None):
+        self.rsi = rsi
+        self.rsi_ma_cross = rsi_ma_cross
+        self.rsi_prime_zeros = rsi_prime_zeros
+
+
+def random_events(n, rng):
+    dataset = pd.DataFrame({'adj_close': 100. + np.cumsum(rng.normal(0, 1, n))},
+                           index=pd.bdate_range('2016-06-01', periods=n))
+    events = np.sort(rng.choice(n, size=rng.randint(1, n // 2), replace=False))
+    is_buy = rng.rand(len(events)) < .5
+    return dataset, list(events[is_buy]), list(events[~is_buy])
+
+
+class TestPairing(unittest.TestCase):
+
+    def test_first_beat(self):
+        sell_pos = np.array([1, 3, 5, 7])
+        values = np.array([4., 2., np.nan, 9.])
+        start, beat = first_beat(sell_pos, values, np.array([0, 2, 4, 8]), np.array([3., 3., 3., 0.]))
+
+        np.testing.assert_array_equal(start, [0, 1, 2, 4])
+        np.testing.assert_array_equal(beat, [0, 3, 3, -1])
+
+        _, beat = first_beat(sell_pos, values, np.array([0, 2]), np.array([np.nan, 3.]))
+        np.testing.assert_array_equal(beat, [-1, 3])
+
+    def test_numpy_decider_matches_loop(self):
+        rng = np.random.RandomState(1)
+        for _ in range(50):
+            dataset, buys, sells = random_events(rng.randint(5, 300), rng)
+            # compute_possible_buysell uses -1 when no direction change follows
+            if rng.rand() < .3:
+                sells.append(-1)
+
+            expected = numpy_pairs_loop(dataset, buys, sells)
+            clean_buy, clean_sell = NumpyDecider(dataset, Calc(None)).filter_buysell(buys, sells)
+            self.assertEqual(expected, (list(clean_buy), list(clean_sell)))
+
+    def test_direction_decider_matches_loop(self):
+        rng = np.random.RandomState(2)
+        for _ in range(50):
+            dataset, buys, sells = random_events(rng.randint(5, 300), rng)
+            rsi = rng.uniform(0, 100, len(dataset))
+
+            expected = direction_pairs_loop(dataset, rsi, buys, sells)
+            clean_buy, clean_sell = DirectionChangeDecider(dataset, Calc(rsi)).filter_buysell(buys, sells)
+            self.assertEqual(expected, (list(clean_buy), list(clean_sell)))
+
+    def test_nan_thresholds_match_loop(self):
+        rng = np.random.RandomState(5)
+        for _ in range(50):
+            dataset, buys, sells = random_events(rng.randint(5, 300), rng)
+            rsi = rng.uniform(0, 100, len(dataset))
+            rsi[rng.rand(len(rsi)) < .2] = np.nan
+            dataset.loc[rng.rand(len(dataset)) < .2, 'adj_close'] = np.nan
+
+            expected = direction_pairs_loop(dataset, rsi, buys, sells)
+            clean_buy, clean_sell = DirectionChangeDecider(dataset, Calc(rsi)).filter_buysell(buys, sells)
+            self.assertEqual(expected, (list(clean_buy), list(clean_sell)))
+
+            expected = numpy_pairs_loop(dataset, buys, sells)
+            clean_buy, clean_sell = NumpyDecider(dataset, Calc(None)).filter_buysell(buys, sells)
+            self.assertEqual(expected, (list(clean_buy), list(clean_sell)))
+
+        dataset = pd.DataFrame({'adj_close': np.ones(3)}, index=pd.bdate_range('2016-06-01', periods=3))
+        clean = DirectionChangeDecider(dataset, Calc(np.array([np.nan, 1., 2.]))).filter_buysell([0], [2])
+        self.assertEqual((list(clean[0]), list(clean[1])), ([], []))
+
+    def test_possible_buysell_matches_loop(self):
+        rng = np.random.RandomState(4)
+        for _ in range(50):
+            dataset, crosses, zeros = random_events(rng.randint(5, 300), rng)
+            dataset['open'] = dataset.adj_close
+            calc = Calc(rng.uniform(0, 100, len(dataset)), np.array(crosses, dtype=int), np.array(zeros, dtype=int))
+
+            buy_idx, sell_idx = NumpyDecider(dataset, calc).compute_possible_buysell()
+            self.assertEqual(buy_idx.dtype.kind, 'i')
+            self.assertEqual(possible_buysell_loop(dataset, calc), (list(buy_idx), list(sell_idx)))
+
+    def test_no_events(self):
+        dataset, _, _ = random_events(10, np.random.RandomState(3))
+        clean_buy, clean_sell = NumpyDecider(dataset, Calc(None)).filter_buysell([], [])
+        self.assertEqual((len(clean_buy), len(clean_sell)), (0, 0))
+
+        clean_buy, clean_sell = NumpyDecider(dataset, Calc(None)).filter_buysell([4], [])
+        self.assertEqual((list(clean_buy), list(clean_sell)), ([4], [4]))
+
+
+if __name__ == '__main__':
+    unittest.main()
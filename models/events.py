@@ -0,0 +1,210 @@
+"""
+events : typed indicator events kept in one structured array per series
+
+EventDetector finds the same events as RSIMixin and MACDMixin do over a
+whole series, but one bar at a time, and appends them to an EventLog.
+"""
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+RECORD = np.dtype([('date', '<i8'), ('index', '<i8'), ('kind', 'u1'), ('value', '<f8')])
+
+
+class Event(object):
+    TYPES = {
+        'RSI Direction Change': 0,
+        'RSI MA Cross': 1,
+        'MACD Zero Cross': 2,
+        'MACD Signal Cross': 3,
+    }
+    NAMES = {kind: name for name, kind in TYPES.items()}
+
+    RSI_direction_change = 'RSI Direction Change'
+    RSI_MA_cross = 'RSI MA Cross'
+    MACD_zero_cross = 'MACD Zero Cross'
+    MACD_signal_cross = 'MACD Signal Cross'
+
+    def __init__(self, event_type, date, value=None):
+        self.event_name = event_type
+        self.event_type = self.TYPES[event_type]
+        self.date = date
+        self.value = value
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(cls.NAMES[int(record['kind'])], pd.Timestamp(int(record['date'])), float(record['value']))
+
+    def flatten_span(self, span):
+        pass
+
+    def __repr__(self):
+        return '{} on {}'.format(self.event_name, self.date)
+
+
+DIRECTION_CHANGE, MA_CROSS, ZERO_CROSS, SIGNAL_CROSS = range(4)
+
+# bars after the event before it is certain, direction changes compare the
+# central gradients on both sides of the bar
+LAG = {DIRECTION_CHANGE: 2, MA_CROSS: 1, ZERO_CROSS: 1, SIGNAL_CROSS: 1}
+LAGS = np.array([LAG[kind] for kind in range(len(LAG))])
+
+
+class EventLog(object):
+    """Append-only event records in one structured array, grown by doubling"""
+
+    def __init__(self, records=None):
+        records = np.array([] if records is None else records, dtype=RECORD)
+        self.data = np.empty(max(16, len(records)), dtype=RECORD)
+        self.data[:len(records)] = records
+        self.size = len(records)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def records(self):
+        return self.data[:self.size]
+
+    def _reserve(self, n):
+        if self.size + n > len(self.data):
+            data = np.empty(max(2 * len(self.data), self.size + n), dtype=RECORD)
+            data[:self.size] = self.records
+            self.data = data
+
+    def append(self, date, index, kind, value):
+        self._reserve(1)
+        self.data[self.size] = (date, index, kind, value)
+        self.size += 1
+
+    def extend(self, records):
+        self._reserve(len(records))
+        self.data[self.size:self.size + len(records)] = records
+        self.size += len(records)
+
+    def recent(self, k, kind=None, since=None):
+        """
+        the last k records of kind (one or a sequence of kinds) dated on or
+        after since (int64 nanoseconds), oldest first, only looks at the tail
+        of the log
+        """
+        if kind is None and since is None:
+            return self.records[max(self.size - k, 0):]
+
+        kinds = None if kind is None else np.atleast_1d(kind)
+        found, count, end, block = [], 0, self.size, max(4 * k, 64)
+        while end > 0 and count < k:
+            chunk = self.data[max(end - block, 0):end]
+            keep = np.ones(len(chunk), dtype=bool) if kinds is None else np.isin(chunk['kind'], kinds)
+            if since is not None:
+                keep &= chunk['date'] >= since
+            found.insert(0, chunk[keep])
+            count += len(found[0])
+
+            # records are in bar order, nothing before this chunk is recent enough
+            if since is not None and chunk['date'].max() < since:
+                break
+            end, block = end - len(chunk), 2 * block
+        return np.concatenate(found)[-k:] if found else self.records[:0]
+
+    def events(self, k, kind=None, since=None):
+        return [Event.from_record(r) for r in self.recent(k, kind, since)]
+
+
+def event_log(dates, found):
+    """
+    log of the events found over a whole series in the order the detector
+    would emit them, found maps kind -> (event indices, indicator values)
+    """
+    dates = np.asarray(pd.DatetimeIndex(dates).asi8)
+    parts = []
+    for kind, (index, values) in sorted(found.items()):
+        index = np.asarray(index, dtype=int)
+        part = np.empty(len(index), dtype=RECORD)
+        part['date'], part['index'], part['kind'] = dates[index], index, kind
+        part['value'] = np.asarray(values, dtype=float)[index]
+        parts.append(part)
+
+    records = np.concatenate(parts) if parts else np.empty(0, dtype=RECORD)
+    order = np.lexsort((records['kind'], records['index'] + LAGS[records['kind']]))
+    return EventLog(records[order])
+
+
+def sign_changes(x):
+    """indices i where the sign of x[i + 1] differs from x[i], as the mixins find them"""
+    return np.where(np.diff(np.sign(x)))[0]
+
+
+class EventDetector(object):
+    """
+    Direction changes and RSI/MA crosses of RSIMixin, zero and signal crosses
+    of MACDMixin, detected bar by bar.  Events are logged once they can no
+    longer change, a cross one bar and a direction change two bars after it.
+    """
+
+    def __init__(self, log=None):
+        self.log = log if log is not None else EventLog()
+        self.index = -1
+        self.bars = deque(maxlen=3)  # (date, rsi, macd) of the latest bars
+        self.signs = {}  # kind -> sign the last bar left behind
+
+    def reset(self, dates, rsi, rsi_ma, macd, signal):
+        """detect over full arrays of the indicators at once"""
+        n = len(rsi)
+        gradient = np.gradient(rsi) if n > 1 else np.zeros(n)
+        lines = {MA_CROSS: rsi - rsi_ma, ZERO_CROSS: macd, SIGNAL_CROSS: macd - signal}
+
+        found = {DIRECTION_CHANGE: (sign_changes(gradient), rsi)}
+        for kind, line in lines.items():
+            found[kind] = (sign_changes(line), macd if kind != MA_CROSS else rsi)
+
+        # drop what the next bars could still change, those come through update
+        found = {kind: (index[index + LAG[kind] < n], values) for kind, (index, values) in found.items()}
+        self.log = event_log(dates, found)
+
+        asi8 = pd.DatetimeIndex(dates).asi8
+        self.index = n - 1
+        self.bars = deque(((int(asi8[i]), float(rsi[i]), float(macd[i])) for i in range(max(n - 3, 0), n)), maxlen=3)
+        self.signs = {kind: float(np.sign(line[-1])) for kind, line in lines.items() if n}
+        if n > 1:
+            self.signs[DIRECTION_CHANGE] = float(np.sign(gradient[-2]))
+
+    def update(self, date, rsi, rsi_ma, macd, signal):
+        """take in the next bar, returns the number of events logged"""
+        before = len(self.log)
+        self.index += 1
+        self.bars.append((pd.Timestamp(date).value, rsi, macd))
+
+        if len(self.bars) == 2 and self.index == 1:
+            # np.gradient is one-sided on the first bar
+            self.signs[DIRECTION_CHANGE] = float(np.sign(self.bars[1][1] - self.bars[0][1]))
+        elif len(self.bars) == 3:
+            self._check(DIRECTION_CHANGE, (self.bars[2][1] - self.bars[0][1]) / 2., 2, 1)
+
+        for kind, line, field in ((MA_CROSS, rsi - rsi_ma, 1), (ZERO_CROSS, macd, 2), (SIGNAL_CROSS, macd - signal, 2)):
+            self._check(kind, line, 1, field)
+
+        return len(self.log) - before
+
+    def _check(self, kind, line, lag, field):
+        """log an event lag bars back when the sign of line differs from the last one"""
+        sign, previous = float(np.sign(line)), self.signs.get(kind)
+        self.signs[kind] = sign
+
+        # nan never equals itself, just as np.diff of a nan sign is an event
+        if previous is not None and sign != previous:
+            bar = self.bars[-1 - lag]
+            self.log.append(bar[0], self.index - lag, kind, bar[field])
+
+    def state(self):
+        return {
+            'index': self.index,
+            'bars': list(self.bars),
+            'signs': {str(kind): sign for kind, sign in self.signs.items()},
+        }
+
+    def set_state(self, state):
+        self.index = state['index']
+        self.bars = deque((tuple(bar) for bar in state['bars']), maxlen=3)
+        self.signs = {int(kind): sign for kind, sign in state['signs'].items()}
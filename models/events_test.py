@@ -0,0 +1,143 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from models.events import EventLog, EventDetector, Event, LAG, LAGS, RECORD, \
+    DIRECTION_CHANGE, MA_CROSS, ZERO_CROSS, SIGNAL_CROSS
+from models.indicators import RSIMixin, MACDMixin
+from models.security import Security
+from models.span import Span
+from models.store import ColumnStore
+from util.indicators_test import random_walk
+
+
+def indicators(prices):
+    rsi, rsi_ma10, _ = RSIMixin.compute(prices)
+    _, _, macd, signal = MACDMixin.compute(prices)
+    return rsi, rsi_ma10, macd, signal
+
+
+class TestEventDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.prices = random_walk(400)
+        self.dates = pd.bdate_range('2016-06-01', periods=len(self.prices))
+        self.values = indicators(self.prices)
+
+    def test_bar_by_bar_matches_batch(self):
+        expected = EventDetector()
+        expected.reset(self.dates, *self.values)
+
+        detector = EventDetector()
+        detector.reset(self.dates[:100], *(v[:100] for v in self.values))
+        for i in range(100, len(self.prices)):
+            detector.update(self.dates[i], *(v[i] for v in self.values))
+
+        np.testing.assert_array_equal(detector.log.records, expected.log.records)
+        self.assertEqual(detector.signs, expected.signs)
+
+    def test_from_first_bar(self):
+        expected = EventDetector()
+        expected.reset(self.dates, *self.values)
+
+        detector = EventDetector()
+        for i in range(len(self.prices)):
+            detector.update(self.dates[i], *(v[i] for v in self.values))
+
+        np.testing.assert_array_equal(detector.log.records, expected.log.records)
+
+    def test_matches_mixins(self):
+        detector = EventDetector()
+        detector.reset(self.dates, *self.values)
+        records = detector.log.records
+
+        calc = RSIMixin(pd.DataFrame({'adj_close': self.prices}, index=self.dates))
+        for kind, found in ((DIRECTION_CHANGE, calc.rsi_prime_zeros), (MA_CROSS, calc.rsi_ma_cross)):
+            confirmed = found[found + LAG[kind] < len(self.prices)]
+            np.testing.assert_array_equal(np.sort(records['index'][records['kind'] == kind]), confirmed)
+
+
+class TestEventLog(unittest.TestCase):
+
+    def test_recent(self):
+        log = EventLog()
+        for i in range(100):
+            log.append(pd.Timestamp('2017-01-01').value + i, i, i % 4, float(i))
+
+        self.assertEqual(len(log), 100)
+        self.assertEqual(log.recent(3)['index'].tolist(), [97, 98, 99])
+        self.assertEqual(log.recent(3, kind=1)['index'].tolist(), [89, 93, 97])
+        self.assertEqual(log.recent(3, kind=(0, 1))['index'].tolist(), [93, 96, 97])
+        since = pd.Timestamp('2017-01-01').value + 95
+        self.assertEqual(log.recent(10, kind=(0, 1), since=since)['index'].tolist(), [96, 97])
+        self.assertEqual(log.recent(0).dtype, RECORD)
+
+        event = log.events(1)[0]
+        self.assertEqual(event.event_name, 'MACD Signal Cross')
+        self.assertEqual(event.value, 99.)
+
+    def test_span_events(self):
+        dates = pd.bdate_range('2016-06-01', periods=200)
+        calc = RSIMixin(pd.DataFrame({'adj_close': random_walk(200)}, index=dates))
+        events = calc.events().events(5)
+
+        self.assertEqual(len(events), 5)
+        self.assertTrue(all(isinstance(e, Event) for e in events))
+
+
+class TestSpanEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir, Security.store_dir = Security.store_dir, tempfile.mkdtemp()
+        prices = random_walk(400)
+        self.security = Security('SYN', sync=False)
+        self.security.daily = pd.DataFrame({'open': prices, 'high': prices, 'low': prices, 'close': prices,
+                                            'volume': 1., 'adj_close': prices},
+                                           index=pd.bdate_range('2016-06-01', periods=len(prices)))
+
+    def tearDown(self):
+        shutil.rmtree(Security.store_dir)
+        Security.store_dir = self.store_dir
+
+    def test_daily_from_security_log(self):
+        for klass, kinds in (('rsi', (DIRECTION_CHANGE, MA_CROSS)), ('macd', (ZERO_CROSS, SIGNAL_CROSS))):
+            with self.security.span('daily', klass) as so:
+                self.assertIs(so.event_log, self.security.events.log)
+
+                # the confirmed events calc finds over the same bars
+                records = so.calc.events().records
+                n = len(so.dataset)
+                confirmed = records[(records['index'] + LAGS[records['kind']] < n) & np.isin(records['kind'], kinds)]
+                self.assertEqual(so.recent_events(5), [str(Event.from_record(r)) for r in confirmed[-5:]])
+
+        with self.security.span('daily', 'rsi', start_date='2017-09-01') as so:
+            events = so.event_log.events(50, Span.EVENT_KINDS, pd.Timestamp('2017-09-01').value)
+            self.assertEqual(so.recent_events(50), [str(e) for e in events])
+            self.assertTrue(all(e.date >= pd.Timestamp('2017-09-01') for e in events))
+
+    def test_read_only(self):
+        self.security.save()
+        loaded = Security.load('SYN', sync=False)
+        with loaded.span('daily', 'rsi') as so:
+            self.assertEqual(len(so.recent_events(5)), 5)
+        self.assertFalse(loaded.dirty)
+
+        with mock.patch.object(ColumnStore, 'write', side_effect=AssertionError('rewritten')), \
+                mock.patch.object(ColumnStore, 'append', side_effect=AssertionError('appended')):
+            loaded.save()
+
+        # the next load finds the events instead of building them again
+        self.assertIn('events', Security.load('SYN', sync=False).__dict__)
+
+    def test_other_spans_from_calc(self):
+        with self.security.span('weekly', 'rsi') as so:
+            self.assertIsNot(so.event_log, self.security.__dict__.get('events'))
+            self.assertEqual(so.recent_events(3), [str(e) for e in so.calc.events().events(3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
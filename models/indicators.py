@@ -1,36 +1,26 @@
 import logging
 import numpy as np
+import pandas as pd
+from models.events import Event, event_log, DIRECTION_CHANGE, MA_CROSS, ZERO_CROSS, SIGNAL_CROSS
 from util.indicators import relative_strength, moving_average, moving_average_convergence, bbands
 
 
-class Event(object):
-    TYPES = {
-        'RSI Direction Change': 0,
-        'RSI MA Cross': 1
-    }
-    RSI_direction_change = 'RSI Direction Change'
-    RSI_MA_cross = 'RSI MA Cross'
-
-    def __init__(self, event_type, date):
-        self.event_name = event_type
-        self.event_type = self.TYPES[event_type]
-        self.date = date
-
-    def flatten_span(self, span):
-        pass
-
-    def __repr__(self):
-        return '{} on {}'.format(self.event_name, self.date)
+def cached(cache, version, name, fn, *args):
+    """fn(*args) through the security's IndicatorCache when the span passed one"""
+    if cache is None:
+        return fn(*args)
+    return cache.compute((name, version), fn, *args)
 
 
 class RSIMixin(object):
-    def __init__(self, d):
+    def __init__(self, d, cache=None, version=None, n=7, ma=10):
         self.dataset = d
+        self.params = {'n': n, 'ma': ma}
         prices = self.dataset.adj_close.values
-        rsi = relative_strength(prices, 7)
 
-        rsi_ma10 = moving_average(rsi, 10, type='exponential')
-        rsi_prime = np.gradient(rsi)
+        # the RSI is shared by every ma length through the cache
+        rsi, rsi_prime = cached(cache, version, ('rsi', n), self.compute_rsi, prices, n)
+        rsi_ma10, = cached(cache, version, ('rsi_ma', n, ma), self.compute_ma, rsi, ma)
 
         self.rsi_prime_zeros = np.where(np.diff(np.sign(rsi_prime)))[0]
         self.rsi_ma_cross = np.where(np.diff(np.sign(rsi - rsi_ma10)))[0]
@@ -41,54 +31,93 @@ class RSIMixin(object):
 
         self.rsi = rsi
 
-    def events(self):
-        r = []
-        for d in self.dataset.date[rsi_prime_zeros]:
-            r.append(Event(Event.RSI_direction_change, d))
+    @staticmethod
+    def compute_rsi(prices, n=7):
+        rsi = relative_strength(prices, n)
+        return rsi, np.gradient(rsi)
+
+    @staticmethod
+    def compute_ma(rsi, ma=10):
+        return moving_average(rsi, ma, type='exponential'),
 
-        for d in self.dataset.date[rsi_ma_cross]:
-            r.append(Event(Event.RSI_MA_cross, d))
+    @classmethod
+    def compute(cls, prices, n=7, ma=10):
+        """RSI(n), its EMA(ma) and its gradient for an array of prices"""
+        rsi, rsi_prime = cls.compute_rsi(prices, n)
+        rsi_ma10, = cls.compute_ma(rsi, ma)
+        return rsi, rsi_ma10, rsi_prime
 
-        return r
+    def events(self):
+        """EventLog of the direction changes and MA crosses found above"""
+        rsi = self.rsi_values[0]
+        return event_log(self.dataset.index, {
+            DIRECTION_CHANGE: (self.rsi_prime_zeros, rsi),
+            MA_CROSS: (self.rsi_ma_cross, rsi),
+        })
 
 
 class MACDMixin(object):
-    def __init__(self, d):
+    def __init__(self, d, cache=None, version=None, slow=26, fast=12, signal=10):
         self.dataset = d
+        self.params = {'slow': slow, 'fast': fast, 'signal': signal}
         prices = self.dataset.adj_close.values
         # prices = self.dataset.close.values
 
-        slow, fast, macd = moving_average_convergence(prices)
-
-        macd_ema10 = moving_average(macd, 10, type='exponential')
+        # each EMA length is computed once whichever side of the MACD it is on
+        emaslow, = cached(cache, version, ('ema', slow), self.compute_ema, prices, slow)
+        emafast, = cached(cache, version, ('ema', fast), self.compute_ema, prices, fast)
+        macd = emafast - emaslow
+        macd_ema10, = cached(cache, version, ('macd_signal', slow, fast, signal), self.compute_ema, macd, signal)
 
         self.macd_sign = np.sign(macd)
         self.macd_zero_cross = np.where(np.diff(self.macd_sign))[0]
         self.macd_signal_cross = np.where(np.diff(np.sign(macd - macd_ema10)))[0]
 
-        self.macd_values = (slow, fast, macd)
+        self.macd_values = (emaslow, emafast, macd)
         self.macd = macd
         self.macd_signal = macd_ema10
 
         logging.info('Computed MACD {}, {}, {}'.format(*map(len, self.macd_values)))
 
     def events(self):
-        raise NotImplemented()
+        """EventLog of the zero and signal line crosses found above"""
+        return event_log(self.dataset.index, {
+            ZERO_CROSS: (self.macd_zero_cross, self.macd),
+            SIGNAL_CROSS: (self.macd_signal_cross, self.macd),
+        })
+
+    @staticmethod
+    def compute_ema(x, n):
+        return moving_average(x, n, type='exponential'),
+
+    @staticmethod
+    def compute(prices, slow=26, fast=12, signal=10):
+        """slow EMA, fast EMA, MACD and its EMA signal line"""
+        emaslow, emafast, macd = moving_average_convergence(prices, slow, fast)
+        macd_ema10 = moving_average(macd, signal, type='exponential')
+        return emaslow, emafast, macd, macd_ema10
 
 
 class BBandsMixin(object):
-    def __init__(self, d):
+    def __init__(self, d, cache=None, version=None, length=21, numsd=2):
         self.dataset = d
+        self.params = {'length': length, 'numsd': numsd}
         prices = self.dataset.adj_close
 
-        avgBB, upperBB, lowerBB = bbands(prices, 21, 2)
-        self.pct_b = (prices - lowerBB) / (upperBB - lowerBB)
+        avgBB, upperBB, lowerBB, self.pct_b = cached(cache, version, ('bbands', length, numsd),
+                                                     self.compute, prices, length, numsd)
         self.support = self.pct_b * 100
 
         self.bbands_values = (avgBB, upperBB, lowerBB)
 
         logging.info('Computed Bollinger Bands {}, {}, {}'.format(*map(len, self.bbands_values)))
 
+    @staticmethod
+    def compute(prices, length=21, numsd=2):
+        """bands numsd deviations wide around the length period average, and %b"""
+        avgBB, upperBB, lowerBB = bbands(prices, length, numsd)
+        return avgBB, upperBB, lowerBB, (prices - lowerBB) / (upperBB - lowerBB)
+
     def events(self):
         raise NotImplemented()
 
@@ -108,3 +137,102 @@ class TheEvaluator(object):
         sumval = np.sum(val)
         self.performance = 100. * sumval / self.dataset.open[-1]
         logging.info('With %d trades we stand to make %f (%f%%).' % (len(val_buy), sumval, self.performance))
+
+
+class BatchEvaluator(object):
+    """
+    TheEvaluator for many tickers in one pass, without a pandas object per ticker.
+
+    prices is a (tickers, bars) matrix of opens, row i holds lengths[i] bars
+    and is nan padded after them.  Trades are ragged, the ones of ticker i
+    are buy/sell/vol[offsets[i]:offsets[i + 1]] with bar positions in row i,
+    negative positions count back from that ticker's last bar.
+    """
+
+    def __init__(self, tickers, prices, lengths, offsets, buy, sell, vol):
+        self.tickers = list(tickers)
+        self.prices = np.asarray(prices, dtype=float)
+        self.lengths = np.asarray(lengths, dtype=int)
+        self.offsets = np.asarray(offsets, dtype=int)
+        self.buy = np.asarray(buy, dtype=int)
+        self.sell = np.asarray(sell, dtype=int)
+        self.vol = np.asarray(vol, dtype=float)
+
+        self.val = self.purse = None
+
+    @classmethod
+    def from_orders(cls, tickers, opens, orders):
+        """stack per ticker open prices and compute_orders (buy, sell, vol_buy) triples"""
+        lengths = [len(o) for o in opens]
+        prices = np.full((len(opens), max(lengths or [0])), np.nan)
+        for i, o in enumerate(opens):
+            prices[i, :len(o)] = o
+
+        offsets = np.concatenate(([0], np.cumsum([len(buy) for buy, _, _ in orders])))
+        flat = [np.concatenate([np.asarray(o[k], dtype=dtype) for o in orders] or [np.empty(0, dtype)])
+                for k, dtype in ((0, int), (1, int), (2, float))]
+        return cls(tickers, prices, lengths, offsets, *flat)
+
+    def trades_of(self, i):
+        """slice of the flat trade arrays (val, purse, buy, ...) that belongs to ticker i"""
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def _restart(self, total, counts):
+        """running total restarted at every ticker"""
+        before = np.concatenate(([0], total))[self.offsets[:-1]]
+        return total - np.repeat(before, counts)
+
+    def evaluate(self):
+        """
+        one row per ticker: pnl, performance (pnl in pct of the last open, as
+        TheEvaluator), trades, hit_rate, max_drawdown of the purse in pct of
+        the last open, and exposure, the fraction of bars with a position open.
+        val and purse (the cumulative pnl plot_purse draws) are kept per trade.
+        """
+        n_tickers, n_bars = self.prices.shape
+        counts = np.diff(self.offsets)
+        row = np.repeat(np.arange(n_tickers), counts)
+
+        buy = np.where(self.buy < 0, self.buy + self.lengths[row], self.buy)
+        sell = np.where(self.sell < 0, self.sell + self.lengths[row], self.sell)
+
+        self.val = val = self.vol * (self.prices[row, sell] - self.prices[row, buy])
+        last = self.prices[np.arange(n_tickers), np.maximum(self.lengths - 1, 0)]
+
+        # cumulative sum restarted at every ticker, a nan (a missing open) is
+        # summed as 0 so it cannot leak into the next tickers, then put back
+        # on the rest of its own ticker's purse as a plain cumsum would
+        missing = np.isnan(val)
+        self.purse = purse = self._restart(np.cumsum(np.where(missing, 0., val)), counts)
+        purse[self._restart(np.cumsum(missing), counts) > 0] = np.nan
+
+        pnl = np.bincount(row, val, minlength=n_tickers)
+        hits = np.bincount(row, val > 0, minlength=n_tickers)
+
+        # running peak restarted at every ticker, lifting each ticker's curve
+        # above the previous ones keeps a single accumulate, fmax skips the
+        # nans so they cannot wipe out the peaks of the next tickers
+        drawdown = np.zeros(n_tickers)
+        if not np.isnan(purse).all():
+            lift = row * (np.nanmax(purse) - min(np.nanmin(purse), 0.) + 1.)
+            peak = np.maximum(np.fmax.accumulate(purse + lift) - lift, 0.)
+            np.fmax.at(drawdown, row, peak - purse)
+
+        # +1 on the buy bar, -1 on the sell bar, positions are open while the sum is positive
+        held = np.zeros((n_tickers, n_bars + 1))
+        np.add.at(held, (row, buy), 1)
+        np.add.at(held, (row, sell), -1)
+        in_market = (np.cumsum(held, axis=1)[:, :n_bars] > 0).sum(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            table = pd.DataFrame({
+                'pnl': pnl,
+                'performance': 100. * pnl / last,
+                'trades': counts,
+                'hit_rate': hits / counts,
+                'max_drawdown': 100. * drawdown / last,
+                'exposure': in_market / self.lengths,
+            }, index=pd.Index(self.tickers, name='ticker'))
+
+        logging.info('Evaluated {} trades over {} tickers'.format(len(val), n_tickers))
+        return table
@@ -0,0 +1,85 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from models.indicators import TheEvaluator, BatchEvaluator
+
+
+def random_orders(n_bars, rng):
+    n = rng.randint(0, 20)
+    buy = np.sort(rng.randint(0, n_bars, n))
+    sell = np.minimum(buy + rng.randint(0, 30, n), n_bars - 1)
+    sell[rng.rand(n) < .1] = -1  # placeholder sells on the last bar
+    return buy, sell, rng.randint(1, 10, n).astype(float)
+
+
+class TestBatchEvaluator(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.tickers = ['T{}'.format(i) for i in range(12)]
+        self.datasets = []
+        self.orders = []
+        for _ in self.tickers:
+            n_bars = rng.randint(50, 300)
+            opens = 100. + np.cumsum(rng.normal(0, 1, n_bars))
+            self.datasets.append(pd.DataFrame({'open': opens}, index=pd.bdate_range('2016-06-01', periods=n_bars)))
+            self.orders.append(random_orders(n_bars, rng))
+
+        self.batch = BatchEvaluator.from_orders(self.tickers, [d.open.values for d in self.datasets], self.orders)
+        self.table = self.batch.evaluate()
+
+    def test_matches_evaluator(self):
+        for i, (dataset, orders) in enumerate(zip(self.datasets, self.orders)):
+            single = TheEvaluator(dataset)
+            single.evaluate(orders)
+
+            trades = self.batch.trades_of(i)
+            np.testing.assert_allclose(self.batch.val[trades], single.val)
+            np.testing.assert_allclose(self.batch.purse[trades], np.cumsum(single.val))
+            self.assertAlmostEqual(self.table.performance.iloc[i], single.performance)
+
+    def test_drawdown_and_exposure(self):
+        for i, (dataset, (buy, sell, _)) in enumerate(zip(self.datasets, self.orders)):
+            purse = self.batch.purse[self.batch.trades_of(i)]
+            peak, drawdown = 0., 0.
+            for p in purse:
+                peak = max(peak, p)
+                drawdown = max(drawdown, peak - p)
+
+            n_bars = len(dataset)
+            held = np.zeros(n_bars, dtype=bool)
+            for b, s in zip(buy, sell % n_bars):
+                held[b:s] = True
+
+            self.assertAlmostEqual(self.table.max_drawdown.iloc[i], 100. * drawdown / dataset.open.iloc[-1])
+            self.assertAlmostEqual(self.table.exposure.iloc[i], held.mean())
+
+    def test_missing_open(self):
+        # a nan open under the first trade of the first ticker with trades
+        first = next(i for i, (buy, _, _) in enumerate(self.orders) if len(buy))
+        opens = [d.open.values.copy() for d in self.datasets]
+        opens[first][self.orders[first][0][0]] = np.nan
+
+        batch = BatchEvaluator.from_orders(self.tickers, opens, self.orders)
+        table = batch.evaluate()
+        self.assertTrue(np.isnan(table.pnl.iloc[first]))
+        self.assertTrue(np.isnan(batch.purse[batch.trades_of(first)]).all())
+        self.assertEqual(table.max_drawdown.iloc[first], 0.)
+
+        for i in range(first + 1, len(self.tickers)):
+            trades = batch.trades_of(i)
+            np.testing.assert_allclose(batch.purse[trades], self.batch.purse[trades])
+            self.assertAlmostEqual(table.max_drawdown.iloc[i], self.table.max_drawdown.iloc[i])
+            self.assertAlmostEqual(table.performance.iloc[i], self.table.performance.iloc[i])
+
+    def test_no_trades(self):
+        batch = BatchEvaluator.from_orders(['A'], [np.arange(1., 5.)], [([], [], [])])
+        table = batch.evaluate()
+        self.assertEqual(table.trades.iloc[0], 0)
+        self.assertEqual(table.pnl.iloc[0], 0.)
+
+
+if __name__ == '__main__':
+    unittest.main()
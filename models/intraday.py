@@ -0,0 +1,125 @@
+"""
+intraday : hourly bars of a crypto security
+
+Intraday keeps the bars of the histohour endpoint in a ChunkedStore next
+to the daily store of the security.  A read loads the chunks from its
+start_date on and fetches the hours completed since the last stored bar,
+so an hourly span over a year of BTC is one month directory per month and
+a few kilobytes per column.  The hour still in progress is never stored.
+"""
+import datetime
+import logging
+
+import pandas as pd
+
+from models.store import ChunkedStore, COLUMNS
+from util import BulkLoader
+from util.atomic import locked
+
+HOUR = datetime.timedelta(hours=1)
+
+
+class Intraday(object):
+    # history fetched the first time a ticker is synced
+    DAYS = 365
+
+    def __init__(self, ticker, path):
+        self.ticker = ticker
+        self.store = ChunkedStore(path)
+        self.bars = None
+
+        # bars holds every bar from start on, None when it holds all of them
+        self.start = None
+        self.enddate = None
+        self.stored_last = None
+        self.dirty = False
+
+    @property
+    def last(self):
+        """timestamp of the last bar, None before there is any"""
+        return self.bars.index[-1] if self.bars is not None and len(self.bars) else None
+
+    @staticmethod
+    def is_stale(last, now):
+        """a bar is complete an hour after its timestamp, the next one an hour later"""
+        return last is None or now - last >= 2 * HOUR
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.utcnow()
+
+    def _load(self, start):
+        """read the stored bars from start on, keep the ones fetched since that are not saved yet"""
+        try:
+            with locked(self.store.path, shared=True):
+                header = self.store.read_header()
+                stored = self.store.read(start, header)
+            self.enddate = header['enddate']
+            self.stored_last = self.store.last_bar(header)
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            logging.info('No hourly bars stored for {} ({})'.format(self.ticker, e))
+            stored = pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([], name='date'), dtype=float)
+
+        if self.bars is not None and len(stored):
+            stored = pd.concat((stored, self.bars[self.bars.index > stored.index[-1]]))
+        elif self.bars is not None:
+            stored = self.bars
+        self.bars, self.start = stored, start
+
+    def read(self, start_date=None, sync=True, loader=None):
+        """the bars on or after start_date, only the chunks from start_date on are read"""
+        start = pd.Timestamp(start_date) if start_date is not None else None
+        if self.bars is None or (self.start is not None and (start is None or start < self.start)):
+            self._load(start)
+
+        if sync:
+            self.sync(loader)
+        return self.bars if start is None else self.bars.iloc[self.bars.index.searchsorted(start):]
+
+    def sync(self, loader=None, now=None):
+        """fetch the hours completed since the last bar, the last DAYS of them for a new ticker"""
+        now = now or self._now()
+        last = self.last if self.last is not None else self.stored_last
+        if not self.is_stale(last, now):
+            return
+
+        logging.info('Hourly sync necessary for {}, retrieving missing bars'.format(self.ticker))
+        start = last if last is not None else now - datetime.timedelta(days=self.DAYS)
+        delta = (loader or BulkLoader(workers=1)).fetch_crypto_hours(self.ticker, start, now)
+        self.append(delta[delta.index <= now - HOUR])
+        self.enddate = now
+
+    def append(self, delta):
+        """add the bars of delta after the last one, returns the rows kept"""
+        delta = delta.sort_index()
+        delta = delta[~delta.index.duplicated(keep='last')].reindex(columns=COLUMNS).astype(float)
+        if self.last is not None:
+            delta = delta[delta.index > self.last]
+
+        if len(delta):
+            self.bars = delta if self.bars is None or not len(self.bars) else pd.concat((self.bars, delta))
+            self.dirty = True
+        return delta
+
+    def save(self):
+        """append the bars the store does not have yet"""
+        if not self.dirty:
+            return
+
+        meta = {'ticker': self.ticker, 'is_crypto': True, 'enddate': self.enddate or self._now()}
+        with locked(self.store.path):
+            try:
+                header = self.store.read_header()
+                last = self.store.last_bar(header)
+                meta['enddate'] = max(meta['enddate'], header['enddate'])
+            except (IOError, KeyError, TypeError):
+                last = None
+
+            if last is None:
+                header = self.store.write(self.bars, **meta)
+            else:
+                header = self.store.append(self.bars[self.bars.index > last], **meta)
+            self.stored_last = self.store.last_bar(header)
+
+        logging.info('Saved {} hourly bars of {}'.format(header['rows'], self.ticker))
+        self.dirty = False
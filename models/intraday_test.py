@@ -0,0 +1,94 @@
+import datetime
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from models.intraday import Intraday
+from models.security import Security
+
+NOW = datetime.datetime(2017, 3, 1, 12, 30)
+FIRST = pd.Timestamp(NOW - datetime.timedelta(days=Intraday.DAYS)).ceil('H')
+LAST = pd.Timestamp('2017-03-01 11:00')  # 12:00 is not over yet
+
+
+class HourlyLoader(object):
+    """histohour of a random walk, including the hour still in progress"""
+
+    def __init__(self):
+        index = pd.date_range(NOW - datetime.timedelta(days=400), NOW, freq='H').floor('H')
+        prices = 1000. + np.cumsum(np.random.RandomState(0).normal(0, 1, len(index)))
+        self.bars = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices,
+                                  'volumefrom': 1., 'volume': 2., 'adj_close': prices}, index=index)
+        self.requests = []
+
+    def fetch_crypto_hours(self, identifier, startdate, enddate):
+        self.requests.append((identifier, startdate, enddate))
+        return self.bars[startdate:enddate]
+
+
+class TestIntraday(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir, Security.store_dir = Security.store_dir, tempfile.mkdtemp()
+        self.loader = HourlyLoader()
+        self.path = Security._filename('BTC', True, intraday=True)
+
+    def tearDown(self):
+        shutil.rmtree(Security.store_dir)
+        Security.store_dir = self.store_dir
+
+    def test_sync(self):
+        intraday = Intraday('BTC', self.path)
+        intraday.sync(self.loader, now=NOW)
+
+        self.assertEqual(self.loader.requests[0][1], NOW - datetime.timedelta(days=Intraday.DAYS))
+        self.assertEqual(intraday.bars.index[0], FIRST)
+        self.assertEqual(intraday.last, LAST)
+        self.assertEqual(list(intraday.bars.columns), ['open', 'high', 'low', 'close', 'volume', 'adj_close'])
+
+        intraday.sync(self.loader, now=NOW + datetime.timedelta(minutes=20))
+        self.assertEqual(len(self.loader.requests), 1)
+
+    def test_save_and_window(self):
+        intraday = Intraday('BTC', self.path)
+        intraday.sync(self.loader, now=NOW - datetime.timedelta(hours=5))
+        intraday.save()
+
+        later = Intraday('BTC', self.path)
+        with mock.patch.object(Intraday, '_now', return_value=NOW):
+            window = later.read('2017-02-20', loader=self.loader)
+        self.assertEqual(self.loader.requests[-1][1], pd.Timestamp('2017-03-01 06:00'))
+        self.assertEqual(window.index[0], pd.Timestamp('2017-02-20'))
+        self.assertEqual(window.index[-1], LAST)
+        np.testing.assert_allclose(window.close.values, self.loader.bars.close['2017-02-20':'2017-03-01 11:00'],
+                                   rtol=1e-6)
+
+        later.save()
+        with mock.patch.object(Intraday, '_now', return_value=NOW):
+            self.assertEqual(Security.cached_version('BTC', True, 'hourly'), LAST)
+            self.assertIsNone(Security.cached_version('BTC', False, 'hourly'))
+
+        everything = Intraday('BTC', self.path).read(sync=False)
+        self.assertTrue(everything.index.equals(pd.date_range(intraday.bars.index[0], LAST, freq='H')))
+        self.assertEqual(everything.index[-1], window.index[-1])
+
+    def test_spans(self):
+        security = Security('BTC', crypto=True, sync=False)
+        with mock.patch('models.intraday.BulkLoader', return_value=self.loader), \
+                mock.patch.object(Intraday, '_now', return_value=NOW):
+            with security.span('4h', 'rsi', start_date='2017-02-01') as so:
+                self.assertEqual(so.dataset.index[0], pd.Timestamp('2017-02-01'))
+                self.assertEqual(so.dataset.index[-1], pd.Timestamp('2017-03-01 08:00'))
+                self.assertEqual(so.dataset.volume.iloc[0], 8.)
+
+            self.assertEqual(len(security.hourly), len(pd.date_range(FIRST, LAST, freq='H')))
+
+        self.assertRaises(ValueError, getattr, Security('GLD', sync=False), 'hourly')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+"""
+market_structure : graph, clusters and 2D layout of a universe of securities
+
+The pipeline of plot_stock_market.py as a reusable model:
+
+    correlation     of the standardized daily variations, Ledoit-Wolf
+                    shrunk unless a correlation or covariance is given
+    precision       sparse inverse covariance at a fixed alpha instead of
+                    a cross-validated one, solved by ADMM so the next day
+                    starts from the last fit of the same tickers
+    clusters        affinity propagation on the covariance
+    layout          dense LocallyLinearEmbedding for small universes, a
+                    sparse spectral embedding of the partial correlation
+                    graph for large ones
+
+Fits are cached as npz under directory by tickers, date and parameters,
+so refreshing the graph of a day that was already fit is a file read.
+Only the last keep days of a universe are kept next to its warm start.
+"""
+import glob
+import hashlib
+import logging
+import os
+
+import numpy as np
+from scipy import sparse
+from sklearn import cluster, manifold
+from sklearn.covariance import ledoit_wolf
+
+from util import cwd
+from util.atomic import atomic_write
+
+MARKETDIR = os.path.join(cwd, 'Output', 'market_structure')
+
+
+def standardize(X):
+    """(samples, tickers) with every column scaled to unit variance"""
+    X = np.asarray(X, dtype=float)
+    std = X.std(axis=0)
+    std[std == 0] = 1.
+    return X / std
+
+
+def shrunk_correlation(X):
+    """Ledoit-Wolf shrunk covariance of the standardized X and the shrinkage used"""
+    return ledoit_wolf(standardize(X))
+
+
+def sparse_precision(cov, alpha, init=None, rho=1., tol=1e-4, max_iter=1000):
+    """
+    graphical lasso of cov at alpha, the off-diagonal l1 penalty of
+    sklearn.covariance.graphical_lasso, by ADMM (Boyd et al. 2011, 6.5).
+    Returns the covariance, the sparse precision and the (precision, dual)
+    state that warm starts the next call as init.  Unlike the coordinate
+    descent of scikit-learn a nearby start saves most of the iterations.
+    """
+    n = len(cov)
+    precision, dual = init if init is not None else (np.eye(n), np.zeros((n, n)))
+    diagonal = np.eye(n, dtype=bool)
+
+    for iteration in range(max_iter):
+        w, Q = np.linalg.eigh(rho * (precision - dual) - cov)
+        xi = (w + np.sqrt(w ** 2 + 4 * rho)) / (2 * rho)
+        x = (Q * xi).dot(Q.T)
+
+        previous, a = precision, x + dual
+        precision = np.sign(a) * np.maximum(np.abs(a) - alpha / rho, 0.)
+        precision[diagonal] = a[diagonal]
+        dual = a - precision
+
+        primal, change = np.linalg.norm(x - precision), rho * np.linalg.norm(precision - previous)
+        if primal < tol * n and change < tol * n:
+            break
+
+    logging.debug('Graphical lasso of {} tickers in {} iterations'.format(n, iteration + 1))
+    covariance = (Q / xi).dot(Q.T)
+    return covariance, precision, (precision, dual)
+
+
+def partial_correlations(precision):
+    d = 1 / np.sqrt(np.diag(precision))
+    return precision * d * d[:, np.newaxis]
+
+
+def graph_edges(partial, threshold=0.02):
+    """(start, end, value) arrays of the partial correlations above threshold, each pair once"""
+    start, end = np.where(np.abs(np.triu(partial, k=1)) > threshold)
+    return start, end, partial[start, end]
+
+
+def embed(X, partial, threshold=0.02, dense_limit=100, n_neighbors=6):
+    """
+    (2, tickers) positions.  Up to dense_limit tickers this is the dense,
+    reproducible LocallyLinearEmbedding of the variations X, above it a
+    spectral embedding of the sparse |partial correlation| graph, which
+    never forms a dense tickers x tickers eigenproblem.
+    """
+    n = partial.shape[0]
+    if n <= dense_limit:
+        model = manifold.LocallyLinearEmbedding(n_components=2, eigen_solver='dense',
+                                                n_neighbors=min(n_neighbors, n - 1))
+        return model.fit_transform(np.asarray(X).T).T
+
+    start, end, values = graph_edges(partial, threshold)
+    weights = np.abs(values)
+    affinity = sparse.coo_matrix((np.concatenate((weights, weights)),
+                                  (np.concatenate((start, end)), np.concatenate((end, start)))),
+                                 shape=(n, n)).tocsr()
+    # a faint ring keeps isolated tickers from splitting the graph into components
+    ring = np.arange(n)
+    affinity = affinity + sparse.coo_matrix((np.full(n, 1e-3), (ring, np.roll(ring, 1))), shape=(n, n))
+    affinity = affinity + affinity.T
+
+    model = manifold.SpectralEmbedding(n_components=2, affinity='precomputed', random_state=0)
+    return model.fit_transform(affinity).T
+
+
+class Structure(object):
+    """one fit: covariance, precision, cluster labels and layout of tickers, dual warm starts the next fit"""
+    ARRAYS = ('covariance', 'precision', 'dual', 'labels', 'embedding')
+
+    def __init__(self, tickers, covariance, precision, dual, labels, embedding):
+        self.tickers = list(tickers)
+        self.covariance = covariance
+        self.precision = precision
+        self.dual = dual
+        self.labels = labels
+        self.embedding = embedding
+
+    @property
+    def partial_correlations(self):
+        return partial_correlations(self.precision)
+
+    def edges(self, threshold=0.02):
+        return graph_edges(self.partial_correlations, threshold)
+
+    def clusters(self):
+        """{label: [ticker, ...]}"""
+        found = {}
+        for ticker, label in zip(self.tickers, self.labels):
+            found.setdefault(int(label), []).append(ticker)
+        return found
+
+    def save(self, filename):
+        with atomic_write(filename, 'wb') as f:
+            np.savez(f, tickers=np.array(self.tickers), **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as saved:
+            return cls(saved['tickers'].tolist(), *(saved[name] for name in cls.ARRAYS))
+
+
+class MarketStructure(object):
+
+    def __init__(self, alpha=0.01, threshold=0.02, dense_limit=100, directory=MARKETDIR, keep=7):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.dense_limit = dense_limit
+        self.directory = directory
+        self.keep = keep
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _key(self, tickers, date=None):
+        ident = '|'.join(map(str, (sorted(tickers), self.alpha, self.threshold, self.dense_limit)))
+        key = hashlib.sha1(ident.encode('utf-8')).hexdigest()[:16]
+        return key if date is None else '{}-{}'.format(key, str(date)[:10])
+
+    def _cached(self, key):
+        if not self.directory:
+            return None
+        try:
+            return Structure.load(os.path.join(self.directory, key + '.npz'))
+        except (IOError, ValueError, KeyError):
+            return None
+
+    def _prune(self, tickers):
+        """remove the daily fits of tickers but the last keep, dates sort by name"""
+        dated = sorted(glob.glob(os.path.join(self.directory, self._key(tickers) + '-*.npz')))
+        for filename in dated[:-self.keep]:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def fit(self, tickers, X, cov=None, date=None):
+        """
+        structure of the (samples, tickers) variations X, cov replaces the
+        shrunk correlation.  With a date the fit is cached for that day and
+        kept as the warm start for the next one.
+        """
+        if date is not None:
+            cached = self._cached(self._key(tickers, date))
+            if cached is not None and cached.tickers == list(tickers):
+                logging.info('Market structure of {} tickers on {} from cache'.format(len(tickers), date))
+                return cached
+
+        X = standardize(X)
+        if cov is None:
+            cov, shrinkage = shrunk_correlation(X)
+            logging.info('Shrunk the correlation of {} tickers by {:.3f}'.format(len(tickers), shrinkage))
+
+        previous = self._cached(self._key(tickers))
+        init = None
+        if previous is not None and previous.tickers == list(tickers):
+            init = previous.precision, previous.dual
+        covariance, precision, (_, dual) = sparse_precision(cov, self.alpha, init)
+
+        _, labels = cluster.affinity_propagation(covariance, random_state=0)
+        embedding = embed(X, partial_correlations(precision), self.threshold, self.dense_limit)
+
+        structure = Structure(tickers, covariance, precision, dual, labels, embedding)
+        if self.directory and date is not None:
+            structure.save(os.path.join(self.directory, self._key(tickers, date) + '.npz'))
+            structure.save(os.path.join(self.directory, self._key(tickers) + '.npz'))
+            self._prune(tickers)
+        return structure
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from sklearn.covariance import graphical_lasso
+
+from models import market_structure
+from models.market_structure import MarketStructure, sparse_precision, shrunk_correlation
+
+
+def factor_returns(n_days=300, groups=(6, 6), seed=0):
+    """variations of tickers driven by one common factor per group"""
+    rng = np.random.RandomState(seed)
+    columns, tickers = [], []
+    for g, size in enumerate(groups):
+        factor = rng.normal(0, 1, n_days)
+        for k in range(size):
+            columns.append(factor + rng.normal(0, .5, n_days))
+            tickers.append('G{}T{}'.format(g, k))
+    return tickers, np.array(columns).T
+
+
+class TestMarketStructure(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.tickers, self.X = factor_returns()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_clusters_follow_factors(self):
+        structure = MarketStructure(alpha=.05, directory=None).fit(self.tickers, self.X)
+        clusters = sorted(sorted(c) for c in structure.clusters().values())
+        self.assertEqual(clusters, [self.tickers[:6], self.tickers[6:]])
+
+        start, end, values = structure.edges()
+        self.assertTrue(len(values))
+        self.assertEqual(structure.embedding.shape, (2, 12))
+
+    def test_sparse_layout(self):
+        tickers, X = factor_returns(groups=(20, 20))
+        structure = MarketStructure(alpha=.05, dense_limit=10, directory=None).fit(tickers, X)
+        self.assertEqual(structure.embedding.shape, (2, 40))
+        self.assertTrue(np.isfinite(structure.embedding).all())
+
+    def test_matches_sklearn(self):
+        cov, _ = shrunk_correlation(self.X)
+        expected_cov, expected = graphical_lasso(cov, .05, tol=1e-8, max_iter=1000)
+
+        covariance, precision, _ = sparse_precision(cov, .05, tol=1e-7)
+        np.testing.assert_allclose(precision, expected, atol=1e-4)
+        np.testing.assert_allclose(covariance, expected_cov, atol=1e-4)
+        np.testing.assert_array_equal(precision == 0, np.abs(expected) < 1e-8)
+
+    def test_warm_start(self):
+        cov, _ = shrunk_correlation(self.X)
+        cold = sparse_precision(cov, .05, tol=1e-7)[1]
+
+        moved, _ = shrunk_correlation(self.X[1:])
+        warm = sparse_precision(cov, .05, init=sparse_precision(moved, .05)[2], tol=1e-7)[1]
+        np.testing.assert_allclose(warm, cold, atol=1e-4)
+
+    def test_cached_by_date(self):
+        model = MarketStructure(alpha=.05, directory=self.path)
+        first = model.fit(self.tickers, self.X, date='2017-01-03')
+
+        with mock.patch.object(market_structure, 'sparse_precision', side_effect=AssertionError('refit')):
+            again = MarketStructure(alpha=.05, directory=self.path).fit(self.tickers, self.X, date='2017-01-03')
+        np.testing.assert_array_equal(again.precision, first.precision)
+        self.assertEqual(again.tickers, self.tickers)
+
+        # the next day starts from the last fit of the same tickers
+        with mock.patch.object(market_structure, 'sparse_precision', wraps=market_structure.sparse_precision) as fit:
+            model.fit(self.tickers, self.X[1:], date='2017-01-04')
+        np.testing.assert_array_equal(fit.call_args[0][2][1], first.dual)
+
+    def test_prunes_old_days(self):
+        model = MarketStructure(alpha=.05, directory=self.path, keep=2)
+        for day in ('2017-01-03', '2017-01-04', '2017-01-05'):
+            model.fit(self.tickers, self.X, date=day)
+
+        key = model._key(self.tickers)
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         [key + '-2017-01-04.npz', key + '-2017-01-05.npz', key + '.npz'])
+
+
+if __name__ == '__main__':
+    unittest.main()
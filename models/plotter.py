@@ -1,20 +1,36 @@
+"""
+plotter : the evaluate chart of a span, price with the strategy orders,
+its indicator and the purse
+
+Charts are drawn on ChartTemplates, Figures of the object oriented Agg
+API that never touch pyplot.  A template holds the axes, grid, date axis
+and indicator guides; a render adds the data artists, saves the figure
+and removes them again, so every thread reuses one template per chart
+kind and size.  Collections and nan separated lines stand in for an artist
+per bar or trade.
+"""
 import datetime
+import io
 import logging
 import os
-import io
-import numpy as np
+import threading
+from contextlib import contextmanager
 from math import log10, fabs
 
+import numpy as np
 import matplotlib.cm as cm
+import matplotlib.colors as mcolors
 import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
+from matplotlib import rcParams
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.transforms import Bbox
 # from pytrends.request import TrendReq
 
-from pandas.plotting import register_matplotlib_converters
-register_matplotlib_converters()
-
 from util import cwd
+from util.atomic import atomic_write
 from util.indicators import moving_average, fibonacci_retracement, interesting_fib
 
 MARKER_SIZE = 30
@@ -23,6 +39,85 @@ fillcolor = 'darkgoldenrod'
 textsize = 9
 IMGDIR = os.path.join(cwd, 'Output/')
 
+UP, DOWN = mcolors.to_rgba('#69B85D'), mcolors.to_rgba('#B84D4F')
+
+
+def marker_size(s):
+    """Line2D markersize of a scatter size s"""
+    return np.sqrt(s)
+
+
+class ChartTemplate(object):
+    """
+    figure and axes of the evaluate chart with everything that does not
+    depend on the data, decorate(ax1, ax2, ax3) adds the guides of an
+    indicator.  size is web (svg/png responses) or file (saved pngs).
+    """
+    RECTS = ([0.1, 0.6, 0.8, 0.3], [0.1, 0.2, 0.8, 0.4], [0.1, 0.1, 0.8, 0.1])
+    SIZES = {'web': (7, 6.5), 'file': (18.5, 10.5)}
+    AXESCOLOR = '#f6f6f6'
+
+    _local = threading.local()
+
+    def __init__(self, decorate, size='web', figure=None):
+        if figure is None:
+            figure = Figure(figsize=self.SIZES[size], dpi=100, facecolor='white')
+            FigureCanvasAgg(figure)
+        self.figure = figure
+
+        ax1 = figure.add_axes(self.RECTS[0], facecolor=self.AXESCOLOR)
+        ax2 = figure.add_axes(self.RECTS[1], facecolor=self.AXESCOLOR, sharex=ax1)
+        ax3 = figure.add_axes(self.RECTS[2], facecolor=self.AXESCOLOR, sharex=ax1)
+        self.axes = ax1, ax2, ax3
+
+        for ax in self.axes:
+            ax.grid(True, color='0.75', linestyle='-', linewidth=0.5)
+            ax.xaxis_date()
+            ax.fmt_xdata = mdates.DateFormatter('%Y-%m-%d')
+
+        # only the bottom axes gets date labels, rotated
+        ax1.tick_params(axis='x', labelbottom=False)
+        ax2.tick_params(axis='x', labelbottom=False)
+        ax3.tick_params(axis='x', labelrotation=30)
+        for label in ax3.get_xticklabels():
+            label.set_horizontalalignment('right')
+
+        ax2.yaxis.set_major_locator(mticker.MaxNLocator(5, prune='both'))
+        ax3.yaxis.set_major_locator(mticker.MaxNLocator(5, prune='both'))
+
+        decorate(ax1, ax2, ax3)
+        self.static = {ax: set(ax.get_children()) for ax in self.axes}
+        self.autoscale = {ax: (ax.get_autoscalex_on(), ax.get_autoscaley_on()) for ax in self.axes}
+
+    @classmethod
+    def get(cls, decorate, size='web'):
+        """the template of the calling thread for decorate and size, built on first use"""
+        templates = cls._local.__dict__.setdefault('templates', {})
+        if (decorate, size) not in templates:
+            templates[decorate, size] = cls(decorate, size)
+        return templates[decorate, size]
+
+    @contextmanager
+    def drawing(self):
+        """the axes to draw one chart on, the data artists are removed afterwards"""
+        for ax in self.axes:
+            ax.dataLim.set_points(Bbox.null().get_points())
+            ax.ignore_existing_data_limits = True
+            scalex, scaley = self.autoscale[ax]
+            ax.set_autoscalex_on(scalex)
+            ax.set_autoscaley_on(scaley)
+        try:
+            yield self.axes
+        finally:
+            for ax in self.axes:
+                for artist in ax.get_children():
+                    if artist not in self.static[ax]:
+                        artist.remove()
+
+    def savefig(self, output, fmt):
+        # no creation date, the same chart renders to the same bytes
+        self.figure.savefig(output, format=fmt, metadata={'svg': {'Date': None}}.get(fmt))
+
 
 class PlotBaseMixin(object):
     def __init__(self, d, ticker, calc, decide, eval, cadence='daily'):
@@ -33,44 +128,59 @@ class PlotBaseMixin(object):
         self.eval = eval
         self.cadence = cadence
 
-    def plot_data(self, save=False, web=False):
-        r = self.dataset
-        ticker = self.ticker
-
-        plt.rc('axes', grid=True)
-        plt.rc('grid', color='0.75', linestyle='-', linewidth=0.5)
-        # plt.rc('marker', edgecolor='black')
-        plt.rc('lines', linewidth=1)
-
-        left, width = 0.1, 0.8
-        rect1 = [left, 0.6, width, 0.3]
-        rect2 = [left, 0.2, width, 0.4]
-        rect3 = [left, 0.1, width, 0.1]
+    @staticmethod
+    def decorate(ax1, ax2, ax3):
+        """the parts of the chart every dataset shares"""
+        ax3.axhline(linewidth=1)
+        ax3.text(0.025, 0.95, 'Purse (pct of today value)', va='top',
+                 transform=ax3.transAxes, fontsize=textsize)
 
-        fig = plt.figure(facecolor='white')
-        axescolor = '#f6f6f6'  # the axes background color
+    def plot_data(self, save=False, web=False, fmt='svg'):
+        """
+        save writes a png to IMGDIR, web returns the chart as a StringIO of
+        svg or a BytesIO of png (fmt), otherwise it is shown with pyplot
+        """
+        if save or web:
+            template = ChartTemplate.get(self.decorate, 'file' if save else 'web')
+        else:
+            import matplotlib.pyplot as plt
+            template = ChartTemplate(self.decorate, 'file', figure=plt.figure(facecolor='white'))
+
+        with template.drawing() as (ax1, ax2, ax3):
+            clean_buy, clean_sell = self.draw(ax1, ax2, ax3)
+
+            if save:
+                self.save(template, clean_buy, clean_sell)
+            elif web:
+                output = io.BytesIO() if fmt == 'png' else io.StringIO()
+                template.savefig(output, fmt)
+                return output
+            else:
+                plt.show(block=True)
+                plt.close(template.figure)
 
-        ax1 = fig.add_axes(rect1, facecolor=axescolor)  # left, bottom, width, height
-        ax2 = fig.add_axes(rect2, facecolor=axescolor, sharex=ax1)
-        ax3 = fig.add_axes(rect3, facecolor=axescolor, sharex=ax1)
+    def draw(self, ax1, ax2, ax3):
+        """add the data artists of the chart, returns the clean buy and sell bars"""
+        r = self.dataset
+        date = mdates.date2num(r.index.values)
 
-        ax1.set_title('%s %s' % (ticker, self.cadence))
+        ax1.set_title('%s %s' % (self.ticker, self.cadence))
 
         # plot the relative strength indicator
-        self.plot_indicator(ax1, ax2, r)
+        self.plot_indicator(ax1, ax2, r, date)
 
         # plot the buysell points
         clean_buy, clean_sell, _ = self.decide.clean_buysellvol
-        self.plot_buysell(ax2, clean_buy, clean_sell, r)
+        self.plot_buysell(ax2, clean_buy, clean_sell, r, date)
 
         # plot the price and volume data
         prices = r.adj_close.values
-        self.plot_price(ax2, r)
-        self.plot_price_ma(ax2, r.index, prices)
+        self.plot_price(ax2, r, date)
+        self.plot_price_ma(ax2, date, prices)
 
-        self.plot_retracement(ax2, r.index, prices)
+        self.plot_retracement(ax2, date, prices)
 
-        last = r.tail(1)
+        last = r.iloc[-1]
         s = '%s O:%1.2f H:%1.2f L:%1.2f C:%1.2f, V:%1.1fM Chg:%+1.2f' % (
             datetime.date.today().strftime('%d-%b-%Y'),
             last.open, last.high,
@@ -79,81 +189,56 @@ class PlotBaseMixin(object):
             last.close - last.open)
         ax2.text(0.3, 0.9, s, transform=ax2.transAxes, fontsize=textsize)
 
-        self.plot_purse(ax3, r, clean_sell)
-
-        # turn off upper axis tick labels, rotate the lower ones, etc
-        for ax in ax1, ax2, ax3:
-            if ax != ax3:
-                for label in ax.get_xticklabels():
-                    label.set_visible(False)
-            else:
-                for label in ax.get_xticklabels():
-                    label.set_rotation(30)
-                    label.set_horizontalalignment('right')
-
-            ax.fmt_xdata = mdates.DateFormatter('%Y-%m-%d')
-
-        class MyLocator(mticker.MaxNLocator):
-            def __init__(self, *args, **kwargs):
-                mticker.MaxNLocator.__init__(self, *args, **kwargs)
-
-            def __call__(self, *args, **kwargs):
-                return mticker.MaxNLocator.__call__(self, *args, **kwargs)
-
-        ax2.yaxis.set_major_locator(MyLocator(5, prune='both'))
-        ax3.yaxis.set_major_locator(MyLocator(5, prune='both'))
-
-        # plt.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
-
-        if save:
-            important_events = {
-                'buy': last.index[0] - r.index[clean_buy][-1],
-                'sell': last.index[0] - r.index[clean_sell][-1]
-            }
-            important_events = {k: i.days for k, i in important_events.items()}
-            closest_event = min(important_events, key=important_events.get)
-
-            fig.set_size_inches(18.5, 10.5)
-            filename = IMGDIR + '%s-%s%d-%s%.0f.png' % (
-                ticker, closest_event, important_events[closest_event],
-                '' if self.eval.performance > 0 else 'n',
-                fabs(log10(fabs(self.eval.performance))))
-            fig.savefig(filename, dpi=100)
-            logging.info('Plot saved {}'.format(filename))
-        elif web:
-            # TODO move this to a new plotter class
-            fig.set_dpi(100)
-            fig.set_size_inches(7, 6.5)  # (10.5, 5.5)
-            fig.set_tight_layout(True)
-
-            output = io.StringIO()
-            fig.savefig(output, format='svg')
-            plt.close()
-            return output
-        else:
-            plt.show(block=True)
-        plt.close()
+        self.plot_purse(ax3, r, date, clean_sell)
+        return clean_buy, clean_sell
 
-    def plot_indicator(self, ax1, ax2, r):
+    def save(self, template, clean_buy, clean_sell):
+        r = self.dataset
+        important_events = {
+            'buy': r.index[-1] - r.index[clean_buy][-1],
+            'sell': r.index[-1] - r.index[clean_sell][-1]
+        }
+        important_events = {k: i.days for k, i in important_events.items()}
+        closest_event = min(important_events, key=important_events.get)
+
+        filename = IMGDIR + '%s-%s%d-%s%.0f.png' % (
+            self.ticker, closest_event, important_events[closest_event],
+            '' if self.eval.performance > 0 else 'n',
+            fabs(log10(fabs(self.eval.performance))))
+        # workers of a batch run may plot at the same time, never leave half a png behind
+        with atomic_write(filename, 'wb') as f:
+            template.savefig(f, 'png')
+        logging.info('Plot saved {}'.format(filename))
+
+    def plot_indicator(self, ax1, ax2, r, date):
         raise NotImplemented()
 
-    def plot_purse(self, ax3, r, clean_sell):
+    @staticmethod
+    def bar_width(date, width=4.):
+        """width days, less when the bars are closer than a day"""
+        spacing = np.median(np.diff(date)) if len(date) > 1 else 1.
+        return min(width, width * spacing)
+
+    def plot_purse(self, ax3, r, date, clean_sell):
         val = self.eval.val
         cumval = np.cumsum(val)
-        ax3.plot(r.index[clean_sell], 100. * cumval / r.open[-1],
-                 color='darkslategrey', label='cumulative', lw=2)
-        ax3.bar(r.index[clean_sell], 100. * val / r.open[-1],
-                width=4,  # TODO: width is absolute px size, cannot set as pct of chart
-                color=cm.jet(-np.sign(val)),
-                alpha=0.7, label='instantaneous')
-        ax3.axhline()
-        ax3.text(0.025, 0.95, 'Purse (pct of today value)', va='top',
-                 transform=ax3.transAxes, fontsize=textsize)
+        today = r.open.values[-1]
+        x = date[clean_sell]
+        ax3.plot(x, 100. * cumval / today, color='darkslategrey', label='cumulative', lw=2)
+
+        # one polygon per trade in a single collection instead of a patch each
+        half, height = self.bar_width(date) / 2., 100. * val / today
+        bars = np.stack([np.column_stack((x - half, np.zeros_like(x))), np.column_stack((x - half, height)),
+                         np.column_stack((x + half, height)), np.column_stack((x + half, np.zeros_like(x)))], axis=1)
+        ax3.add_collection(PolyCollection(bars, facecolors=cm.jet(-np.sign(val)), edgecolors='none',
+                                          alpha=0.7, label='instantaneous'))
 
     def plot_retracement(self, ax2, date, prices):
         fib_start, fib_end, fib_retracements = fibonacci_retracement(prices)
+        colors = rcParams['axes.prop_cycle'].by_key()['color']
+        ax2.add_collection(LineCollection([[(date[fib_start], fib), (date[-1], fib)] for fib in fib_retracements],
+                                          colors=colors[:len(fib_retracements)], linewidths=1, alpha=0.6))
         for label, fib in zip(interesting_fib, fib_retracements):
-            ax2.step([date[fib_start], date[-1]], [fib] * 2, alpha=0.6)
             ax2.text(s='%.1f' % label, x=date[-1], y=fib, alpha=0.6,
                      fontsize=8, horizontalalignment='right')
 
@@ -161,10 +246,12 @@ class PlotBaseMixin(object):
         ma20 = moving_average(prices, 20, type='simple')
         ax2.plot(date, ma20, color='blue', lw=2, label='MA (20)')
 
-    def plot_price(self, ax2, r):
-        dx = r.adj_close - r.close
-        high = r.high + dx
-        low = r.low + dx
+    def plot_price(self, ax2, r, date):
+        """every bar as a high-low line with open and close ticks, one nan separated line per color"""
+        dx = r.adj_close.values - r.close.values
+        high = r.high.values + dx
+        low = r.low.values + dx
+        opens, closes = r.open.values, r.close.values
 
         # Find bear/bull days
         prices = r.adj_close.values
@@ -172,31 +259,47 @@ class PlotBaseMixin(object):
         deltas[1:] = np.diff(prices)
         up = deltas > 0
 
-        plotargs = {'color': '#69B85D', 'linewidths': 1.}
-        ax2.vlines(r.index[up], low[up], high[up], label='_nolegend_', **plotargs)
-        ax2.scatter(r.index[up], r.open[up], marker=0, s=20, **plotargs)
-        ax2.scatter(r.index[up], r.close[up], marker=1, s=20, **plotargs)
-        plotargs = {'color': '#B84D4F', 'linewidths': 1.}
-        ax2.vlines(r.index[~up], low[~up], high[~up], label='_nolegend_', **plotargs)
-        ax2.scatter(r.index[~up], r.open[~up], marker=0, s=20, **plotargs)
-        ax2.scatter(r.index[~up], r.close[~up], marker=1, s=20, **plotargs)
+        # the three strokes of a bar, each followed by a nan to lift the pen
+        tick = self.bar_width(date, .4) / 2.
+        gap = np.full_like(date, np.nan)
+        x = np.column_stack((date, date, gap, date - tick, date, gap, date, date + tick, gap))
+        y = np.column_stack((low, high, gap, opens, opens, gap, closes, closes, gap))
 
-    def plot_buysell(self, ax2, clean_buy, clean_sell, r):
-        ax2.scatter(r.index[clean_buy], r.low[clean_buy], c='lightgreen', marker='^', edgecolors='black', s=20)
-        ax2.scatter(r.index[clean_sell], r.high[clean_sell], c='lightpink', marker='v', edgecolors='black', s=20)
+        for bars, color in ((up, UP), (~up, DOWN)):
+            ax2.plot(x[bars].ravel(), y[bars].ravel(), color=color, linewidth=1., label='_nolegend_')
+
+    def plot_buysell(self, ax2, clean_buy, clean_sell, r, date):
+        ax2.plot(date[clean_buy], r.low.values[clean_buy], linestyle='none', marker='^',
+                 markerfacecolor='lightgreen', markeredgecolor='black', markersize=marker_size(20))
+        ax2.plot(date[clean_sell], r.high.values[clean_sell], linestyle='none', marker='v',
+                 markerfacecolor='lightpink', markeredgecolor='black', markersize=marker_size(20))
 
 
 class PlotMixin(PlotBaseMixin):
 
-    def plot_indicator(self, ax1, ax2, r):
+    @staticmethod
+    def decorate(ax1, ax2, ax3):
+        PlotBaseMixin.decorate(ax1, ax2, ax3)
+
+        ax1.text(0.6, 0.9, '>70 = overbought', va='top', transform=ax1.transAxes, fontsize=textsize)
+        ax1.text(0.6, 0.1, '<30 = oversold', transform=ax1.transAxes, fontsize=textsize)
+        ax1.set_ylim(0, 100)
+        ax1.set_yticks([30, 70])
+        ax1.text(0.025, 0.95, 'RSI (7)', va='top', transform=ax1.transAxes, fontsize=textsize)
+
+        ax1.axhline(70, color=fillcolor, linewidth=1)
+        ax1.axhline(50, color=fillcolor, linestyle='--', linewidth=1)
+        ax1.axhline(30, color=fillcolor, linewidth=1)
+
+    def plot_indicator(self, ax1, ax2, r, date):
         rsi, rsi_ma10, rsi_prime = self.calc.rsi_values
         rsi_prime_zeros = self.calc.rsi_prime_zeros
         rsi_ma_cross = self.calc.rsi_ma_cross
 
-        self.plot_gtrends(ax2, r.index)
-        self.plot_rsi(ax1, r.index, rsi)
-        self.plot_rsi_direction_change(ax1, r.index, rsi_prime_zeros, rsi[rsi_prime_zeros])
-        self.plot_rsi_ma(ax1, r.index, rsi, rsi_ma10, rsi_ma_cross)
+        self.plot_gtrends(ax2, date)
+        self.plot_rsi(ax1, date, rsi)
+        self.plot_rsi_direction_change(ax1, date, rsi_prime_zeros, rsi[rsi_prime_zeros])
+        self.plot_rsi_ma(ax1, date, rsi, rsi_ma10, rsi_ma_cross)
 
     def plot_gtrends(self, ax2, date):
         # TODO y-value on the cursor is the twin axis, not the orig
@@ -232,8 +335,8 @@ class PlotMixin(PlotBaseMixin):
 
     def plot_rsi_ma(self, ax1, date, rsi, rsi_ma10, rsi_ma_cross):
         ax1.plot(date, rsi_ma10, color='blue', lw=2)
-        ax1.scatter(date[rsi_ma_cross], rsi[rsi_ma_cross], c='teal', marker='s', s=MARKER_SIZE,
-                    edgecolors='black')
+        ax1.plot(date[rsi_ma_cross], rsi[rsi_ma_cross], linestyle='none', marker='s',
+                 markerfacecolor='teal', markeredgecolor='black', markersize=marker_size(MARKER_SIZE))
 
     def plot_rsi_direction_change(self, ax1, date, rsi_prime_zeros, zeros_y):
         ax1.scatter(
@@ -245,39 +348,35 @@ class PlotMixin(PlotBaseMixin):
         )
 
     def plot_rsi(self, ax1, date, rsi):
-        ax1.text(0.6, 0.9, '>70 = overbought', va='top', transform=ax1.transAxes, fontsize=textsize)
-        ax1.text(0.6, 0.1, '<30 = oversold', transform=ax1.transAxes, fontsize=textsize)
-        ax1.set_ylim(0, 100)
-        ax1.set_yticks([30, 70])
-        ax1.text(0.025, 0.95, 'RSI (7)', va='top', transform=ax1.transAxes, fontsize=textsize)
-
         ax1.plot(date, rsi, color=fillcolor, linewidth=1)
-        ax1.axhline(70, color=fillcolor)
-        ax1.axhline(50, color=fillcolor, linestyle='--')
-        ax1.axhline(30, color=fillcolor)
         ax1.fill_between(date, rsi, 70, where=(rsi >= 70), facecolor=fillcolor, edgecolor=fillcolor)
         ax1.fill_between(date, rsi, 30, where=(rsi <= 30), facecolor=fillcolor, edgecolor=fillcolor)
 
 
 class MACDPlotMixin(PlotBaseMixin):
 
-    def plot_indicator(self, ax1, ax2, r):
+    @staticmethod
+    def decorate(ax1, ax2, ax3):
+        PlotBaseMixin.decorate(ax1, ax2, ax3)
+        ax1.text(0.025, 0.95, 'MACD (26, 12, 10)', va='top', transform=ax1.transAxes, fontsize=textsize)
+
+    def plot_indicator(self, ax1, ax2, r, date):
         slow, fast, macd = self.calc.macd_values
         signal = self.calc.macd_signal
 
         macd_zero_cross = self.calc.macd_zero_cross
         macd_signal_cross = self.calc.macd_signal_cross
 
-        self.plot_macd(ax1, r.index, macd, signal)
-        self.plot_signal_cross(ax1, r.index[macd_signal_cross], macd[macd_signal_cross])
+        self.plot_macd(ax1, date, macd, signal)
+        self.plot_signal_cross(ax1, date[macd_signal_cross], macd[macd_signal_cross])
 
     def plot_macd(self, ax1, date, macd, signal):
-        ax1.bar(date, macd - signal, color='darkslategrey', alpha=0.7, label='instantaneous')
+        # the histogram as one stepped area instead of a bar patch per day
+        ax1.fill_between(date, macd - signal, 0, step='mid', color='darkslategrey', alpha=0.7,
+                         linewidth=0, label='instantaneous')
 
         ax1.plot(date, macd, color=fillcolor, linewidth=1)
         ax1.plot(date, signal, color='blue', linewidth=1)
 
-        ax1.text(0.025, 0.95, 'MACD (26, 12, 10)', va='top', transform=ax1.transAxes, fontsize=textsize)
-
     def plot_signal_cross(self, ax1, date, y_val):
         ax1.scatter(date, y_val, c=y_val / 100., s=MARKER_SIZE, edgecolors='black')
@@ -0,0 +1,52 @@
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from models.cache import PNG_SIGNATURE
+from models.plotter import ChartTemplate, PlotMixin
+from models.security import Security
+
+
+class TestPlotter(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir, Security.store_dir = Security.store_dir, tempfile.mkdtemp()
+        prices = 100. + np.cumsum(np.random.RandomState(0).normal(0, 1, 300))
+        self.security = Security('SYN', sync=False)
+        self.security.daily = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1,
+                                            'close': prices, 'volume': prices, 'adj_close': prices},
+                                           index=pd.bdate_range('2016-01-01', periods=len(prices)))
+
+    def tearDown(self):
+        shutil.rmtree(Security.store_dir)
+        Security.store_dir = self.store_dir
+
+    def render(self, klass='rsi', fmt='png'):
+        with self.security.span('daily', klass) as so:
+            so.eval.evaluate(so.decide.compute_orders())
+            return so.plot.plot_data(web=True, fmt=fmt).getvalue()
+
+    def test_template_is_reused(self):
+        chart = self.render()
+        self.assertTrue(chart.startswith(PNG_SIGNATURE))
+
+        template = ChartTemplate.get(PlotMixin.decorate)
+        children = [len(ax.get_children()) for ax in template.axes]
+        self.render('macd')
+        self.assertEqual(self.render(), chart)
+        self.assertEqual([len(ax.get_children()) for ax in template.axes], children)
+
+        self.assertIn('<svg', self.render(fmt='svg'))
+
+    def test_threads(self):
+        with ThreadPoolExecutor(4) as pool:
+            charts = list(pool.map(lambda _: self.render(), range(8)))
+        self.assertEqual(len(set(charts)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,51 +1,111 @@
 import datetime
+import json
 import logging
 import os
+from collections import defaultdict
 
-from sklearn.externals import joblib
+import numpy as np
 import pandas as pd
 
+from models.cache import IndicatorCache
+from models.events import EventDetector, EventLog
+from models.indicators import RSIMixin, MACDMixin
+from models.intraday import Intraday
 from models.span import Span, MACDSpan, BBandsSpan
+from models.store import ColumnStore, ChunkedStore
 from models.timespan import AddTimeSpan
-from util import load_data, cwd, load_crypto_data
+from util import load_data, cwd, load_crypto_data, BulkLoader
+from util.atomic import atomic_write, locked
+from util.streaming import IndicatorStreams, WilderRSI, MovingAverage, MACD, Bands, Chained
 
 ds_path = 'DataStore'
 store_dir = os.path.join(cwd, ds_path)
+streams_file = 'streams.json'
+events_file = 'events.npz'
 
 
 class Security(AddTimeSpan):
-    class_version = '3.0'
     STARTDATE = datetime.datetime(2016, 6, 1)
+    store_dir = store_dir
 
-    def __init__(self, ticker='GLD', crypto=False):
-        self.version = self.__class__.class_version
-
+    def __init__(self, ticker='GLD', crypto=False, sync=True):
         self.ticker = ticker
         self.is_crypto = crypto
         self.enddate = None
         self.daily = None
 
-        self.sync()
+        # timestamp of the last bar written to the store, None forces a full write
+        self.stored_last = None
+
+        # set when there is something save has to write
+        self.dirty = True
+
+        # weekly, monthly, ... built from daily on first access
+        self._views = {}
+
+        # indicators shared by every span on this security
+        self.indicators = IndicatorCache()
+
+        if sync:
+            self.sync()
+
+    def __getattr__(self, name):
+        """resample daily into the span name (see AddTimeSpan.resampler) the first time it is asked for"""
+        if name == 'indicators':
+            return self.__dict__.setdefault('indicators', IndicatorCache())
+        if name in ('streams', 'events'):
+            self.build_streams()
+            return self.__dict__[name]
+        if name in self.INTRADAY:
+            return self.intraday_span(name)
+
+        # private names (copy and pickle probe __deepcopy__, __setstate__...) are never spans
+        missing = "'{}' object has no attribute '{}'".format(type(self).__name__, name)
+        if name.startswith('_'):
+            raise AttributeError(missing)
+        try:
+            resampler = self.resampler(name)
+        except KeyError:
+            raise AttributeError(missing)
+
+        views = self.__dict__.setdefault('_views', {})
+        if name not in views:
+            # a frequency finer than the bars, or too fine to bucket, is no span either
+            try:
+                views[name] = resampler.resample(self.daily)
+            except ValueError as e:
+                raise AttributeError('{} ({})'.format(missing, e))
+        return views[name]
 
-        # TODO: make this into a pandas view (or transform)
-        self.weekly = self.add_week(self.daily)
-        self.monthly = self.add_month(self.daily)
+    def __getstate__(self):
+        # views and indicators are derived data, rebuild them on the other side
+        state = self.__dict__.copy()
+        state['_views'] = {}
+        state.pop('indicators', None)
+        return state
 
-    def upgrade(self):
-        version = float(getattr(self, 'version', 0))
+    @property
+    def intraday(self):
+        """hourly bars of a crypto security, see models.intraday"""
+        if self.__dict__.get('_intraday') is None:
+            if not self.is_crypto:
+                raise ValueError('No intraday bars for {}, only crypto has them'.format(self.ticker))
+            self._intraday = Intraday(self.ticker, self._filename(self.ticker, True, intraday=True))
+        return self._intraday
 
-        if version < 3.:
-            self.version = '3.0'
-            self.is_crypto = False
-            logging.info('Upgraded {} cache to version {}'.format(self.ticker, self.version))
+    def intraday_span(self, name, start_date=None):
+        """bars of the intraday span name (see INTRADAY) on or after start_date, earlier ones are not read"""
+        bars = self.intraday.read(start_date)
+        resampler = self.INTRADAY[name]
+        return bars if resampler is None else resampler.resample(bars)
 
-    def sync(self):
+    def sync(self, delta=None):
+        """fetch the bars missing since enddate, delta are bars already fetched for us (see load_many)"""
         today = self._today
         if not self.enddate:
             self.enddate = self.STARTDATE - datetime.timedelta(days=1)
 
-        staleness = datetime.timedelta(days=1)
-        if today - self.enddate >= staleness:
+        if self.is_stale(self.enddate, today) and delta is None:
             logging.info('Sync necessary, retrieving missing data')
 
             if not self.is_crypto:
@@ -53,47 +113,322 @@ class Security(AddTimeSpan):
             else:
                 delta = load_crypto_data(self.enddate + datetime.timedelta(days=1), today, self.ticker)
 
-            if self.daily is not None:
-                self.daily = pd.concat((self.daily, delta))
+        if delta is not None:
+            self.append(delta)
+            self.enddate = today
+            self.dirty = True
+
+    def append(self, delta):
+        """
+        add the bars of delta that are newer than daily, returns the rows kept
+
+        Only the new rows are sorted and checked, daily itself is never
+        re-sorted.  Views that were already built only get their trailing
+        buckets recomputed instead of resampling the full history.
+        """
+        delta = delta.sort_index()
+        delta = delta[~delta.index.duplicated(keep='last')]
+
+        if self.daily is not None and len(self.daily):
+            # skip the bars we already have at the boundary
+            delta = delta[delta.index > self.daily.index[-1]]
+
+        if not len(delta):
+            logging.info('No new bars for {}'.format(self.ticker))
+            return delta
+
+        if self.daily is None:
+            self.daily = delta
+        else:
+            self.check_index(self.daily, delta)
+            self.daily = pd.concat((self.daily, delta))
+
+        self.indicators.clear()
+        if 'streams' in self.__dict__:
+            for date in self.streams.advance(delta.adj_close):
+                self.detect(date)
+
+        since = delta.index[0]
+        for name, view in list(self._views.items()):
+            self._views[name] = self.resampler(name).update(view, self.daily, since)
+
+        logging.info('Appended {} bars to {}'.format(len(delta), self.ticker))
+        return delta
+
+    @staticmethod
+    def check_index(daily, delta):
+        """daily + delta stays sorted and unique, costs O(len(delta))"""
+        if not (delta.index.is_monotonic_increasing and delta.index.is_unique):
+            raise ValueError('New bars are not sorted and unique')
+        if len(daily) and delta.index[0] <= daily.index[-1]:
+            raise ValueError('New bars start at {} which is not after {}'.format(
+                delta.index[0], daily.index[-1]))
+
+    @staticmethod
+    def new_streams():
+        """daily indicators advanced bar by bar, same parameters as the span mixins"""
+        return IndicatorStreams({
+            'rsi': Chained(WilderRSI(7), MovingAverage(10, 'exponential')),
+            'macd': MACD(26, 12, 10),
+            'bbands': Bands(21, 2),
+        })
+
+    def build_streams(self):
+        """
+        streaming indicators and the events on them, primed from the full
+        history since daily may only be a window of it
+        """
+        prices = self.daily.adj_close
+        store = ColumnStore(self._filename(self.ticker, self.is_crypto))
+        try:
+            with locked(store.path, shared=True):
+                stored = store.read().adj_close
+            prices = pd.concat((stored, prices[prices.index > stored.index[-1]]))
+        except (IOError, ValueError, IndexError):
+            pass
+
+        self.streams = self.new_streams()
+        self.streams.reset(prices)
+
+        rsi, rsi_ma10, _ = RSIMixin.compute(prices.values)
+        _, _, macd, signal = MACDMixin.compute(prices.values)
+        self.events = EventDetector()
+        self.events.reset(prices.index, rsi, rsi_ma10, macd, signal)
+
+        # derived from stored bars alone, keep it next to them without rewriting the columns
+        if self.stored_last is not None and self.streams.last == self.stored_last:
+            try:
+                with locked(store.path):
+                    self.write_streams(store, self.streams, self.events)
+            except (IOError, OSError) as e:
+                logging.info('Could not keep the streaming indicators of {} ({})'.format(self.ticker, e))
+
+    def detect(self, date):
+        """feed the streaming indicators of the bar at date to the event detector"""
+        rsi, rsi_ma10 = self.streams['rsi']
+        _, _, macd, signal = self.streams['macd']
+        self.events.update(date, rsi, rsi_ma10, macd, signal)
+
+    @staticmethod
+    def read_streams(store):
+        """streaming indicators and event detector saved in store, None when missing or unreadable"""
+        try:
+            with open(os.path.join(store.path, streams_file)) as f:
+                streams = IndicatorStreams.from_state(json.load(f))
+
+            with np.load(os.path.join(store.path, events_file)) as saved:
+                events = EventDetector(EventLog(saved['records']))
+                events.set_state(json.loads(str(saved['state'])))
+        except (IOError, ValueError, KeyError) as e:
+            logging.info('No streaming indicators in {} ({})'.format(store.path, e))
+            return None
+
+        return streams, events
+
+    @staticmethod
+    def write_streams(store, streams, events):
+        with atomic_write(os.path.join(store.path, streams_file)) as f:
+            json.dump(streams.state(), f)
+
+        with atomic_write(os.path.join(store.path, events_file), 'wb') as f:
+            np.savez(f, records=events.log.records, state=np.array(json.dumps(events.state())))
+
+    @staticmethod
+    def is_stale(enddate, today):
+        return today - enddate >= datetime.timedelta(days=1)
+
+    @classmethod
+    def cached_version(cls, ticker, crypto=False, span='daily'):
+        """
+        timestamp of the last stored bar of span when the store is fresh
+        enough that load would not sync, otherwise None.  Only reads the
+        store header.
+        """
+        if span in cls.INTRADAY:
+            if not crypto:
+                return None
+            try:
+                last = ColumnStore.last_bar(ChunkedStore(cls._filename(ticker, True, intraday=True)).read_header())
+            except IOError:
+                return None
+            return None if Intraday.is_stale(last, Intraday._now()) else last
+
+        try:
+            header = ColumnStore(cls._filename(ticker, crypto)).read_header()
+        except IOError:
+            return None
+
+        if cls.is_stale(header['enddate'], cls._now(crypto)):
+            return None
+        return ColumnStore.last_bar(header)
+
+    @classmethod
+    def inventory(cls, verify=False):
+        """
+        one row per stored security read from the headers alone, verify also
+        checks every column against its checksum
+        """
+        rows = []
+        names = sorted(os.listdir(cls.store_dir)) if os.path.isdir(cls.store_dir) else []
+        for name in names:
+            # hourly stores keep their suffix, e.g. coinBTC.hourly next to coinBTC
+            if name.endswith('.cols'):
+                store, name = ColumnStore(os.path.join(cls.store_dir, name)), name[:-5]
+            elif name.endswith('.hourly'):
+                store = ChunkedStore(os.path.join(cls.store_dir, name))
             else:
-                self.daily = delta
+                continue
 
-            self.enddate = today
+            try:
+                header = store.read_header()
+            except IOError as e:
+                rows.append({'name': name, 'error': str(e)})
+                continue
 
-        self.daily.sort_index(inplace=True)
+            if isinstance(store, ChunkedStore):
+                stale = Intraday.is_stale(store.last_bar(header), Intraday._now())
+            else:
+                stale = cls.is_stale(header['enddate'], cls._now(header.get('is_crypto')))
+            row = {
+                'name': name,
+                'ticker': header.get('ticker'),
+                'is_crypto': header.get('is_crypto'),
+                'enddate': header['enddate'],
+                'last': store.last_bar(header),
+                'rows': header['rows'],
+                'stale': stale,
+                'error': None,
+            }
+            if verify:
+                bad = store.verify(header)
+                row['error'] = 'checksum mismatch in {}'.format(', '.join(bad)) if bad else None
+            rows.append(row)
+
+        columns = ['name', 'ticker', 'is_crypto', 'enddate', 'last', 'rows', 'stale', 'error']
+        return pd.DataFrame(rows, columns=columns).set_index('name')
 
     @classmethod
-    def _filename(cls, ticker, is_crypto=False):
-        return os.path.join(store_dir, '{}{}'.format('coin' if is_crypto else '', ticker))
+    def _filename(cls, ticker, is_crypto=False, intraday=False):
+        return os.path.join(cls.store_dir, '{}{}.{}'.format('coin' if is_crypto else '', ticker,
+                                                            'hourly' if intraday else 'cols'))
 
-    @property
-    def _today(self):
-        if self.is_crypto:
+    @staticmethod
+    def _now(crypto=False):
+        if crypto:
             return datetime.datetime.utcnow()
         return datetime.datetime.now()  # TODO: tzdata to convert to EST (intrinio)
 
+    @property
+    def _today(self):
+        return self._now(self.is_crypto)
+
     def save(self):
-        joblib.dump(self, self._filename(self.ticker, self.is_crypto), compress=False)
+        """write what changed since the load, nothing at all when nothing did"""
+        if self.__dict__.get('_intraday') is not None:
+            self._intraday.save()
+
+        if not self.dirty:
+            logging.debug('Nothing to save for {}'.format(self.ticker))
+            return
+
+        store = ColumnStore(self._filename(self.ticker, self.is_crypto))
+        meta = {'ticker': self.ticker, 'is_crypto': self.is_crypto, 'enddate': self.enddate}
+
+        with locked(store.path):
+            # another process may have saved since we loaded, only add what the store is missing
+            try:
+                header = store.read_header()
+                last = store.last_bar(header)
+                meta['enddate'] = max(self.enddate, header['enddate'])
+            except (IOError, KeyError):
+                last = None
+
+            if self.stored_last is None or last is None:
+                header = store.write(self.daily, **meta)
+            else:
+                # only the bars fetched since the load, earlier ones may not even be in memory
+                header = store.append(self.daily[self.daily.index > max(self.stored_last, last)], **meta)
+            self.stored_last = store.last_bar(header)
+
+            if 'streams' in self.__dict__ and self.streams.last == self.stored_last:
+                self.write_streams(store, self.streams, self.events)
+
+        self.dirty = False
 
     @classmethod
-    def load(cls, ticker, force_fetch=False, crypto=False):
+    def load(cls, ticker, force_fetch=False, crypto=False, start_date=None, sync=True):
+        """
+        start_date limits the bars read into daily, the store itself keeps
+        the full history.  sync=False skips fetching missing bars.
+        """
         try:
             if force_fetch:
                 raise IOError('Triggering Cache Miss')
 
-            security = joblib.load(cls._filename(ticker, crypto))
+            security = cls._read(ticker, crypto, start_date)
             logging.info('Security {} loaded successfully'.format(ticker))
-            security.upgrade()
 
             try:
-                security.sync()
+                if sync:
+                    security.sync()
             except AttributeError as e:
                 logging.error('Ignoring exception ({}) while syncing {} '.format(e, ticker))
 
             return security
         except IOError as e:
-            logging.info('Cache miss, creating new Security {}'.format(ticker))
-            return Security(ticker, crypto)
+            logging.info('Cache miss, creating new Security {} ({})'.format(ticker, e))
+            return cls(ticker, crypto, sync=sync)
+
+    @classmethod
+    def _read(cls, ticker, crypto=False, start_date=None):
+        """the security as stored, raises IOError when the store is missing or unreadable"""
+        store = ColumnStore(cls._filename(ticker, crypto))
+        with locked(store.path, shared=True):
+            header = store.read_header()
+            try:
+                security = cls.__new__(cls)
+                security.ticker = ticker
+                security.is_crypto = header['is_crypto']
+                security.enddate = header['enddate']
+                security.daily = store.read(start_date, header)
+                security._views = {}
+                security.stored_last = store.last_bar(header)
+                security.dirty = False
+            except (ValueError, KeyError, TypeError) as e:
+                # e.g. a column file shorter than the header says
+                raise IOError('Corrupt store {} ({})'.format(store.path, e))
+
+            # indicator state is only valid for the bars it was saved with
+            saved = cls.read_streams(store)
+            if saved is not None and saved[0].last == security.stored_last:
+                security.streams, security.events = saved
+
+        return security
+
+    @classmethod
+    def load_many(cls, tickers, crypto=False, start_date=None, loader=None):
+        """
+        load every ticker and sync the stale ones from one bulk download per
+        enddate instead of a request each, loader defaults to a BulkLoader.
+        Tickers the download misses are left as they were in the store.
+        """
+        securities = [cls.load(ticker, crypto=crypto, start_date=start_date, sync=False) for ticker in tickers]
+
+        today = cls._now(crypto)
+        stale = defaultdict(list)
+        for security in securities:
+            enddate = security.enddate or cls.STARTDATE - datetime.timedelta(days=1)
+            if cls.is_stale(enddate, today):
+                stale[enddate].append(security)
+
+        loader = loader or BulkLoader()
+        for enddate, group in stale.items():
+            frames = loader.load([s.ticker for s in group], enddate + datetime.timedelta(days=1), today, crypto=crypto)
+            for security in group:
+                if security.ticker in frames:
+                    security.sync(delta=frames[security.ticker])
+
+        return securities
 
     def span(self, freq, klass='rsi', **kwargs):
         """return a new Span workflow as a context manager for the freq time-window"""
@@ -1,4 +1,12 @@
+import shutil
+import tempfile
 import unittest
+from unittest import mock
+
+import numpy as np
+
+from models.events import EventDetector
+from models.indicators import RSIMixin, MACDMixin
 from models.security import *
 
 
@@ -32,7 +40,7 @@ class TestStoreMethods(unittest.TestCase):
 
     def test_save(self):
         self.security.save()
-        self.assertTrue(os.path.isfile(self.security._filename(self.security.ticker)),
+        self.assertTrue(os.path.isdir(self.security._filename(self.security.ticker)),
                         True)
 
     def test_load(self):
@@ -44,5 +52,177 @@ class TestStoreMethods(unittest.TestCase):
         # loaded_security._today = datetime.date(2016, 12, 2)
 
 
+class TestAppendMethods(unittest.TestCase):
+
+    def setUp(self):
+        index = pd.bdate_range('2016-06-01', '2016-12-01')
+        prices = pd.Series(range(len(index)), index=index, dtype=float)
+        self.bars = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1,
+                                  'close': prices, 'volume': prices, 'adj_close': prices})
+
+        self.security = Security.__new__(Security)
+        self.security.ticker = 'GLD'
+        self.security.daily = None
+        self.security._views = {}
+        self.security.append(self.bars[:60])
+
+    def test_boundary_duplicates(self):
+        appended = self.security.append(self.bars[55:70])
+        self.assertEqual(len(appended), 10)
+        self.assertTrue(self.security.daily.index.equals(self.bars[:70].index))
+
+    def test_nothing_new(self):
+        self.assertEqual(len(self.security.append(self.bars[:60])), 0)
+        self.assertEqual(len(self.security.daily), 60)
+
+    def test_lazy_views(self):
+        self.assertNotIn('weekly', self.security._views)
+        pd.testing.assert_frame_equal(self.security.weekly, self.security.add_week(self.security.daily))
+        self.assertIn('weekly', self.security._views)
+        self.assertRaises(AttributeError, getattr, self.security, 'hourly')
+        # finer than the daily bars
+        self.assertRaises(AttributeError, getattr, self.security, '1H')
+        self.assertFalse(hasattr(self.security, '_private'))
+
+    def test_trailing_buckets(self):
+        self.security.weekly, self.security.monthly
+        for end in range(61, len(self.bars), 3):
+            self.security.append(self.bars[end - 3:end])
+        pd.testing.assert_frame_equal(self.security.weekly, self.security.add_week(self.security.daily))
+        pd.testing.assert_frame_equal(self.security.monthly, self.security.add_month(self.security.daily))
+
+    def test_shared_indicators(self):
+        with self.security.span('weekly', 'rsi') as first, self.security.span('weekly', 'rsi') as second:
+            self.assertIs(first.calc.rsi, second.calc.rsi)
+
+        self.security.append(self.bars[60:70])
+        self.assertEqual(len(self.security.indicators), 0)
+
+    def test_check_index(self):
+        self.assertRaises(ValueError, Security.check_index, self.bars[10:20], self.bars[5:8])
+
+
+class TestStreams(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.harness = type('Harness', (Security,), {'store_dir': self.store_dir})
+
+        index = pd.bdate_range('2016-06-01', '2016-12-01')
+        prices = pd.Series(np.cumsum(np.sin(np.arange(len(index)))) + 100., index=index)
+        self.bars = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1,
+                                  'close': prices, 'volume': prices, 'adj_close': prices})
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def test_advance_after_load(self):
+        security = self.harness('GLD', sync=False)
+        security.enddate = datetime.datetime.now()
+        security.append(self.bars[:100])
+        security.streams
+        security.save()
+
+        loaded = self.harness.load('GLD', sync=False)
+        self.assertIn('streams', loaded.__dict__)
+
+        loaded.append(self.bars[100:])
+        rsi, rsi_ma10 = loaded.streams['rsi']
+        expected = RSIMixin.compute(self.bars.adj_close.values)
+        self.assertAlmostEqual(rsi, expected[0][-1])
+        self.assertAlmostEqual(rsi_ma10, expected[1][-1])
+
+        # events detected bar by bar after the load are the ones a full pass finds
+        full = EventDetector()
+        full.reset(self.bars.index, expected[0], expected[1], *MACDMixin.compute(self.bars.adj_close.values)[2:])
+        np.testing.assert_array_equal(loaded.events.log.records['index'], full.log.records['index'])
+
+
+class TestSave(unittest.TestCase):
+    setUp = TestStreams.setUp
+    tearDown = TestStreams.tearDown
+
+    def saved(self, rows):
+        security = self.harness('GLD', sync=False)
+        security.enddate = datetime.datetime.now()
+        security.append(self.bars[:rows])
+        security.save()
+        return security
+
+    def test_clean_security_is_not_written(self):
+        self.saved(100)
+        loaded = self.harness.load('GLD', sync=False)
+        self.assertFalse(loaded.dirty)
+
+        with mock.patch.object(ColumnStore, 'append', side_effect=AssertionError('wrote')):
+            loaded.save()
+
+    def test_concurrent_saves(self):
+        self.saved(100)
+        first, second = self.harness.load('GLD', sync=False), self.harness.load('GLD', sync=False)
+        for security in (first, second):
+            security.sync(delta=self.bars[100:])
+        first.save()
+        second.save()
+
+        stored = self.harness.load('GLD', sync=False).daily
+        pd.testing.assert_index_equal(stored.index, self.bars.index, check_names=False)
+
+    def test_corrupt_store_is_a_cache_miss(self):
+        self.saved(100)
+        store = ColumnStore(self.harness._filename('GLD'))
+        with open(store._column_path('adj_close'), 'r+b') as f:
+            f.truncate(16)
+
+        loaded = self.harness.load('GLD', sync=False)
+        self.assertIsNone(loaded.daily)
+        self.assertTrue(loaded.dirty)
+
+    def test_inventory(self):
+        self.saved(100)
+        with open(os.path.join(self.store_dir, 'BAD.cols.lock'), 'w'):
+            pass
+        os.makedirs(os.path.join(self.store_dir, 'BAD.cols'))
+
+        table = self.harness.inventory(verify=True)
+        self.assertEqual(list(table.index), ['BAD', 'GLD'])
+        self.assertEqual(table.loc['GLD', 'rows'], 100)
+        self.assertEqual(table.loc['GLD', 'last'], self.bars.index[99])
+        self.assertFalse(table.loc['GLD', 'stale'])
+        self.assertIsNone(table.loc['GLD', 'error'])
+        self.assertTrue(table.loc['BAD', 'error'])
+
+
+class StubLoader(object):
+    def __init__(self, frames):
+        self.frames = frames
+        self.calls = []
+
+    def load(self, tickers, startdate, enddate, crypto=False):
+        self.calls.append(tickers)
+        return {ticker: self.frames[ticker] for ticker in tickers if ticker in self.frames}
+
+
+class TestLoadMany(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.harness = type('Harness', (Security,), {'store_dir': self.store_dir})
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def test_one_bulk_call(self):
+        index = pd.bdate_range('2016-06-01', '2016-12-01')
+        bars = pd.DataFrame({'adj_close': range(len(index))}, index=index, dtype=float)
+        loader = StubLoader({'GLD': bars, 'SPY': bars})
+
+        securities = self.harness.load_many(['GLD', 'SPY', 'MISSING'], loader=loader)
+
+        self.assertEqual(loader.calls, [['GLD', 'SPY', 'MISSING']])
+        self.assertEqual([len(s.daily) for s in securities[:2]], [len(bars)] * 2)
+        self.assertIsNone(securities[2].daily)
+
+
 if __name__ == '__main__':
     unittest.main()
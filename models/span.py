@@ -2,19 +2,32 @@ import logging
 from contextlib import ContextDecorator
 
 from models.directors import NumpyDecider, MACDDecider
+from models.events import DIRECTION_CHANGE, MA_CROSS, ZERO_CROSS, SIGNAL_CROSS
 from models.indicators import RSIMixin, TheEvaluator, MACDMixin, BBandsMixin
 from models.plotter import PlotMixin, MACDPlotMixin
 
 
 class BaseSpan(ContextDecorator):
-    def __init__(self, security, span=None, start_date=None):
-        self.dataset = getattr(security, span, security.daily)
+    # kinds of the events calc finds, see models.events
+    EVENT_KINDS = ()
+
+    def __init__(self, security, span=None, start_date=None, **params):
+        """params go to the indicator mixin, e.g. n and ma of RSIMixin"""
+        if span in getattr(security, 'INTRADAY', ()):
+            # only the intraday bars from start_date on are read
+            self.dataset = security.intraday_span(span, start_date)
+        else:
+            self.dataset = getattr(security, span, security.daily)
         self.truncate(start_date)
 
+        self.security = security
         self.ticker = security.ticker
         self.span = span or 'daily'
+        self.cache = getattr(security, 'indicators', None)
+        self.params = params
 
         self.calc = self.decide = self.eval = self.plot = None
+        self._event_log = None
 
     def __enter__(self):
         logging.info('Setting span for {} to {}'.format(self.ticker, self.span))
@@ -28,11 +41,35 @@ class BaseSpan(ContextDecorator):
     @property
     def events(self):
         l = [['buy {}'.format(self.dataset.index[b]), 'sell {}'.format(self.dataset.index[s])]
-             for b, s in zip(self.decide.clean_buysellvol[0:2])]
+             for b, s in zip(*self.decide.clean_buysellvol[0:2])]
         return [item for sublist in l for item in sublist]
 
+    @property
+    def event_log(self):
+        """
+        indicator events of the span.  Daily spans of the default indicators
+        share the log the security keeps up to date bar by bar, other spans
+        find theirs once from calc.
+        """
+        if self._event_log is None:
+            if self.span == 'daily' and not self.params and self.EVENT_KINDS:
+                self._event_log = self.security.events.log
+            else:
+                self._event_log = self.calc.events()
+        return self._event_log
+
+    @property
+    def version(self):
+        """the bars this span covers, new bars or another start_date give another version"""
+        index = self.dataset.index
+        if not len(index):
+            return self.span, 0
+        return self.span, len(index), index[0], index[-1]
+
     def recent_events(self, last_n):
-        return [str(event) for event in self.events][:last_n]
+        """the last_n events since the first bar of the span, from the tail of event_log"""
+        since = self.dataset.index[0].value if len(self.dataset) else None
+        return [str(event) for event in self.event_log.events(last_n, self.EVENT_KINDS or None, since)]
 
     def workflow(self):
         raise NotImplemented()
@@ -43,9 +80,10 @@ class BaseSpan(ContextDecorator):
 
 
 class Span(BaseSpan):
+    EVENT_KINDS = (DIRECTION_CHANGE, MA_CROSS)
 
     def workflow(self):
-        self.calc = RSIMixin(self.dataset)
+        self.calc = RSIMixin(self.dataset, self.cache, self.version, **self.params)
         self.decide = NumpyDecider(self.dataset, self.calc)
         self.eval = TheEvaluator(self.dataset)
         self.plot = PlotMixin(self.dataset, self.ticker,
@@ -54,9 +92,10 @@ class Span(BaseSpan):
 
 
 class MACDSpan(BaseSpan):
+    EVENT_KINDS = (ZERO_CROSS, SIGNAL_CROSS)
 
     def workflow(self):
-        self.calc = MACDMixin(self.dataset)
+        self.calc = MACDMixin(self.dataset, self.cache, self.version, **self.params)
         self.decide = MACDDecider(self.dataset, self.calc)
         self.eval = TheEvaluator(self.dataset)
         self.plot = MACDPlotMixin(self.dataset, self.ticker,
@@ -67,5 +106,5 @@ class MACDSpan(BaseSpan):
 class BBandsSpan(BaseSpan):
 
     def workflow(self):
-        self.calc = BBandsMixin(self.dataset)
+        self.calc = BBandsMixin(self.dataset, self.cache, self.version, **self.params)
         self.decide = self.eval = self.plot = None
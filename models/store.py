@@ -0,0 +1,325 @@
+"""
+store : columnar on-disk price store, one directory per security
+
+    <name>.cols/
+        header.json     schema version, ticker, is_crypto, enddate, row count,
+                        crc32 of every column
+        index.i8        bar timestamps as int64 nanoseconds since the epoch
+        open.f8 ...     one raw typed file per price column
+
+Columns are plain little-endian arrays, so reads are memory-mapped and a
+start_date window only touches the tail pages of each file.  Appending a
+day of bars writes the new rows at the end of every column and bumps the
+row count in the header.
+
+The header is the commit point: it is replaced atomically and readers only
+look at the rows it counts, so rows an appender is still writing are never
+read.  A full write builds a new directory and swaps it in.
+
+The checksums are chained, the crc32 of the appended bytes continues from
+the stored one, so appends never re-read a column to keep them current.
+Everything needed to decide whether to refetch is in the header alone.
+
+ChunkedStore keeps intraday bars, float32 prices split into one
+ColumnStore directory per month of bars:
+
+    <name>.hourly/
+        header.json     as above plus the rows, first and last bar and
+                        checksums of every chunk
+        2017-01/        index.i8, open.f4 ... of the bars of January
+        2017-02/ ...
+
+Chunks are append-only, new bars go to the last chunk or start the next
+one, and a start_date read only opens the chunks from that month on.
+"""
+import datetime
+import json
+import logging
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from util.atomic import atomic_write, atomic_directory
+
+SCHEMA_VERSION = 2
+COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'adj_close')
+INDEX_DTYPE = '<i8'
+PRICE_DTYPE = '<f8'
+INTRADAY_DTYPE = '<f4'
+CHUNK_FORMAT = '%Y-%m'
+
+DATE_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+
+def encode_date(d):
+    return d.isoformat() if d is not None else None
+
+
+def decode_date(s):
+    """datetime of an encode_date string, midnight for a date only one"""
+    if s is None:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(s, fmt)
+        except ValueError:
+            pass
+    raise ValueError('Unrecognised date {}'.format(s))
+
+
+class ColumnStore(object):
+    """Typed column files plus a json header for a single security"""
+
+    def __init__(self, path, columns=COLUMNS, dtype=PRICE_DTYPE):
+        self.path = path
+        self.columns = tuple(columns)
+        self.dtype = dtype
+
+    @property
+    def header_path(self):
+        return os.path.join(self.path, 'header.json')
+
+    def _column_path(self, name):
+        suffix = 'i8' if name == 'index' else np.dtype(self.dtype).str[1:]
+        return os.path.join(self.path, '{}.{}'.format(name, suffix))
+
+    def exists(self):
+        return os.path.isfile(self.header_path)
+
+    def read_header(self):
+        """raises IOError when the store is missing or was written by another schema"""
+        try:
+            with open(self.header_path) as f:
+                header = json.load(f)
+        except ValueError as e:
+            raise IOError('Corrupt header {} ({})'.format(self.header_path, e))
+
+        if header.get('schema_version') == 1:
+            header = self._upgrade(header)
+
+        if header.get('schema_version') != SCHEMA_VERSION:
+            raise IOError('Schema version {} of {} is not {}'.format(
+                header.get('schema_version'), self.path, SCHEMA_VERSION))
+
+        header['enddate'] = decode_date(header['enddate'])
+        return header
+
+    @staticmethod
+    def last_bar(header):
+        """timestamp of the last stored bar, None for an empty store"""
+        return pd.Timestamp(header['last']) if header['last'] is not None else None
+
+    def _memmap(self, name, dtype, rows):
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=(rows,))
+
+    def read(self, start_date=None, header=None):
+        """load the bars on or after start_date as a DataFrame"""
+        header = header or self.read_header()
+        rows = header['rows']
+
+        index = self._memmap('index', INDEX_DTYPE, rows)
+        start = 0
+        if start_date is not None:
+            start = int(np.searchsorted(index, pd.Timestamp(start_date).value, side='left'))
+
+        # copy out of the mapping so the files can be appended to afterwards
+        data = {c: np.array(self._memmap(c, self.dtype, rows)[start:]) for c in header['columns']}
+        index = pd.DatetimeIndex(np.array(index[start:]).view('datetime64[ns]'), name='date')
+
+        logging.debug('Read {} of {} rows from {}'.format(rows - start, rows, self.path))
+        return pd.DataFrame(data, index=index, columns=header['columns'])
+
+    def _encode(self, frame):
+        index = np.asarray(frame.index.values, dtype='datetime64[ns]').view(INDEX_DTYPE)
+        return [('index', index)] + \
+               [(c, np.asarray(frame[c].values, dtype=self.dtype)) for c in self.columns]
+
+    def _header(self, rows, last, checksums, meta):
+        header = dict(meta)
+        header.update({
+            'schema_version': SCHEMA_VERSION,
+            'columns': list(self.columns),
+            'dtype': self.dtype,
+            'rows': rows,
+            'last': last,
+            'checksums': checksums,
+        })
+        header['enddate'] = encode_date(header.get('enddate'))
+        return header
+
+    def _write_header(self, rows, last, checksums, meta, path=None):
+        header = self._header(rows, last, checksums, meta)
+        with atomic_write(os.path.join(path or self.path, 'header.json')) as f:
+            json.dump(header, f)
+        return header
+
+    def write(self, frame, **meta):
+        """replace the store with frame, other files in the directory are dropped"""
+        parent = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+
+        columns = self._encode(frame)
+        with atomic_directory(self.path) as tmp:
+            for name, values in columns:
+                with open(os.path.join(tmp, os.path.basename(self._column_path(name))), 'wb') as f:
+                    f.write(values.tobytes())
+
+            last = int(columns[0][1][-1]) if len(frame) else None
+            checksums = {name: zlib.crc32(values.tobytes()) for name, values in columns}
+            return self._write_header(len(frame), last, checksums, meta, tmp)
+
+    def append(self, frame, **meta):
+        """add the rows of frame after the last stored bar"""
+        try:
+            header = self.read_header()
+        except IOError:
+            return self.write(frame, **meta)
+        meta = dict(header, **meta)
+
+        checksums = dict(header['checksums'])
+        if len(frame) == 0:
+            return self._write_header(header['rows'], header['last'], checksums, meta)
+
+        checksums, last = self._append_columns(frame, header['rows'], checksums)
+        return self._write_header(header['rows'] + len(frame), last, checksums, meta)
+
+    def _append_columns(self, frame, rows, checksums):
+        """
+        write frame after the first rows of every column, returns the
+        chained checksums and the last timestamp; the header still has to
+        count the rows
+        """
+        checksums = dict(checksums)
+        columns = self._encode(frame)
+        for name, values in columns:
+            data = values.tobytes()
+            path = self._column_path(name)
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                # overwrite anything past the committed row count
+                f.seek(rows * values.dtype.itemsize)
+                f.write(data)
+                f.truncate()
+            checksums[name] = zlib.crc32(data, checksums.get(name, 0))
+        return checksums, int(columns[0][1][-1])
+
+    def _checksums(self, header):
+        """crc32 of the committed rows of every column, None for a column that is too short"""
+        dtypes = dict.fromkeys(header['columns'], header['dtype'])
+        dtypes['index'] = INDEX_DTYPE
+
+        checksums = {}
+        for name, dtype in dtypes.items():
+            remaining, crc = header['rows'] * np.dtype(dtype).itemsize, 0
+            try:
+                with open(self._column_path(name), 'rb') as f:
+                    while remaining:
+                        chunk = f.read(min(remaining, 1 << 20))
+                        if not chunk:
+                            break
+                        crc, remaining = zlib.crc32(chunk, crc), remaining - len(chunk)
+            except IOError:
+                remaining = -1
+            checksums[name] = None if remaining else crc
+        return checksums
+
+    def verify(self, header=None):
+        """names of the columns whose committed rows do not match the header checksum"""
+        header = header or self.read_header()
+        actual = self._checksums(header)
+        return sorted(name for name, crc in actual.items() if crc is None or crc != header['checksums'].get(name))
+
+    def _upgrade(self, header):
+        """
+        add the checksums a schema 1 header lacks, reads every column once.
+        Only in memory: readers hold no lock or a shared one, the next append
+        or write (under the exclusive lock) stores the upgraded header.
+        """
+        checksums = self._checksums(header)
+        if None in checksums.values():
+            raise IOError('Columns of {} are shorter than its header'.format(self.path))
+
+        meta = {k: v for k, v in header.items() if k in ('ticker', 'is_crypto', 'enddate')}
+        meta['enddate'] = decode_date(meta['enddate'])
+        logging.info('Upgrading {} to schema version {}'.format(self.path, SCHEMA_VERSION))
+        return self._header(header['rows'], header['last'], checksums, meta)
+
+
+class ChunkedStore(ColumnStore):
+    """ColumnStore split into a directory per month of bars, see the module docstring"""
+
+    def __init__(self, path, columns=COLUMNS, dtype=INTRADAY_DTYPE):
+        super(ChunkedStore, self).__init__(path, columns, dtype)
+
+    def _chunk(self, name, path=None):
+        return ColumnStore(os.path.join(path or self.path, name), self.columns, self.dtype)
+
+    def _chunk_header(self, header, chunk):
+        """what ColumnStore needs to read the committed rows of chunk"""
+        return dict(chunk, columns=header['columns'], dtype=header['dtype'])
+
+    def _write_header(self, rows, last, chunks, meta, path=None):
+        return super(ChunkedStore, self)._write_header(rows, last, {}, dict(meta, chunks=chunks), path)
+
+    def read(self, start_date=None, header=None):
+        """the bars on or after start_date as float64, chunks that end before it are not opened"""
+        header = header or self.read_header()
+        start = pd.Timestamp(start_date).value if start_date is not None else None
+
+        frames = [self._chunk(chunk['name']).read(start_date, self._chunk_header(header, chunk))
+                  for chunk in header['chunks'] if start is None or chunk['last'] >= start]
+        if not frames:
+            return pd.DataFrame(columns=header['columns'], index=pd.DatetimeIndex([], name='date'), dtype=float)
+        return pd.concat(frames).astype(float)
+
+    def _add(self, chunks, frame, path=None):
+        """append frame to chunks, a list of chunk entries that is updated in place"""
+        months = frame.index.strftime(CHUNK_FORMAT)
+        for name in pd.unique(months):
+            part = frame[months == name]
+            if chunks and chunks[-1]['name'] == name:
+                chunk = chunks[-1]
+            else:
+                chunk = {'name': name, 'rows': 0, 'first': int(part.index[0].value), 'checksums': {}}
+                chunks.append(chunk)
+                os.makedirs(self._chunk(name, path).path, exist_ok=True)
+
+            chunk['checksums'], chunk['last'] = self._chunk(name, path)._append_columns(
+                part, chunk['rows'], chunk['checksums'])
+            chunk['rows'] += len(part)
+        return chunks
+
+    def write(self, frame, **meta):
+        parent = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+
+        with atomic_directory(self.path) as tmp:
+            chunks = self._add([], frame, tmp)
+            last = chunks[-1]['last'] if chunks else None
+            return self._write_header(len(frame), last, chunks, meta, tmp)
+
+    def append(self, frame, **meta):
+        """add the rows of frame after the last stored bar, only the last chunk and new ones are written"""
+        try:
+            header = self.read_header()
+        except IOError:
+            return self.write(frame, **meta)
+        meta = dict(header, **meta)
+
+        chunks = self._add([dict(chunk) for chunk in header['chunks']], frame)
+        last = chunks[-1]['last'] if chunks else None
+        return self._write_header(header['rows'] + len(frame), last, chunks, meta)
+
+    def verify(self, header=None):
+        """chunk/column names whose committed rows do not match the header checksums"""
+        header = header or self.read_header()
+        bad = []
+        for chunk in header['chunks']:
+            names = self._chunk(chunk['name']).verify(self._chunk_header(header, chunk))
+            bad.extend('{}/{}'.format(chunk['name'], name) for name in names)
+        return bad
@@ -0,0 +1,183 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from models.store import ColumnStore, ChunkedStore, COLUMNS, decode_date
+
+
+def make_frame(start, periods, freq='D'):
+    index = pd.date_range(start, periods=periods, freq=freq)
+    data = np.arange(periods * len(COLUMNS), dtype=float).reshape(periods, len(COLUMNS))
+    return pd.DataFrame(data, index=index, columns=COLUMNS)
+
+
+class TestColumnStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = ColumnStore(self.path + '/GLD.cols')
+        self.meta = {'ticker': 'GLD', 'is_crypto': False, 'enddate': datetime.datetime(2017, 1, 10, 16, 30)}
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_roundtrip(self):
+        frame = make_frame('2017-01-01', 10)
+        self.store.write(frame, **self.meta)
+
+        header = self.store.read_header()
+        self.assertEqual(header['rows'], 10)
+        self.assertEqual(header['enddate'], self.meta['enddate'])
+        self.assertEqual(self.store.last_bar(header), frame.index[-1])
+        pd.testing.assert_frame_equal(self.store.read(), frame, check_names=False, check_freq=False,
+                                      check_index_type=False)
+
+    def test_date_only_enddate(self):
+        # headers written from a date, decoded back as a datetime like every other enddate
+        self.store.write(make_frame('2017-01-01', 10), ticker='SYN', is_crypto=False, enddate=datetime.date(2017, 1, 10))
+        self.assertEqual(self.store.read_header()['enddate'], datetime.datetime(2017, 1, 10))
+        self.assertEqual(decode_date('2017-01-10T12:30:00'), datetime.datetime(2017, 1, 10, 12, 30))
+
+    def test_window(self):
+        frame = make_frame('2017-01-01', 10)
+        self.store.write(frame, **self.meta)
+        window = self.store.read(start_date=datetime.date(2017, 1, 8))
+        self.assertEqual(len(window), 3)
+        self.assertEqual(window.index[0], pd.Timestamp('2017-01-08'))
+
+    def test_append(self):
+        frame = make_frame('2017-01-01', 10)
+        self.store.write(frame[:6], **self.meta)
+        self.store.append(frame[6:], enddate=datetime.datetime(2017, 1, 11))
+
+        header = self.store.read_header()
+        self.assertEqual(header['rows'], 10)
+        self.assertEqual(header['ticker'], 'GLD')
+        np.testing.assert_array_equal(self.store.read().values, frame.values)
+
+    def test_failed_write_keeps_store(self):
+        frame = make_frame('2017-01-01', 10)
+        self.store.write(frame, **self.meta)
+
+        broken = frame.drop(columns='volume')
+        self.assertRaises(KeyError, self.store.write, broken, **self.meta)
+
+        np.testing.assert_array_equal(self.store.read().values, frame.values)
+        self.assertEqual(os.listdir(self.path), ['GLD.cols'])
+
+    def test_interrupted_append(self):
+        frame = make_frame('2017-01-01', 10)
+        self.store.write(frame[:6], **self.meta)
+
+        # rows written past the header count are not there until the header says so
+        with open(self.store._column_path('open'), 'ab') as f:
+            f.write(np.arange(3, dtype=float).tobytes())
+        self.assertEqual(len(self.store.read()), 6)
+
+        self.store.append(frame[6:], **self.meta)
+        np.testing.assert_array_equal(self.store.read().values, frame.values)
+
+    def test_checksums(self):
+        frame = make_frame('2017-01-01', 10)
+        self.store.write(frame[:6], **self.meta)
+        self.store.append(frame[6:], **self.meta)
+        appended = self.store.read_header()['checksums']
+
+        self.store.write(frame, **self.meta)
+        self.assertEqual(appended, self.store.read_header()['checksums'])
+        self.assertEqual(self.store.verify(), [])
+
+        with open(self.store._column_path('high'), 'r+b') as f:
+            f.write(b'\xff' * 8)
+        with open(self.store._column_path('low'), 'r+b') as f:
+            f.truncate(8)
+        self.assertEqual(self.store.verify(), ['high', 'low'])
+
+    def test_upgrade(self):
+        frame = make_frame('2017-01-01', 10)
+        expected = self.store.write(frame, **self.meta)['checksums']
+        with open(self.store.header_path) as f:
+            header = json.load(f)
+        header['schema_version'] = 1
+        del header['checksums']
+        with open(self.store.header_path, 'w') as f:
+            json.dump(header, f)
+
+        header = self.store.read_header()
+        self.assertEqual(header['checksums'], expected)
+        self.assertEqual(header['enddate'], self.meta['enddate'])
+
+        # readers do not write, the next append stores the upgraded header
+        with open(self.store.header_path) as f:
+            self.assertEqual(json.load(f)['schema_version'], 1)
+        self.store.append(make_frame('2017-01-11', 2), **self.meta)
+        with open(self.store.header_path) as f:
+            self.assertEqual(json.load(f)['schema_version'], 2)
+        self.assertEqual(self.store.verify(), [])
+
+    def test_schema_mismatch(self):
+        self.store.write(make_frame('2017-01-01', 3), **self.meta)
+        with open(self.store.header_path) as f:
+            header = json.load(f)
+        header['schema_version'] = 0
+        with open(self.store.header_path, 'w') as f:
+            json.dump(header, f)
+
+        self.assertRaises(IOError, self.store.read_header)
+
+
+class TestChunkedStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = ChunkedStore(self.path + '/coinBTC.hourly')
+        self.meta = {'ticker': 'BTC', 'is_crypto': True, 'enddate': datetime.datetime(2017, 3, 10)}
+        self.frame = make_frame('2017-01-20', 24 * 40, freq='H')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_chunks(self):
+        self.store.write(self.frame[:100], **self.meta)
+        for end in range(300, len(self.frame) + 1, 200):
+            self.store.append(self.frame[end - 200:end], **self.meta)
+        self.store.append(self.frame[end:], **self.meta)
+
+        header = self.store.read_header()
+        self.assertEqual([c['name'] for c in header['chunks']], ['2017-01', '2017-02'])
+        self.assertEqual(header['rows'], len(self.frame))
+        self.assertEqual(self.store.last_bar(header), self.frame.index[-1])
+        self.assertEqual(self.store.verify(), [])
+
+        # prices are float32 on disk, read back as float64
+        self.assertEqual(os.path.getsize(self.store.path + '/2017-02/open.f4'), 4 * 24 * 28)
+        read = self.store.read()
+        self.assertEqual(read.open.dtype, np.float64)
+        np.testing.assert_allclose(read.values, self.frame.values, rtol=1e-7)
+
+    def test_window(self):
+        self.store.write(self.frame, **self.meta)
+        start = pd.Timestamp('2017-02-03 05:00')
+        with mock.patch.object(ColumnStore, 'read', autospec=True, side_effect=ColumnStore.read) as read:
+            window = self.store.read(start)
+
+        self.assertEqual([c[0][0].path[-7:] for c in read.call_args_list], ['2017-02'])
+        self.assertEqual(window.index[0], start)
+        self.assertEqual(len(window), len(self.frame[start:]))
+
+    def test_verify(self):
+        self.store.write(self.frame, **self.meta)
+        with open(self.store.path + '/2017-01/close.f4', 'r+b') as f:
+            f.write(b'\xff' * 4)
+        self.assertEqual(self.store.verify(), ['2017-01/close'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+sweep : backtest a grid of indicator settings across many tickers
+
+Every setting of one ticker runs in the same process on the same Security,
+so the price arrays are loaded once and each distinct indicator (RSI of a
+period, EMA of a length, ...) is computed once through its IndicatorCache.
+Tickers are spread over a process pool.
+"""
+import itertools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from models.security import Security
+
+GRIDS = {
+    'rsi': {'n': (7, 14, 21), 'ma': (5, 10, 20)},
+    'macd': {'slow': (21, 26, 34), 'fast': (8, 12), 'signal': (7, 10)},
+}
+
+
+def settings(grid):
+    """every combination of a {param: values} grid as a list of {param: value}"""
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def sweep_ticker(ticker, klass, grid, span='daily', start_date=None, crypto=False):
+    """one row per setting: ticker, the params, performance and trade count"""
+    s = Security.load(ticker, crypto=crypto)
+
+    rows = []
+    for params in settings(grid):
+        with s.span(span, klass, start_date=start_date, **params) as so:
+            orders = so.decide.compute_orders()
+            so.eval.evaluate(orders)
+            rows.append(dict(params, ticker=ticker, performance=so.eval.performance, trades=len(orders[0])))
+
+    s.save()
+    return rows
+
+
+class Sweep(object):
+    def __init__(self, tickers, klass='rsi', grid=None, span='daily', start_date=None, crypto=False, workers=None):
+        self.tickers = tickers
+        self.klass = klass
+        self.grid = grid or GRIDS[klass]
+        self.span = span
+        self.start_date = start_date
+        self.crypto = crypto
+        self.workers = workers
+
+    def run(self):
+        """ticker x params table of performance and trade counts, tickers that fail are left out"""
+        args = (self.klass, self.grid, self.span, self.start_date, self.crypto)
+
+        rows = []
+        with ProcessPoolExecutor(self.workers) as pool:
+            futures = [(ticker, pool.submit(sweep_ticker, ticker, *args)) for ticker in self.tickers]
+            for ticker, future in futures:
+                try:
+                    rows.extend(future.result())
+                except Exception as e:
+                    logging.error('Sweep of {} failed ({})'.format(ticker, e))
+
+        columns = ['ticker'] + sorted(self.grid) + ['performance', 'trades']
+        return pd.DataFrame(rows, columns=columns)
+
+
+def best(table, n=5, per_ticker=False):
+    """
+    settings with the highest mean performance over all tickers, or the
+    best setting of each ticker with per_ticker
+    """
+    params = [c for c in table.columns if c not in ('ticker', 'performance', 'trades')]
+    if per_ticker:
+        return table.loc[table.groupby('ticker').performance.idxmax()].set_index('ticker')
+
+    summary = table.groupby(params).agg(performance=('performance', 'mean'), trades=('trades', 'mean'),
+                                        tickers=('ticker', 'count'))
+    return summary.sort_values('performance', ascending=False).head(n)
@@ -0,0 +1,56 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from models.security import Security
+from models.sweep import Sweep, sweep_ticker, settings, best
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir, Security.store_dir = Security.store_dir, tempfile.mkdtemp()
+
+        index = pd.bdate_range('2016-06-01', periods=300)
+        for seed, ticker in enumerate(('AAA', 'BBB')):
+            prices = pd.Series(100. + np.cumsum(np.random.RandomState(seed).normal(0, 1, len(index))), index=index)
+            s = Security(ticker, sync=False)
+            s.enddate = Security._now()
+            s.append(pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1,
+                                   'close': prices, 'volume': prices, 'adj_close': prices}))
+            s.save()
+
+    def tearDown(self):
+        shutil.rmtree(Security.store_dir)
+        Security.store_dir = self.store_dir
+
+    def test_settings(self):
+        self.assertEqual(settings({'n': (7, 14), 'ma': (10,)}), [{'ma': 10, 'n': 7}, {'ma': 10, 'n': 14}])
+
+    def test_matches_single_runs(self):
+        rows = sweep_ticker('AAA', 'rsi', {'n': (7, 14), 'ma': (5, 10)})
+        self.assertEqual(len(rows), 4)
+
+        s = Security.load('AAA')
+        with s.span('daily', 'rsi', n=14, ma=5) as so:
+            orders = so.decide.compute_orders()
+            so.eval.evaluate(orders)
+        row = [r for r in rows if (r['n'], r['ma']) == (14, 5)][0]
+        self.assertAlmostEqual(row['performance'], so.eval.performance)
+        self.assertEqual(row['trades'], len(orders[0]))
+
+    def test_table(self):
+        table = Sweep(['AAA', 'BBB'], 'macd', {'slow': (26,), 'fast': (8, 12), 'signal': (10,)},
+                      workers=2).run()
+
+        self.assertEqual(sorted(set(table.ticker)), ['AAA', 'BBB'])
+        self.assertEqual(len(table), 4)
+        self.assertEqual(len(best(table, n=1)), 1)
+        self.assertEqual(list(best(table, per_ticker=True).index), ['AAA', 'BBB'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,30 +1,278 @@
+"""
+timespan : resample bars into longer spans
+
+A Resampler turns an OHLCV frame of any bar size (daily equities, 24/7
+crypto, hourly crypto) into bars of its frequency.  Every bar is mapped to
+an integer bucket code by Buckets and each column is reduced per bucket
+with numpy reduceat.  A bucket code only depends on the bar timestamp, so
+appending bars only recomputes the buckets they touch.
+
+Frequencies are pandas aliases:
+
+    fixed       4H, 2D, 30min   buckets counted from the epoch, as pandas
+                                resample with origin='epoch'
+    sessions    B, 2B, C        trading sessions of the us_bd calendar,
+                                weekend and holiday bars join the next one
+    anchored    W-MON, MS, QS   calendar edges with the default pandas
+                                closed and label sides
+"""
+import numpy as np
 import pandas as pd
 
+from pandas.tseries.frequencies import to_offset
 from pandas.tseries.holiday import USFederalHolidayCalendar
-from pandas.tseries.offsets import CustomBusinessDay
+from pandas.tseries.offsets import CustomBusinessDay, BusinessDay, Tick
 
 us_bd = CustomBusinessDay(calendar=USFederalHolidayCalendar())
 
+ORIGIN = pd.Timestamp('1970-01-01')
+DAY = pd.Timedelta(days=1).value
 
-class AddTimeSpan(object):
+# a span of more buckets than this is refused, every empty bucket is a row
+MAX_BUCKETS = 10 ** 6
 
-    def add_week(self, f):
-        open = f.open.resample('W-MON').last()
-        close = f.close.resample('W-FRI').last().resample('W-MON').last()
-        adj_close = f.adj_close.resample('W-FRI').last().resample('W-MON').last()
-        high = f.high.resample('W-MON').max()
-        low = f.low.resample('W-MON').min()
-        vol = f.volume.resample('W-MON').sum()
+# reduction of each column and the order of the columns of a span
+OHLCV = {'open': 'first', 'close': 'last', 'high': 'max', 'low': 'min', 'volume': 'sum', 'adj_close': 'last'}
 
-        return pd.concat([open, close, high, low, vol, adj_close], axis=1)
+# pandas labels the buckets of these offsets by their right edge
+RIGHT_LABELED = ('W', 'M', 'ME', 'BM', 'BME', 'Q', 'QE', 'BQ', 'BQE', 'A', 'Y', 'YE', 'BA', 'BY', 'BYE')
 
-    def add_month(self, f):
-        open = f.open.resample('MS').last()
-        close = f.close.resample('M').last().resample('MS').last()
-        adj_close = f.adj_close.resample('M').last().resample('MS').last()
-        high = f.high.resample('MS').max()
-        low = f.low.resample('MS').min()
-        vol = f.volume.resample('MS').sum()
 
-        return pd.concat([open, close, high, low, vol, adj_close], axis=1)
+class Buckets(object):
+    """bar timestamp -> integer bucket code of one frequency and calendar"""
+    _cache = {}
+
+    def __init__(self, freq, calendar=us_bd):
+        self.freq = freq
+        self.offset = to_offset(freq)
+        self.calendar = calendar
+
+        if isinstance(self.offset, Tick):
+            self.kind = 'fixed'
+        elif isinstance(self.offset, (BusinessDay, CustomBusinessDay)):
+            self.kind = 'sessions'
+        else:
+            self.kind = 'anchored'
+            self.right = self.offset.rule_code.split('-')[0] in RIGHT_LABELED
+            self.edges = pd.DatetimeIndex([])
+
+    @classmethod
+    def get(cls, freq, calendar=us_bd):
+        """the Buckets of freq on calendar, built once"""
+        key = freq, id(calendar)
+        if key not in cls._cache:
+            cls._cache[key] = cls(freq, calendar)
+        return cls._cache[key]
+
+    def _cover(self, latest):
+        """extend the anchored edges up to latest"""
+        if not len(self.edges) or self.edges[-1] < latest:
+            self.edges = pd.date_range(ORIGIN, latest + self.offset + self.offset, freq=self.offset)
+
+    def codes(self, index):
+        """int64 bucket codes of the sorted DatetimeIndex index"""
+        index = pd.DatetimeIndex(index)
+        if len(index) and index[0] < ORIGIN:
+            raise ValueError('Bars before {} can not be bucketed'.format(ORIGIN))
+
+        if self.kind == 'fixed':
+            return (index.asi8 - ORIGIN.value) // self.offset.nanos
+
+        if self.kind == 'sessions':
+            days = index.values.astype('datetime64[D]')
+            sessions = np.busday_count(ORIGIN.date(), days, busdaycal=self.calendar.calendar)
+            return sessions // self.offset.n
+
+        if not len(index):
+            return np.zeros(0, dtype=np.int64)
+        self._cover(index[-1])
+        if self.right:
+            # right closed edges run to the end of the edge day
+            days = index.asi8 - (index.asi8 - ORIGIN.value) % DAY
+            return self.edges.asi8.searchsorted(days, side='left').astype(np.int64)
+        return self.edges.searchsorted(index, side='right').astype(np.int64) - 1
+
+    def labels(self, codes):
+        """DatetimeIndex of the bucket codes"""
+        codes = np.asarray(codes, dtype=np.int64)
+        if self.kind == 'fixed':
+            return pd.DatetimeIndex((ORIGIN.value + codes * self.offset.nanos).view('M8[ns]'))
+
+        if self.kind == 'sessions':
+            if not len(codes):
+                return pd.DatetimeIndex([])
+            # busday_offset walks from the origin for every code, list the sessions once instead
+            calendar, n = self.calendar.calendar, self.offset.n
+            first = np.busday_offset(ORIGIN.date(), codes.min() * n, roll='forward', busdaycal=calendar)
+            last = np.busday_offset(first, (codes.max() - codes.min()) * n, busdaycal=calendar)
+            days = np.arange(first, last + 1)
+            sessions = days[np.is_busday(days, busdaycal=calendar)]
+            return pd.DatetimeIndex(sessions[(codes - codes.min()) * n].astype('M8[ns]'))
+
+        if len(codes):
+            while len(self.edges) <= codes.max():
+                self._cover(self.edges[-1] + self.offset)
+        return self.edges[codes]
+
+    def start(self, code):
+        """earliest timestamp in the bucket code"""
+        if self.kind == 'fixed':
+            return self.labels([code])[0]
+        if self.kind == 'sessions':
+            # the day after the last session of the previous bucket
+            return self.labels([code])[0] if code <= 0 else \
+                pd.Timestamp(np.busday_offset(ORIGIN.date(), code * self.offset.n - 1, roll='forward',
+                                              busdaycal=self.calendar.calendar)) + pd.Timedelta(days=1)
+        if self.right:
+            return ORIGIN if code <= 0 else self.labels([code - 1])[0] + pd.Timedelta(days=1)
+        return self.labels([code])[0]
+
+
+def segment_reduce(codes, values, hows):
+    """
+    (bucket codes, reduced values) of the (bars, columns) values, column j
+    reduced by hows[j] over the runs of equal sorted codes.  nan bars are
+    skipped, as pandas does: an empty bucket is nan except for a sum, 0.
+    """
+    n = len(codes)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], n]
+    out = np.empty((len(starts), values.shape[1]))
+
+    for how in set(hows):
+        columns = [j for j, h in enumerate(hows) if h == how]
+        v = values[:, columns]
+        missing = np.isnan(v)
+
+        if how == 'max':
+            out[:, columns] = np.fmax.reduceat(v, starts, axis=0)
+        elif how == 'min':
+            out[:, columns] = np.fmin.reduceat(v, starts, axis=0)
+        elif how == 'sum':
+            out[:, columns] = np.add.reduceat(np.where(missing, 0., v), starts, axis=0)
+        elif how == 'last':
+            position = np.maximum.reduceat(np.where(missing, -1, np.arange(n)[:, np.newaxis]), starts, axis=0)
+            found = np.take_along_axis(v, np.maximum(position, 0), axis=0)
+            out[:, columns] = np.where(position >= starts[:, np.newaxis], found, np.nan)
+        elif how == 'first':
+            position = np.minimum.reduceat(np.where(missing, n, np.arange(n)[:, np.newaxis]), starts, axis=0)
+            found = np.take_along_axis(v, np.minimum(position, n - 1), axis=0)
+            out[:, columns] = np.where(position < ends[:, np.newaxis], found, np.nan)
+        else:
+            raise ValueError('Unknown reduction {}'.format(how))
 
+    return codes[starts], out
+
+
+class Resampler(object):
+    """
+    bars of freq from an OHLCV frame, how maps each column to first, last,
+    max, min or sum.  The bars of a column in shift are moved by that
+    Timedelta before they are bucketed.
+    """
+
+    def __init__(self, freq, how=OHLCV, shift=None, calendar=us_bd):
+        self.freq = freq
+        self.how = dict(how)
+        self.shift = dict(shift or {})
+        self.buckets = Buckets.get(freq, calendar)
+
+    def _groups(self, f):
+        """[(shift, columns)] of the columns of f this resampler reduces"""
+        groups = {}
+        for column in self.how:
+            if column in f.columns:
+                groups.setdefault(self.shift.get(column), []).append(column)
+        return list(groups.items())
+
+    def check(self, f):
+        """ValueError unless the buckets of f are at least as long as its bars"""
+        if self.buckets.kind == 'fixed' and len(f) > 1:
+            spacing = np.median(np.diff(f.index.asi8))
+            if self.buckets.offset.nanos < spacing:
+                raise ValueError('{} buckets are finer than the {} bars'.format(self.freq, pd.Timedelta(spacing)))
+
+    def resample(self, f):
+        self.check(f)
+        groups = self._groups(f)
+        columns = [column for column in self.how if column in f.columns]
+        values = f[columns].values.astype(float)
+        if not len(f):
+            return pd.DataFrame(values, columns=columns, index=pd.DatetimeIndex([], name=f.index.name))
+
+        reduced = []
+        for shift, group in groups:
+            codes = self.buckets.codes(f.index if shift is None else f.index + shift)
+            positions = [columns.index(column) for column in group]
+            reduced.append((positions, codes[0], codes[-1]) +
+                           segment_reduce(codes, values[:, positions], [self.how[c] for c in group]))
+
+        lo = min(r[1] for r in reduced)
+        hi = max(r[2] for r in reduced)
+        if hi - lo + 1 > MAX_BUCKETS:
+            raise ValueError('{} buckets of {} are more than {}'.format(hi - lo + 1, self.freq, MAX_BUCKETS))
+        out = np.full((hi - lo + 1, len(columns)), np.nan)
+        for positions, first, last, codes, block in reduced:
+            sums = [j for j in positions if self.how[columns[j]] == 'sum']
+            out[first - lo:last - lo + 1, sums] = 0.
+            out[np.ix_(codes - lo, positions)] = block
+
+        index = self.buckets.labels(np.arange(lo, hi + 1)).rename(f.index.name)
+        return pd.DataFrame(out, index=index, columns=columns)
+
+    def update(self, resampled, f, since):
+        """resampled with the buckets touched by the bars of f from since onwards recomputed"""
+        shifts = [pd.Timedelta(0) if shift is None else shift for shift, _ in self._groups(f)]
+        first = min(self.buckets.codes([since + shift])[0] for shift in shifts)
+        if len(resampled):
+            # from the last bucket we have, the empty ones up to since are labelled too
+            first = min(first, self.buckets.codes(resampled.index[-1:])[0])
+
+        start = self.buckets.start(first) - max(shifts)
+        fresh = self.resample(f.iloc[f.index.searchsorted(start):])
+        boundary = self.buckets.labels([first])[0]
+        return pd.concat((resampled.iloc[:resampled.index.searchsorted(boundary)],
+                          fresh.iloc[fresh.index.searchsorted(boundary):]))
+
+
+# the week and month of a bar are labelled by the Monday and the first day
+# they trade up to, the open is the one of the last bar in the bucket
+WEEKLY = Resampler('W-MON', how=dict(OHLCV, open='last'),
+                   # weekly close is the last close up to the Friday before the Monday
+                   # label, shifting by three days lines those bars up with the label
+                   shift={'close': pd.Timedelta(days=3), 'adj_close': pd.Timedelta(days=3)})
+MONTHLY = Resampler('MS', how=dict(OHLCV, open='last'))
+QUARTERLY = Resampler('QS', how=dict(OHLCV, open='last'))
+
+
+class AddTimeSpan(object):
+    # span name -> Resampler, any other pandas frequency is a span as well
+    SPANS = {
+        'weekly': WEEKLY,
+        'monthly': MONTHLY,
+        'quarterly': QUARTERLY,
+    }
+
+    # intraday span name -> Resampler of the hourly bars, None for the bars themselves
+    INTRADAY = {
+        'hourly': None,
+        '4h': Resampler('4H'),
+    }
+
+    @classmethod
+    def resampler(cls, name):
+        """Resampler of the span name, KeyError when it is neither in SPANS nor a frequency"""
+        try:
+            return cls.SPANS[name]
+        except KeyError:
+            pass
+        try:
+            return Resampler(name)
+        except ValueError:
+            raise KeyError(name)
+
+    def add_week(self, f):
+        return WEEKLY.resample(f)
+
+    def add_month(self, f):
+        return MONTHLY.resample(f)
@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from models.timespan import Resampler, Buckets, OHLCV, WEEKLY, AddTimeSpan
+
+
+def make_bars(index, seed=0):
+    rng = np.random.RandomState(seed)
+    prices = 100. + np.cumsum(rng.normal(0, 1, len(index)))
+    bars = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices + .5,
+                         'volume': rng.randint(1, 100, len(index)).astype(float), 'adj_close': prices},
+                        index=index)
+    bars.iloc[rng.rand(len(bars)) < .05] = np.nan
+    return bars
+
+
+class TestResampler(unittest.TestCase):
+
+    def setUp(self):
+        self.daily = make_bars(pd.bdate_range('2016-06-01', periods=400))
+        self.hourly = make_bars(pd.date_range('2017-01-01 05:00', periods=2000, freq='H'))
+
+    def test_matches_pandas(self):
+        for bars, freq in ((self.hourly, '4H'), (self.hourly, 'D'), (self.daily, '2D'),
+                           (self.daily, 'W-FRI'), (self.daily, 'MS'), (self.daily, 'Q')):
+            expected = bars.resample(freq, origin='epoch').agg(OHLCV)[list(OHLCV)]
+            pd.testing.assert_frame_equal(Resampler(freq).resample(bars), expected, check_freq=False)
+
+    def test_weekly(self):
+        f = self.daily
+        ohlv = f.resample('W-MON').agg({'open': 'last', 'high': 'max', 'low': 'min', 'volume': 'sum'})
+        closes = f[['close', 'adj_close']].shift(3, freq='D').resample('W-MON').last()
+        expected = pd.concat([ohlv.open, closes.close, ohlv.high, ohlv.low, ohlv.volume, closes.adj_close], axis=1)
+        pd.testing.assert_frame_equal(WEEKLY.resample(f), expected, check_freq=False)
+
+    def test_sessions(self):
+        # the 4th of July weekend joins the next session
+        bars = make_bars(pd.date_range('2016-07-01', periods=6))
+        resampled = Resampler('B').resample(bars)
+        self.assertEqual(list(resampled.index.day), [1, 5, 6])
+        self.assertEqual(resampled.volume.iloc[1], bars.volume.iloc[1:5].sum())
+
+        codes = Buckets.get('B').codes(pd.DatetimeIndex(['2016-07-01', '2016-07-04', '2016-07-05']))
+        self.assertEqual(list(codes - codes[0]), [0, 1, 1])
+
+    def test_update(self):
+        for resampler, bars in ((WEEKLY, self.daily), (Resampler('2D'), self.daily), (Resampler('4H'), self.hourly)):
+            view = resampler.resample(bars[:100])
+            for end in range(117, len(bars), 17):
+                view = resampler.update(view, bars[:end], bars.index[end - 17])
+            pd.testing.assert_frame_equal(view, resampler.resample(bars[:end]))
+
+    def test_spans(self):
+        self.assertIs(AddTimeSpan.resampler('weekly'), WEEKLY)
+        self.assertEqual(AddTimeSpan.resampler('4H').freq, '4H')
+        self.assertRaises(KeyError, AddTimeSpan.resampler, 'hourly')
+
+    def test_too_fine(self):
+        self.assertRaises(ValueError, Resampler('1s').resample, self.daily)
+        self.assertRaises(ValueError, Resampler('30min').resample, self.hourly)
+        # one bar a second for a while, then a month later, is a bucket for every second in between
+        sparse = make_bars(pd.DatetimeIndex(['2017-01-01 00:00:00', '2017-01-01 00:00:01', '2017-01-01 00:00:02',
+                                             '2017-02-01']))
+        self.assertRaises(ValueError, Resampler('1s').resample, sparse)
+
+
+if __name__ == '__main__':
+    unittest.main()
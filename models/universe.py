@@ -0,0 +1,169 @@
+"""
+universe : many securities as one aligned price panel
+
+Universe.values is a (tickers, dates, fields) float array on a shared
+calendar, the union of every ticker's bar dates.  mask marks the bars a
+ticker really has, everything else is nan.  Loading reads the column
+stores directly, so no Security or DataFrame is kept per ticker, and the
+indicators, correlations and rankings below work on whole matrices.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from models.indicators import BatchEvaluator
+from models.security import Security
+from models.store import ColumnStore, COLUMNS
+from util.atomic import locked
+from util.indicators import relative_strength, moving_average
+
+
+class Universe(object):
+
+    def __init__(self, tickers, dates, values, fields=COLUMNS):
+        self.tickers = list(tickers)
+        self.dates = pd.DatetimeIndex(dates)
+        self.fields = tuple(fields)
+        self.values = np.asarray(values, dtype=float)
+        self.mask = ~np.isnan(self.values).all(axis=2)
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def __getitem__(self, field):
+        """(tickers, dates) matrix of field"""
+        return self.values[:, :, self.fields.index(field)]
+
+    @classmethod
+    def from_frames(cls, frames, fields=COLUMNS):
+        """panel of {ticker: DataFrame} on the union of their dates"""
+        tickers = list(frames)
+        dates = pd.DatetimeIndex(sorted(set().union(*(f.index for f in frames.values()))))
+
+        values = np.full((len(tickers), len(dates), len(fields)), np.nan)
+        for i, ticker in enumerate(tickers):
+            frame = frames[ticker]
+            values[i, dates.get_indexer(frame.index)] = frame.reindex(columns=list(fields)).values
+        return cls(tickers, dates, values, fields)
+
+    @classmethod
+    def load(cls, tickers, crypto=False, start_date=None, sync=False, fields=COLUMNS):
+        """
+        panel of the stored bars on or after start_date, sync first brings
+        stale stores up to date with one bulk download.  Tickers without a
+        readable store are left out.
+        """
+        if sync:
+            for security in Security.load_many(tickers, crypto=crypto, start_date=start_date):
+                if security.daily is not None:
+                    security.save()
+
+        frames = {}
+        for ticker in tickers:
+            store = ColumnStore(Security._filename(ticker, crypto))
+            try:
+                with locked(store.path, shared=True):
+                    frames[ticker] = store.read(start_date)
+            except (IOError, ValueError) as e:
+                logging.info('Leaving {} out of the universe ({})'.format(ticker, e))
+
+        logging.info('Universe of {} of {} tickers'.format(len(frames), len(tickers)))
+        return cls.from_frames(frames, fields)
+
+    def filled(self, field='adj_close'):
+        """field with each ticker's gaps filled by its previous bar, nan before its first bar"""
+        x = self[field]
+        index = np.where(self.mask, np.arange(x.shape[1]), 0)
+        np.maximum.accumulate(index, axis=1, out=index)
+        filled = x[np.arange(len(x))[:, np.newaxis], index]
+        filled[~np.maximum.accumulate(self.mask, axis=1)] = np.nan
+        return filled
+
+    def returns(self, field='adj_close'):
+        """(tickers, dates) relative change from the previous bar, nan where either bar is missing"""
+        x = self[field]
+        r = np.full(x.shape, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r[:, 1:] = x[:, 1:] / x[:, :-1] - 1.
+        return r
+
+    def correlation(self, field='adj_close', min_periods=20):
+        """
+        (tickers, tickers) correlation of returns over the dates both have,
+        nan for pairs sharing fewer than min_periods returns
+        """
+        r = self.returns(field)
+        m = (~np.isnan(r)).astype(float)
+        x = np.where(m > 0, r, 0.)
+
+        n = m.dot(m.T)
+        sx = x.dot(m.T)  # sum of the row ticker's returns over the common dates
+        sxx = (x * x).dot(m.T)
+        sxy = x.dot(x.T)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = sxy / n - (sx / n) * (sx.T / n)
+            var = sxx / n - (sx / n) ** 2
+            corr = cov / np.sqrt(var * var.T)
+        corr[n < min_periods] = np.nan
+        return corr
+
+    def rsi(self, n=7, ma=10, field='adj_close'):
+        """
+        RSI(n) and its EMA(ma) as RSIMixin.compute for every ticker at once.
+        Gaps are filled with the previous bar, tickers starting on the same
+        date share one matrix computation.
+        """
+        x = self.filled(field)
+        rsi, rsi_ma = np.full(x.shape, np.nan), np.full(x.shape, np.nan)
+
+        starts = np.argmax(self.mask, axis=1)
+        for start in np.unique(starts[self.mask.any(axis=1)]):
+            rows = np.where(starts == start)[0]
+            block = relative_strength(x[rows, start:], n)
+            rsi[rows, start:] = block
+            rsi_ma[rows, start:] = moving_average(block, ma, type='exponential')
+
+        rsi[~self.mask] = rsi_ma[~self.mask] = np.nan
+        return rsi, rsi_ma
+
+    @staticmethod
+    def crosses(a, b):
+        """
+        (tickers, dates) +1 on the bars after which a moves above b, -1 below,
+        0 elsewhere, the bars sign_changes of a - b finds per series
+        """
+        sign = np.sign(a - b)
+        found = np.zeros(sign.shape)
+        with np.errstate(invalid='ignore'):
+            found[:, :-1] = np.sign(np.nan_to_num(np.diff(sign, axis=1)))
+        return found
+
+    def last(self, x):
+        """each ticker's value of the (tickers, dates) matrix x on its last bar"""
+        ends = x.shape[1] - 1 - np.argmax(self.mask[:, ::-1], axis=1)
+        return x[np.arange(len(x)), ends]
+
+    def rank(self, scores, ascending=True):
+        """tickers ordered by scores, one per ticker, nan scores are left out"""
+        scores = np.asarray(scores, dtype=float)
+        order = np.argsort(-scores if not ascending else scores, kind='stable')
+        return [(self.tickers[i], scores[i]) for i in order if not np.isnan(scores[i])]
+
+    def rank_by_date(self, x, ascending=True):
+        """(tickers, dates) cross-sectional rank of x on each date, 0 first, nan where x is"""
+        x = np.where(np.isnan(x), np.inf if ascending else -np.inf, x)
+        order = np.argsort(x if ascending else -x, axis=0, kind='stable')
+        ranks = np.empty(x.shape)
+        np.put_along_axis(ranks, order, np.arange(len(x))[:, np.newaxis].repeat(x.shape[1], axis=1), axis=0)
+        ranks[np.isinf(x)] = np.nan
+        return ranks
+
+    def evaluator(self, buy, sell, vol, offsets):
+        """
+        BatchEvaluator over the open prices of the panel, trades are flat
+        arrays of date columns split per ticker by offsets
+        """
+        lengths = self.values.shape[1] - np.argmax(self.mask[:, ::-1], axis=1)
+        return BatchEvaluator(self.tickers, self['open'], lengths, offsets, buy, sell, vol)
@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from models.events import sign_changes
+from models.indicators import RSIMixin
+from models.security import Security
+from models.universe import Universe
+from util.indicators_test import random_walk
+
+
+def bars(prices):
+    return pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1,
+                         'close': prices, 'volume': prices, 'adj_close': prices})
+
+
+class TestUniverse(unittest.TestCase):
+
+    def setUp(self):
+        index = pd.bdate_range('2016-06-01', periods=300)
+        self.frames = {
+            'AAA': bars(pd.Series(random_walk(300, 0), index=index)),
+            'BBB': bars(pd.Series(random_walk(300, 1), index=index)).drop(index[[50, 51, 200]]),
+            'CCC': bars(pd.Series(random_walk(200, 2), index=index[100:])),
+        }
+        self.universe = Universe.from_frames(self.frames)
+
+    def test_alignment(self):
+        u = self.universe
+        self.assertEqual(u.values.shape, (3, 300, 6))
+        self.assertEqual(u.mask.sum(axis=1).tolist(), [300, 297, 200])
+        np.testing.assert_array_equal(u['adj_close'][1][u.mask[1]], self.frames['BBB'].adj_close.values)
+        self.assertTrue(np.isnan(u['open'][2, :100]).all())
+
+    def test_rsi_matches_mixin(self):
+        rsi, rsi_ma = self.universe.rsi()
+        for i in (0, 2):
+            expected = RSIMixin.compute(self.frames[self.universe.tickers[i]].adj_close.values)
+            np.testing.assert_allclose(rsi[i][self.universe.mask[i]], expected[0])
+            np.testing.assert_allclose(rsi_ma[i][self.universe.mask[i]], expected[1])
+        self.assertTrue(np.isnan(rsi[1, 50]))
+
+    def test_correlation(self):
+        corr = self.universe.correlation()
+        returns = pd.DataFrame({t: f.adj_close for t, f in self.frames.items()}).pct_change(fill_method=None)
+        np.testing.assert_allclose(corr, returns.corr().values)
+
+    def test_crosses(self):
+        rsi, rsi_ma = self.universe.rsi()
+        found = self.universe.crosses(rsi, rsi_ma)
+        np.testing.assert_array_equal(np.where(found[0])[0], sign_changes(rsi[0] - rsi_ma[0]))
+
+    def test_rank(self):
+        u = self.universe
+        ranked = u.rank(u.last(u['adj_close']), ascending=False)
+        expected = sorted(((t, f.adj_close.values[-1]) for t, f in self.frames.items()), key=lambda r: -r[1])
+        self.assertEqual(ranked, expected)
+
+        ranks = u.rank_by_date(u['adj_close'])
+        self.assertEqual(sorted(ranks[:, 150]), [0, 1, 2])
+        self.assertTrue(np.isnan(ranks[2, 0]))
+
+    def test_evaluator(self):
+        table = self.universe.evaluator([10, -5], [20, -1], [1., 1.], [0, 1, 1, 2]).evaluate()
+        opens = self.universe['open']
+        self.assertAlmostEqual(table.pnl['AAA'], opens[0, 20] - opens[0, 10])
+        self.assertAlmostEqual(table.pnl['CCC'], opens[2, -1] - opens[2, -5])
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir, Security.store_dir = Security.store_dir, tempfile.mkdtemp()
+        index = pd.bdate_range('2016-06-01', periods=100)
+        for seed, ticker in enumerate(('AAA', 'BBB')):
+            s = Security(ticker, sync=False)
+            s.enddate = Security._now()
+            s.append(bars(pd.Series(random_walk(100, seed), index=index)))
+            s.save()
+
+    def tearDown(self):
+        shutil.rmtree(Security.store_dir)
+        Security.store_dir = self.store_dir
+
+    def test_load(self):
+        u = Universe.load(['AAA', 'MISSING', 'BBB'], start_date='2016-07-01')
+        self.assertEqual(u.tickers, ['AAA', 'BBB'])
+        self.assertEqual(u.dates[0], pd.Timestamp('2016-07-01'))
+        np.testing.assert_array_equal(u['adj_close'][1], Security.load('BBB', sync=False).daily.adj_close.values[22:])
+
+
+if __name__ == '__main__':
+    unittest.main()
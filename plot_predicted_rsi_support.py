@@ -11,7 +11,7 @@ from sklearn.svm import SVC
 from sklearn.semi_supervised import label_propagation
 from sklearn.metrics import classification_report, accuracy_score
 
-from indicators import moving_average, relative_strength, bbands
+from indicators import moving_average, relative_strength_periods, bbands
 from load_ticker import load_data
 
 fillcolor = "darkgoldenrod"
@@ -84,7 +84,7 @@ def prepare_data(r):
     pct_b = (prices - lowerBB) / (upperBB - lowerBB)
     support = pct_b * 100.
 
-    rsi = relative_strength(prices, 7)
+    rsi, rsi14, rsi21 = relative_strength_periods(prices, (7, 14, 21))
     rsi_prime = np.gradient(rsi)
     # rsi_prime_zeros = np.diff(np.sign(rsi_prime))
 
@@ -99,8 +99,8 @@ def prepare_data(r):
         (prices - ma14),
         support,
         rsi,
-        relative_strength(prices, 14),
-        relative_strength(prices, 21)
+        rsi14,
+        rsi21
     ]).T
 
     X = pd.DataFrame(X)
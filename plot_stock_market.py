@@ -68,58 +68,48 @@ import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.collections import LineCollection
 
-from sklearn import cluster, covariance, manifold
-
-from load_symbols import snp_500, static_symbols
-from load_ticker import load_quotes
+from models.market_structure import MarketStructure
+from models.universe import Universe
+from util.load_symbols import snp_500, static_symbols
 
 ###############################################################################
-# Retrieve the data from Internet
+# Retrieve the data, through the DataStore
 
 # kraft symbol has now changed from KFT to MDLZ in yahoo
 symbol_dict = snp_500(60)
 # symbol_dict = static_symbols()
 
-symbols, names = np.array(list(symbol_dict.items())).T
+universe = Universe.load(sorted(symbol_dict), start_date='2016-06-01', sync=True)
 
-quotes = load_quotes(symbols)
+# the covariance needs every quote on every day, keep the dates all of them traded
+complete = universe.mask.all(axis=0)
+names = np.array([symbol_dict[ticker] for ticker in universe.tickers])
 
-open = np.array([q.open for q in quotes]).astype(np.float)
-close = np.array([q.close for q in quotes]).astype(np.float)
+open = universe['open'][:, complete]
+close = universe['close'][:, complete]
 
 # The daily variations of the quotes are what carry most information
 variation = close - open
 
 ###############################################################################
-# Learn a graphical structure from the correlations
-edge_model = covariance.GraphLassoCV()
+# Learn a graphical structure from the correlations, cluster the quotes using
+# affinity propagation and find a low-dimension embedding for visualization.
+# The fit of each day is cached and warm starts the next one (see
+# models.market_structure), so a daily refresh of the full list is cheap.
 
 # standardize the time series: using correlations rather than covariance
 # is more efficient for structure recovery
 X = variation.copy().T
 X /= X.std(axis=0)
-edge_model.fit(X)
-
-###############################################################################
-# Cluster using affinity propagation
 
-_, labels = cluster.affinity_propagation(edge_model.covariance_)
+structure = MarketStructure(alpha=0.01).fit(universe.tickers, X, date=universe.dates[complete][-1])
+labels = structure.labels
 n_labels = labels.max()
 
 for i in range(n_labels + 1):
     print('Cluster %i: %s' % ((i + 1), ', '.join(names[labels == i])))
 
-###############################################################################
-# Find a low-dimension embedding for visualization: find the best position of
-# the nodes (the stocks) on a 2D plane
-
-# We use a dense eigen_solver to achieve reproducibility (arpack is
-# initiated with random vectors that we don't control). In addition, we
-# use a large number of neighbors to capture the large-scale structure.
-node_position_model = manifold.LocallyLinearEmbedding(
-    n_components=2, eigen_solver='dense', n_neighbors=6)
-
-embedding = node_position_model.fit_transform(X.T).T
+embedding = structure.embedding
 """
 tsne = manifold.TSNE(n_components=2, init='pca', random_state=0)
 Y = tsne.fit_transform(X.T)
@@ -146,10 +136,8 @@ ax = plt.axes([0., 0., 1., 1.])
 plt.axis('off')
 
 # Display a graph of the partial correlations
-partial_correlations = edge_model.precision_.copy()
-d = 1 / np.sqrt(np.diag(partial_correlations))
-partial_correlations *= d
-partial_correlations *= d[:, np.newaxis]
+d = 1 / np.sqrt(np.diag(structure.precision))
+partial_correlations = structure.partial_correlations
 non_zero = (np.abs(np.triu(partial_correlations, k=1)) > 0.02)
 
 # Plot the nodes using the coordinates of our embedding
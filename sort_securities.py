@@ -1,10 +1,25 @@
+"""
+sort_securities : rank the securities of a lookup key by the relevance of their RSI
+
+    python sort_securities.py [--index] [--key coins] [--workers 4]
+
+--index is the nightly job, it ranks every lookup key for the default
+weighting into the RelevanceIndex that /relevance serves from, e.g.
+
+    30 1 * * *  cd StockSurvey && python sort_securities.py --index --workers 4
+"""
+import datetime
 import logging
-from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from optparse import OptionParser
 
 import numpy as np
 from scipy import signal
 from sklearn.decomposition import TruncatedSVD
+from models.cache import RelevanceIndex, RELEVANCEDIR
+from models.indicators import RSIMixin
 from models.security import Security
+from util.indicators import wilder_warmup
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s %(levelname)s %(message)s')
@@ -141,13 +156,62 @@ def build_fav():
     return lookup
 tickers_lookup = build_fav()
 
+DEFAULT_WEIGHTING = (0.4, 0.6)
+
+
+def split_ticker(name):
+    """(ticker, crypto) of a lookup name, coins carry a coin prefix"""
+    if name.startswith('coin'):
+        return name.replace('coin', ''), True
+    return name, False
+
+
+def rsi_blend(prices):
+    """average of RSI(7) and its EMA(10), as computed by the rsi span"""
+    rsi, ma10, _ = RSIMixin.compute(prices)
+    return (rsi + ma10) / 2
+
+
+def score(daily, weekly, weighting, n_periods):
+    """weighted relevance of the daily and weekly adj_close arrays"""
+    try:
+        r1 = rsi_blend(daily)
+        # r1 = r1 * so.dataset.volume
+        r2 = rsi_blend(weekly)
+        # r2 = r2 * so.dataset.volume
+    except IndexError:
+        return None
+
+    return (weighting[0] * np.mean(r1[n_periods:]) +
+            weighting[1] * np.mean(r2[n_periods:])) / 2
+
+
+def trailing_bars(n_periods, n=7, ma=10):
+    """
+    bars of history that give the last n_periods values of rsi_blend as the
+    full history does, the RSI warm-up plus the ma bars its EMA looks back
+    """
+    return wilder_warmup(n) + ma + abs(n_periods)
+
+
+def trailing_score(daily, weekly, weighting, n_periods):
+    """score from only the trailing bars it depends on, O(window) instead of O(history)"""
+    k = trailing_bars(n_periods)
+    return score(daily[-k:], weekly[-k:], weighting, n_periods)
+
 
 class Relevancy(object):
 
-    def __init__(self, weighting=(0.4, 0.6), key='stocks'):
+    def __init__(self, weighting=DEFAULT_WEIGHTING, key='stocks', workers=None, trailing=True):
+        """
+        workers > 1 fetches in a thread pool and scores in a process pool,
+        trailing reads and scores only the bars the score depends on
+        """
         self.t = tickers_lookup[key]
         self.weighting = weighting
         self.n_periods = -5
+        self.workers = workers
+        self.trailing = trailing
 
         logging.info('New Relevancy window created for {} weights'.format(weighting))
 
@@ -165,37 +229,63 @@ class Relevancy(object):
 
         return transformed.reshape((len(X),))
 
-    def value_security(self, ticker):
-        crypto = False
-        if ticker.startswith('coin'):
-            ticker = ticker.replace('coin', '')
-            crypto = True
+    def fetch(self, ticker):
+        """load and sync ticker, returns its daily and weekly adj_close"""
+        ticker, crypto = split_ticker(ticker)
 
-        s = Security.load(ticker, crypto=crypto)
+        bars, start_date = slice(None), None
+        if self.trailing:
+            # the weekly bars need the longer stretch of daily history
+            k = trailing_bars(self.n_periods)
+            bars, start_date = slice(-k, None), datetime.datetime.now() - datetime.timedelta(weeks=k + 1)
 
+        s = Security.load(ticker, crypto=crypto, start_date=start_date)
         try:
-            with s.span('daily') as so:
-                rsi, ma10, _ = so.calc.rsi_values
-                r1 = (rsi + ma10) / 2
-                # r1 = r1 * so.dataset.volume
-
-            with s.span('weekly') as so:
-                rsi, ma10, _ = so.calc.rsi_values
-                r2 = (rsi + ma10) / 2
-                # r2 = r2 * so.dataset.volume
-
-        except IndexError:
-            return None
+            return s.daily.adj_close.values[bars], s.weekly.adj_close.values[bars]
         finally:
             s.save()
 
-        return (self.weighting[0] * np.mean(r1[self.n_periods:]) +
-                self.weighting[1] * np.mean(r2[self.n_periods:])) / 2
+    def value_security(self, ticker):
+        try:
+            return score(*self.fetch(ticker), weighting=self.weighting, n_periods=self.n_periods)
+        except Exception as e:
+            logging.error('Skipping {} ({})'.format(ticker, e))
+            return None
+
+    def parallel_values(self):
+        """
+        value every ticker with the fetches running in threads and the
+        scoring in processes, results are in the order of self.t
+        """
+        val = []
+        with ProcessPoolExecutor(self.workers) as procs, ThreadPoolExecutor(self.workers) as threads:
+            # fork the scoring workers before any fetch thread exists
+            procs.submit(int).result()
+
+            fetches = [threads.submit(self.fetch, ticker) for ticker in self.t]
+            scores = []
+            for ticker, fetch in zip(self.t, fetches):
+                try:
+                    daily, weekly = fetch.result()
+                    scores.append(procs.submit(score, daily, weekly, self.weighting, self.n_periods))
+                except Exception as e:
+                    logging.error('Skipping {} ({})'.format(ticker, e))
+                    scores.append(None)
+
+            for ticker, future in zip(self.t, scores):
+                try:
+                    val.append(future.result() if future else None)
+                except Exception as e:
+                    logging.error('Skipping {} ({})'.format(ticker, e))
+                    val.append(None)
+
+        return val
 
     def sortby_relevance(self, only_names=False, limit=200):
-        # with Pool(2) as p:
-        #     val = p.map(self.value_security, self.t)
-        val = map(self.value_security, self.t)
+        if self.workers and self.workers > 1:
+            val = self.parallel_values()
+        else:
+            val = map(self.value_security, self.t)
 
         d = dict(zip(self.t, val))
         d = {k: v for k, v in d.items() if v is not None}
@@ -206,6 +296,36 @@ class Relevancy(object):
         return [(k, d[k]) for k in sorted(d, key=d.get)][:limit]
 
 
+def rank_relevance(lookup_key, weighting, workers=None):
+    """every ranked (name, score) of lookup_key and the timestamp of the newest bar used"""
+    r = Relevancy(weighting=weighting, key=lookup_key, workers=workers)
+    ranked = r.sortby_relevance(limit=None)
+
+    # the sweep just synced every ticker, so their headers are fresh
+    bars = [Security.cached_version(*split_ticker(name)) for name, _ in ranked]
+    bars = [bar for bar in bars if bar is not None]
+    return ranked, max(bars) if bars else None
+
+
+def relevance_index(workers=None):
+    return RelevanceIndex(lambda key, weighting: rank_relevance(key, weighting, workers), RELEVANCEDIR)
+
+
 if __name__ == '__main__':
-    from pprint import pprint
-    pprint(Relevancy(key='coins').sortby_relevance(only_names=False))
+    parser = OptionParser()
+    parser.add_option("--index",
+                      action="store_true", dest="index", default=False,
+                      help="Rank every lookup key into the relevance index served by /relevance")
+    parser.add_option("--key", dest="key", default='coins',
+                      help="Lookup key to rank ({})".format(', '.join(sorted(tickers_lookup))))
+    parser.add_option("--workers", dest="workers", type="int", default=4,
+                      help="Worker processes for fetching and scoring")
+    (opts, args) = parser.parse_args()
+
+    if opts.index:
+        index = relevance_index(opts.workers)
+        for key in sorted(tickers_lookup):
+            index.refresh(key, DEFAULT_WEIGHTING)
+    else:
+        from pprint import pprint
+        pprint(Relevancy(key=opts.key, workers=opts.workers).sortby_relevance(only_names=False))
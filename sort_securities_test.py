@@ -0,0 +1,53 @@
+import datetime
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from models.security import Security
+from models.store import ColumnStore
+from sort_securities import Relevancy, score, trailing_score, DEFAULT_WEIGHTING
+
+
+def random_walk(n, seed=0):
+    return 100. + np.cumsum(np.random.RandomState(seed).normal(0, 1, n))
+
+
+class TestTrailing(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir, Security.store_dir = Security.store_dir, tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(Security.store_dir)
+        Security.store_dir = self.store_dir
+
+    def test_trailing_score(self):
+        daily, weekly = random_walk(3000), random_walk(600, seed=1)
+        for n_periods in (-5, -10):
+            self.assertAlmostEqual(trailing_score(daily, weekly, DEFAULT_WEIGHTING, n_periods),
+                                   score(daily, weekly, DEFAULT_WEIGHTING, n_periods), places=9)
+
+    def test_relevancy(self):
+        # fresh as of now, so load does not sync
+        index = pd.bdate_range(end=datetime.datetime.now(), periods=1500).normalize()
+        prices = random_walk(len(index))
+        daily = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1,
+                              'close': prices, 'volume': 1., 'adj_close': prices}, index=index)
+        ColumnStore(Security._filename('SYN')).write(daily, ticker='SYN', is_crypto=False,
+                                                     enddate=datetime.datetime.now())
+
+        values = []
+        for trailing in (True, False):
+            relevancy = Relevancy(trailing=trailing)
+            relevancy.t = ['SYN']
+            values.append(relevancy.value_security('SYN'))
+
+        self.assertIsNotNone(values[0])
+        self.assertAlmostEqual(values[0], values[1], places=9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,4 @@
-from .load_ticker import load_data, load_crypto_data
+from .load_ticker import load_data, load_crypto_data, load_many, BulkLoader
 from .load_symbols import nasdaq, coin100
 
 cwd = './'  # '/tmp/'
@@ -0,0 +1,87 @@
+"""
+atomic : replace files and directories so readers see either the old or the new version,
+and advisory locks to keep writers of the same files apart
+"""
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks on windows, writes are still atomic
+    fcntl = None
+
+
+def _tmp_name(path, tag='tmp'):
+    return '{}.{}-{}-{}'.format(path, tag, os.getpid(), threading.get_ident())
+
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    """file object on a temporary file next to path, renamed over path once the block succeeds"""
+    tmp = _tmp_name(path)
+    try:
+        with open(tmp, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+@contextmanager
+def atomic_directory(path):
+    """
+    fresh directory to fill in, swapped in for path once the block succeeds.
+    A reader racing the swap may briefly find no directory, never a half
+    written one.
+    """
+    tmp = _tmp_name(path)
+    os.makedirs(tmp)
+    try:
+        yield tmp
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    old = _tmp_name(path, 'old')
+    moved = False
+    try:
+        if os.path.isdir(path):
+            os.rename(path, old)
+            moved = True
+        os.rename(tmp, path)
+    except BaseException:
+        # put the old directory back, a failed swap must not lose it
+        if moved and not os.path.exists(path):
+            os.rename(old, path)
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    shutil.rmtree(old, ignore_errors=True)
+
+
+@contextmanager
+def locked(path, shared=False):
+    """
+    advisory lock on path held for the block, through a path.lock file
+    next to it so the lock outlives path being replaced.  Shared locks let
+    readers in together, an exclusive one waits for everybody else.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    parent = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from util.atomic import atomic_write, atomic_directory, locked, fcntl
+
+
+class TestAtomic(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_write(self):
+        filename = os.path.join(self.path, 'a.txt')
+        with atomic_write(filename) as f:
+            f.write('one')
+            self.assertFalse(os.path.exists(filename))
+
+        with self.assertRaises(ValueError):
+            with atomic_write(filename) as f:
+                f.write('two')
+                raise ValueError()
+
+        with open(filename) as f:
+            self.assertEqual(f.read(), 'one')
+        self.assertEqual(os.listdir(self.path), ['a.txt'])
+
+    def test_directory(self):
+        target = os.path.join(self.path, 'a')
+        os.makedirs(target)
+        open(os.path.join(target, 'old'), 'w').close()
+
+        with atomic_directory(target) as tmp:
+            open(os.path.join(tmp, 'new'), 'w').close()
+            self.assertEqual(os.listdir(target), ['old'])
+
+        self.assertEqual(os.listdir(target), ['new'])
+        self.assertEqual(os.listdir(self.path), ['a'])
+
+    def test_directory_failed_swap(self):
+        target = os.path.join(self.path, 'a')
+        os.makedirs(target)
+        open(os.path.join(target, 'old'), 'w').close()
+
+        rename = os.rename
+
+        def fail_swap(src, dst):
+            if not src.startswith(target + '.tmp'):
+                return rename(src, dst)
+            raise OSError('rename failed')
+
+        with mock.patch('util.atomic.os.rename', side_effect=fail_swap):
+            with self.assertRaises(OSError):
+                with atomic_directory(target) as tmp:
+                    open(os.path.join(tmp, 'new'), 'w').close()
+
+        self.assertEqual(os.listdir(target), ['old'])
+        self.assertEqual(os.listdir(self.path), ['a'])
+
+    @unittest.skipIf(fcntl is None, 'no advisory locks')
+    def test_locked(self):
+        target = os.path.join(self.path, 'a')
+
+        def try_lock(mode):
+            with open(target + '.lock') as f:
+                try:
+                    fcntl.flock(f, mode | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                return True
+
+        with locked(target, shared=True):
+            self.assertTrue(try_lock(fcntl.LOCK_SH))
+            self.assertFalse(try_lock(fcntl.LOCK_EX))
+        with locked(target):
+            self.assertFalse(try_lock(fcntl.LOCK_SH))
+        self.assertTrue(try_lock(fcntl.LOCK_EX))
+
+
+if __name__ == '__main__':
+    unittest.main()
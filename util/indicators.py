@@ -1,5 +1,6 @@
 import numpy as np
 import pandas as pd
+from scipy import signal
 
 interesting_fib = [0., 14.6, 23.6, 38.2, 50., 61.8, 100.]  # , 161.8
 
@@ -8,7 +9,7 @@ def moving_average(x, n, type='simple'):
     """
     compute an n period moving average.
 
-    type is 'simple' | 'exponential'
+    type is 'simple' | 'exponential', x may be a (tickers, bars) matrix
 
     """
     x = np.asarray(x)
@@ -19,12 +20,14 @@ def moving_average(x, n, type='simple'):
 
     weights /= weights.sum()
 
-    a = np.convolve(x, weights, mode='full')[:len(x)]
+    if x.ndim > 1:
+        # the same convolution along the last axis of a (tickers, bars) matrix
+        a = signal.lfilter(weights, [1.], x, axis=-1)
+    else:
+        a = np.convolve(x, weights, mode='full')[:len(x)]
 
-    try:
-        a[:n] = a[n]
-    except IndexError:
-        pass
+    if a.shape[-1] > n:
+        a[..., :n] = a[..., n, np.newaxis]
 
     return a
 
@@ -34,33 +37,63 @@ def relative_strength(prices, n=14):
     compute the n period relative strength indicator
     http://stockcharts.com/school/doku.php?id=chart_school:glossary_r#relativestrengthindex
     http://www.investopedia.com/terms/r/rsi.asp
+
+    prices may be a 1-D series or a 2-D (n_tickers, n_bars) matrix, the
+    indicator is computed along the last axis.  Wilder's smoothing
+    up[i] = (up[i-1]*(n-1) + upval)/n is a first order recursive filter,
+    so it is evaluated with lfilter rather than a per-bar python loop.
     """
+    return _relative_strength(prices, n)[0]
+
 
+def _relative_strength(prices, n):
+    """relative_strength plus Wilder's up/down averages after the last bar"""
+    prices = np.asarray(prices, dtype=float)
     deltas = np.diff(prices)
-    seed = deltas[:n+1]
-    up = seed[seed >= 0].sum()/n
-    down = -seed[seed < 0].sum()/n
-    rs = up/down
-    rsi = np.zeros_like(prices)
-    rsi[:n] = 100. - 100./(1. + rs)
-
-    for i in range(n, len(prices)):
-        delta = deltas[i - 1]  # cause the diff is 1 shorter
-
-        if delta > 0:
-            upval = delta
-            downval = 0.
-        else:
-            upval = 0.
-            downval = -delta
-
-        up = (up*(n - 1) + upval)/n
-        down = (down*(n - 1) + downval)/n
-
-        rs = up/down
-        rsi[i] = 100. - 100./(1. + rs)
-
-    return rsi
+
+    seed = deltas[..., :n+1]
+    up = np.where(seed >= 0, seed, 0.).sum(axis=-1) / n
+    down = -np.where(seed < 0, seed, 0.).sum(axis=-1) / n
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.empty_like(prices)
+        rsi[..., :n] = (100. - 100. / (1. + up / down))[..., np.newaxis]
+
+        if prices.shape[-1] > n:
+            moves = deltas[..., n-1:]  # cause the diff is 1 shorter
+            up = _wilder_smooth(np.where(moves > 0, moves, 0.), up, n)
+            down = _wilder_smooth(np.where(moves > 0, 0., -moves), down, n)
+            rsi[..., n:] = 100. - 100. / (1. + up / down)
+            up, down = up[..., -1], down[..., -1]
+
+    return rsi, up, down
+
+
+def wilder_warmup(n=14, tol=1e-10):
+    """
+    bars relative_strength needs before a value matches the one over the full
+    history to a relative tol, the seed of Wilder's averages fades by
+    (n - 1) / n a bar
+    """
+    return int(np.ceil(np.log(tol) / np.log(1. - 1. / n))) + n + 1
+
+
+def relative_strength_periods(prices, periods=(7, 14, 21)):
+    """
+    compute the relative strength indicator for several periods at once
+
+    return value is a (len(periods),) + prices.shape array
+    """
+    prices = np.asarray(prices, dtype=float)
+    return np.stack([relative_strength(prices, n) for n in periods])
+
+
+def _wilder_smooth(x, seed, n):
+    """y[i] = (y[i-1]*(n-1) + x[i])/n along the last axis, with y[-1] = seed"""
+    alpha = (n - 1.) / n
+    zi = alpha * np.asarray(seed, dtype=float)[..., np.newaxis]
+    y, _ = signal.lfilter([1. / n], [1., -alpha], x, axis=-1, zi=zi)
+    return y
 
 
 def moving_average_convergence(x, nslow=26, nfast=12):
@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+
+from util.indicators import relative_strength, relative_strength_periods, wilder_warmup
+
+
+def relative_strength_loop(prices, n=14):
+    """reference per-bar implementation the vectorized engine must reproduce"""
+    deltas = np.diff(prices)
+    seed = deltas[:n+1]
+    up = seed[seed >= 0].sum()/n
+    down = -seed[seed < 0].sum()/n
+    rs = up/down
+    rsi = np.zeros_like(prices)
+    rsi[:n] = 100. - 100./(1. + rs)
+
+    for i in range(n, len(prices)):
+        delta = deltas[i - 1]  # cause the diff is 1 shorter
+
+        if delta > 0:
+            upval = delta
+            downval = 0.
+        else:
+            upval = 0.
+            downval = -delta
+
+        up = (up*(n - 1) + upval)/n
+        down = (down*(n - 1) + downval)/n
+
+        rs = up/down
+        rsi[i] = 100. - 100./(1. + rs)
+
+    return rsi
+
+
+def random_walk(shape, seed=0):
+    rng = np.random.RandomState(seed)
+    return 100. + np.cumsum(rng.normal(0, 1, shape), axis=-1)
+
+
+class TestRelativeStrength(unittest.TestCase):
+
+    def test_matches_loop(self):
+        prices = random_walk(500)
+        for n in (7, 14, 21):
+            np.testing.assert_allclose(relative_strength(prices, n),
+                                       relative_strength_loop(prices, n),
+                                       rtol=1e-10)
+
+    def test_flat_prices(self):
+        prices = np.array([10., 11., 11., 11., 10., 12., 12., 13., 13., 13., 12.])
+        np.testing.assert_allclose(relative_strength(prices, 3),
+                                   relative_strength_loop(prices, 3),
+                                   rtol=1e-10)
+
+    def test_short_series(self):
+        prices = random_walk(5)
+        np.testing.assert_allclose(relative_strength(prices, 7),
+                                   relative_strength_loop(prices, 7),
+                                   rtol=1e-10)
+
+    def test_matrix(self):
+        prices = random_walk((4, 300))
+        rsi = relative_strength(prices, 7)
+        self.assertEqual(rsi.shape, prices.shape)
+        for row, p in zip(rsi, prices):
+            np.testing.assert_allclose(row, relative_strength_loop(p, 7), rtol=1e-10)
+
+    def test_periods(self):
+        prices = random_walk((3, 200))
+        rsi = relative_strength_periods(prices, (7, 14, 21))
+        self.assertEqual(rsi.shape, (3, 3, 200))
+        for k, n in enumerate((7, 14, 21)):
+            np.testing.assert_allclose(rsi[k], relative_strength(prices, n))
+
+    def test_trailing_window(self):
+        prices = random_walk(3000)
+        for n in (7, 14):
+            k = wilder_warmup(n) + 5
+            np.testing.assert_allclose(relative_strength(prices[-k:], n)[-5:],
+                                       relative_strength(prices, n)[-5:], rtol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,26 @@
 import datetime
+import io
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
 import pandas as pd
 import pandas_datareader as pdr
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
 SECONDS_IN_HOUR = 60 * 60
 SECONDS_IN_DAY = 60 * 60 * 24
 
+# bars histohour returns at most per request
+CRYPTO_HOURS_LIMIT = 2000
+
+STOCK_URL = 'https://query1.finance.yahoo.com/v7/finance/download/{ticker}'
+CRYPTO_URL = 'https://min-api.cryptocompare.com/data/{endpoint}'
+
 
 def load_data(startdate, enddate, ticker):
     """
@@ -31,12 +44,17 @@ def load_crypto_data(startdate, enddate, identifier, period='day'):
 
     if period == 'day':
         payload['limit'] //= SECONDS_IN_DAY
-        r = requests.get('https://min-api.cryptocompare.com/data/histoday', params=payload)
+        r = requests.get(CRYPTO_URL.format(endpoint='histoday'), params=payload)
     else:
         payload['limit'] //= SECONDS_IN_HOUR
-        r = requests.get('https://min-api.cryptocompare.com/data/histohour', params=payload)
+        r = requests.get(CRYPTO_URL.format(endpoint='histohour'), params=payload)
+
+    return crypto_frame(r.json())
 
-    df = pd.DataFrame(r.json()['Data'])
+
+def crypto_frame(payload):
+    """cryptocompare histoday/histohour json to the columns load_data returns"""
+    df = pd.DataFrame(payload['Data'])
     df.index = pd.to_datetime(df.time, unit='s')
     df.drop('time', axis=1, inplace=True)
 
@@ -45,6 +63,128 @@ def load_crypto_data(startdate, enddate, identifier, period='day'):
     return df
 
 
+def stock_frame(text):
+    """yahoo download csv (Date,Open,High,Low,Close,Adj Close,Volume) to the columns load_data returns"""
+    df = pd.read_csv(io.StringIO(text), index_col=0, parse_dates=True, na_values=['null'])
+    df.rename(str.lower, axis='columns', inplace=True)
+    df.rename(index=str, columns={'adj close': 'adj_close'}, inplace=True)
+    df.index.name = 'date'
+    return df.dropna()
+
+
+class RateLimiter(object):
+    """Spaces requests to the same host at least 1 / rate seconds apart, shared by all threads"""
+
+    def __init__(self, rate):
+        self.interval = 1. / rate if rate else 0.
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class BulkLoader(object):
+    """
+    Download many tickers at once over one pooled session.
+
+    Requests run on a thread pool, are rate limited per host and retried
+    with exponential backoff on connection errors, 429 and 5xx.  The base
+    urls are templates so a local stub can stand in for the real services.
+    """
+
+    def __init__(self, workers=8, rate=5., retries=3, backoff=.5,
+                 stock_url=STOCK_URL, crypto_url=CRYPTO_URL, timeout=30):
+        self.workers = workers
+        self.stock_url = stock_url
+        self.crypto_url = crypto_url
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, params):
+        self.limiter.wait(url)
+        r = self.session.get(url, params=params, timeout=self.timeout)
+        r.raise_for_status()
+        return r
+
+    def fetch_stock(self, ticker, startdate, enddate):
+        params = {
+            'period1': int(pd.Timestamp(startdate).timestamp()),
+            'period2': int(pd.Timestamp(enddate).timestamp()),
+            'interval': '1d',
+            'events': 'history',
+        }
+        return stock_frame(self.get(self.stock_url.format(ticker=ticker), params).text)
+
+    def fetch_crypto(self, identifier, startdate, enddate, period='day'):
+        seconds = SECONDS_IN_DAY if period == 'day' else SECONDS_IN_HOUR
+        params = {
+            'fsym': identifier,
+            'tsym': 'USD',
+            'toTs': int(pd.Timestamp(enddate).timestamp()),
+            'limit': int((pd.Timestamp(enddate) - pd.Timestamp(startdate)).total_seconds()) // seconds,
+        }
+        endpoint = 'histoday' if period == 'day' else 'histohour'
+        return crypto_frame(self.get(self.crypto_url.format(endpoint=endpoint), params).json())
+
+    def fetch_crypto_hours(self, identifier, startdate, enddate):
+        """hourly bars from startdate to enddate, in as many histohour requests as the limit takes"""
+        start, end = pd.Timestamp(startdate), pd.Timestamp(enddate)
+        frames = []
+        while end > start:
+            begin = max(start, end - pd.Timedelta(hours=CRYPTO_HOURS_LIMIT))
+            frames.append(self.fetch_crypto(identifier, begin, end, period='hour'))
+            end = begin
+
+        frame = pd.concat(frames[::-1]).sort_index()
+        return frame[~frame.index.duplicated(keep='last')]
+
+    def load(self, tickers, startdate, enddate, crypto=False, period='day'):
+        """
+        :return: dict of ticker -> NDFrame like load_data, tickers that
+                 failed are logged and left out
+        """
+        def fetch(ticker):
+            if crypto:
+                return self.fetch_crypto(ticker, startdate, enddate, period)
+            return self.fetch_stock(ticker, startdate, enddate)
+
+        frames = {}
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = [(ticker, pool.submit(fetch, ticker)) for ticker in tickers]
+            for ticker, future in futures:
+                try:
+                    frames[ticker] = future.result()
+                except Exception as e:
+                    logging.error('Could not download {} ({})'.format(ticker, e))
+
+        logging.info('Downloaded {}/{} tickers'.format(len(frames), len(futures)))
+        return frames
+
+
+def load_many(tickers, startdate, enddate, crypto=False, **kwargs):
+    """bulk load_data / load_crypto_data, kwargs go to BulkLoader"""
+    return BulkLoader(**kwargs).load(tickers, startdate, enddate, crypto=crypto)
+
+
+def panel(frames, field='adj_close'):
+    """align a dict of frames on their dates, one column per ticker"""
+    return pd.concat({ticker: df[field] for ticker, df in frames.items()}, axis=1).sort_index()
+
+
 def load_crypto_data_v1(startdate, enddate, identifier, granularity=str(60*60*2)):
     """
     DEPRECATED
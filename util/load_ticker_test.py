@@ -0,0 +1,136 @@
+import datetime
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+from util.load_ticker import BulkLoader, RateLimiter, panel
+
+STOCK_CSV = """Date,Open,High,Low,Close,Adj Close,Volume
+2017-01-03,10.0,11.0,9.0,10.5,10.4,1000
+2017-01-04,10.5,12.0,10.0,11.5,11.4,2000
+2017-01-05,null,null,null,null,null,null
+"""
+
+CRYPTO_JSON = {'Data': [
+    {'time': 1483401600, 'open': 1., 'high': 2., 'low': .5, 'close': 1.5, 'volumefrom': 10., 'volumeto': 15.},
+    {'time': 1483488000, 'open': 1.5, 'high': 2.5, 'low': 1., 'close': 2., 'volumefrom': 20., 'volumeto': 40.},
+]}
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """canned yahoo csv under /download/<ticker> and cryptocompare json under /data/<endpoint>"""
+    failures = {}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b'', content_type='text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.requests.append((url.path, parse_qs(url.query)))
+
+        name = url.path.rsplit('/', 1)[-1]
+        if self.failures.get(name):
+            self.failures[name] -= 1
+            return self.reply(503)
+
+        if url.path.startswith('/download/') and name != 'MISSING':
+            self.reply(200, STOCK_CSV.encode('utf-8'), 'text/csv')
+        elif url.path in ('/data/histoday', '/data/histohour'):
+            self.reply(200, json.dumps(CRYPTO_JSON).encode('utf-8'), 'application/json')
+        else:
+            self.reply(404)
+
+
+class TestBulkLoader(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = 'http://127.0.0.1:{}'.format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubHandler.failures.clear()
+        del StubHandler.requests[:]
+        self.loader = BulkLoader(workers=4, rate=0, backoff=0,
+                                 stock_url=self.base + '/download/{ticker}',
+                                 crypto_url=self.base + '/data/{endpoint}')
+        self.start, self.end = datetime.datetime(2017, 1, 1), datetime.datetime(2017, 1, 6)
+
+    def test_stocks(self):
+        frames = self.loader.load(['GLD', 'SPY', 'MISSING'], self.start, self.end)
+
+        self.assertEqual(sorted(frames), ['GLD', 'SPY'])
+        df = frames['GLD']
+        self.assertEqual(len(df), 2)  # the null row is dropped
+        self.assertEqual(df.adj_close.tolist(), [10.4, 11.4])
+        self.assertEqual(set(df.columns), {'open', 'high', 'low', 'close', 'adj_close', 'volume'})
+
+        path, params = StubHandler.requests[0]
+        self.assertEqual(params['interval'], ['1d'])
+
+    def test_retries(self):
+        StubHandler.failures['GLD'] = 2
+        frames = self.loader.load(['GLD'], self.start, self.end)
+
+        self.assertIn('GLD', frames)
+        self.assertEqual(len(StubHandler.requests), 3)
+
+    def test_crypto(self):
+        frames = self.loader.load(['BTC', 'ETH'], self.start, self.end, crypto=True)
+
+        self.assertEqual(frames['ETH'].volume.tolist(), [25., 60.])
+        self.assertEqual(frames['BTC'].adj_close.tolist(), [1.5, 2.])
+        self.assertEqual(sorted(q['fsym'][0] for _, q in StubHandler.requests), ['BTC', 'ETH'])
+
+    def test_crypto_hours(self):
+        frame = self.loader.fetch_crypto_hours('BTC', self.start, self.start + datetime.timedelta(hours=5000))
+
+        self.assertEqual(len(frame), 2)  # the same canned bars every request
+        limits = [int(q['limit'][0]) for path, q in StubHandler.requests if path == '/data/histohour']
+        self.assertEqual(limits, [2000, 2000, 1000])
+
+    def test_panel(self):
+        frames = self.loader.load(['GLD', 'SPY'], self.start, self.end)
+        aligned = panel(frames)
+        self.assertEqual(list(aligned.columns), ['GLD', 'SPY'])
+        self.assertEqual(aligned.shape, (2, 2))
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_spacing_per_host(self):
+        limiter = RateLimiter(50.)
+        start = time.time()
+        for _ in range(3):
+            limiter.wait('http://a.example/x')
+        self.assertGreaterEqual(time.time() - start, .04)
+
+        start = time.time()
+        limiter.wait('http://b.example/x')
+        self.assertLess(time.time() - start, .02)
+
+
+if __name__ == '__main__':
+    unittest.main()
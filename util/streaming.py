@@ -0,0 +1,303 @@
+"""
+streaming : indicators advanced one bar at a time
+
+Each indicator matches its batch function in util.indicators bar for bar.
+The batch versions back-fill their first values from later bars, so until
+warmup bars have been seen update() re-runs the batch function over a
+small buffer.  After that it only touches a fixed size state.  state() is
+plain json so the indicators can be saved next to a Security.
+"""
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from util.indicators import moving_average, moving_average_convergence, bbands, _relative_strength
+
+
+def _last(batch):
+    if isinstance(batch, tuple):
+        return tuple(float(np.asarray(b)[-1]) for b in batch)
+    return float(np.asarray(batch)[-1])
+
+
+class StreamingIndicator(object):
+    """update(x) takes the next bar and returns the indicator value there"""
+    warmup = 1
+
+    def __init__(self, **params):
+        self.params = params
+        self.buffer = []  # bars seen while warming up, None once warm
+        self.value = None
+
+    def batch(self, xs):
+        """the full recompute as util.indicators does it"""
+        raise NotImplementedError()
+
+    def prime(self, xs, batch):
+        """set the state right after the bars xs, batch is batch(xs)"""
+        raise NotImplementedError()
+
+    def step(self, x):
+        """advance a warm state by one bar and return the new value"""
+        raise NotImplementedError()
+
+    def get_state(self):
+        raise NotImplementedError()
+
+    def set_state(self, state):
+        raise NotImplementedError()
+
+    def reset(self, xs):
+        """start over from the history xs with one batch computation"""
+        xs = np.asarray(xs, dtype=float)
+        if not len(xs):
+            self.buffer, self.value = [], None
+            return
+
+        batch = self.batch(xs)
+        if len(xs) >= self.warmup:
+            self.prime(xs, batch)
+            self.buffer = None
+        else:
+            self.buffer = xs.tolist()
+        self.value = _last(batch)
+
+    def update(self, x):
+        if self.buffer is None:
+            self.value = self.step(float(x))
+        else:
+            self.reset(self.buffer + [float(x)])
+        return self.value
+
+    def state(self):
+        return {
+            'type': type(self).__name__,
+            'params': self.params,
+            'buffer': self.buffer,
+            'value': self.value,
+            'state': self.get_state() if self.buffer is None else None,
+        }
+
+    @classmethod
+    def restore(cls, state):
+        indicator = cls(**state['params'])
+        indicator.load_state(state)
+        return indicator
+
+    def load_state(self, state):
+        self.buffer = state['buffer']
+        self.value = tuple(state['value']) if isinstance(state['value'], list) else state['value']
+        if state['state'] is not None:
+            self.set_state(state['state'])
+
+
+class MovingAverage(StreamingIndicator):
+    """moving_average(x, n, type), the weighted window is kept as state"""
+
+    def __init__(self, n=10, type='simple'):
+        super(MovingAverage, self).__init__(n=n, type=type)
+        self.warmup = n + 1  # the first n values are back-filled with the n-th
+        weights = np.ones(n) if type == 'simple' else np.exp(np.linspace(-1., 0., n))
+        self.weights = (weights / weights.sum())[::-1]
+        self.window = deque(maxlen=n)
+
+    def batch(self, xs):
+        return moving_average(xs, self.params['n'], self.params['type'])
+
+    def prime(self, xs, batch):
+        self.window.clear()
+        self.window.extend(xs[-self.params['n']:])
+
+    def step(self, x):
+        self.window.append(x)
+        return float(np.dot(self.weights, self.window))
+
+    def get_state(self):
+        return {'window': list(self.window)}
+
+    def set_state(self, state):
+        self.window.clear()
+        self.window.extend(state['window'])
+
+
+class WilderRSI(StreamingIndicator):
+    """relative_strength(prices, n), Wilder's up/down averages are the state"""
+
+    def __init__(self, n=14):
+        super(WilderRSI, self).__init__(n=n)
+        self.warmup = n + 2  # the seed looks at the first n + 1 moves
+        self.up = self.down = self.last = None
+
+    def batch(self, xs):
+        return _relative_strength(xs, self.params['n'])[0]
+
+    def prime(self, xs, batch):
+        _, up, down = _relative_strength(xs, self.params['n'])
+        self.up, self.down, self.last = float(up), float(down), float(xs[-1])
+
+    def step(self, x):
+        n = self.params['n']
+        delta, self.last = x - self.last, x
+
+        self.up = (self.up * (n - 1) + max(delta, 0.)) / n
+        self.down = (self.down * (n - 1) + max(-delta, 0.)) / n
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return float(100. - 100. / (1. + np.float64(self.up) / self.down))
+
+    def get_state(self):
+        return {'up': self.up, 'down': self.down, 'last': self.last}
+
+    def set_state(self, state):
+        self.up, self.down, self.last = state['up'], state['down'], state['last']
+
+
+class MACD(StreamingIndicator):
+    """slow, fast, macd and signal as in MACDMixin, three exponential windows"""
+
+    def __init__(self, nslow=26, nfast=12, nsignal=10):
+        super(MACD, self).__init__(nslow=nslow, nfast=nfast, nsignal=nsignal)
+        self.warmup = max(nslow, nfast, nsignal) + 1
+        self.slow = MovingAverage(nslow, 'exponential')
+        self.fast = MovingAverage(nfast, 'exponential')
+        self.signal = MovingAverage(nsignal, 'exponential')
+
+    def batch(self, xs):
+        slow, fast, macd = moving_average_convergence(xs, self.params['nslow'], self.params['nfast'])
+        return slow, fast, macd, moving_average(macd, self.params['nsignal'], 'exponential')
+
+    def prime(self, xs, batch):
+        self.slow.prime(xs, None)
+        self.fast.prime(xs, None)
+        self.signal.prime(batch[2], None)
+
+    def step(self, x):
+        slow, fast = self.slow.step(x), self.fast.step(x)
+        return slow, fast, fast - slow, self.signal.step(fast - slow)
+
+    def get_state(self):
+        return {name: getattr(self, name).get_state() for name in ('slow', 'fast', 'signal')}
+
+    def set_state(self, state):
+        for name in ('slow', 'fast', 'signal'):
+            getattr(self, name).set_state(state[name])
+
+
+class Bands(StreamingIndicator):
+    """bbands(prices, length, numsd) over a window of the last length prices"""
+
+    def __init__(self, length=21, numsd=2):
+        super(Bands, self).__init__(length=length, numsd=numsd)
+        self.warmup = length
+        self.window = deque(maxlen=length)
+
+    def batch(self, xs):
+        return tuple(b.values for b in bbands(pd.Series(xs), self.params['length'], self.params['numsd']))
+
+    def prime(self, xs, batch):
+        self.window.clear()
+        self.window.extend(xs[-self.params['length']:])
+
+    def step(self, x):
+        self.window.append(x)
+        window = np.fromiter(self.window, dtype=float)
+        ave, sd = window.mean(), window.std(ddof=1)
+        band = sd * self.params['numsd']
+        return round(ave, 3), round(ave + band, 3), round(ave - band, 3)
+
+    def get_state(self):
+        return {'window': list(self.window)}
+
+    def set_state(self, state):
+        self.window.clear()
+        self.window.extend(state['window'])
+
+
+class Chained(StreamingIndicator):
+    """outer applied to the values of inner, e.g. the EMA(10) of RSI(7), values are (inner, outer)"""
+
+    def __init__(self, inner, outer):
+        super(Chained, self).__init__()
+        self.inner, self.outer = inner, outer
+        self.warmup = inner.warmup + outer.warmup
+
+    def batch(self, xs):
+        inner = self.inner.batch(xs)
+        return inner, self.outer.batch(inner)
+
+    def prime(self, xs, batch):
+        self.inner.prime(xs, batch[0])
+        self.outer.prime(batch[0], batch[1])
+
+    def step(self, x):
+        inner = self.inner.step(x)
+        return inner, self.outer.step(inner)
+
+    def get_state(self):
+        return {'inner': self.inner.get_state(), 'outer': self.outer.get_state()}
+
+    def set_state(self, state):
+        self.inner.set_state(state['inner'])
+        self.outer.set_state(state['outer'])
+
+    def state(self):
+        state = super(Chained, self).state()
+        state['inner'], state['outer'] = self.inner.state(), self.outer.state()
+        return state
+
+    @classmethod
+    def restore(cls, state):
+        indicator = cls(from_state(state['inner']), from_state(state['outer']))
+        indicator.load_state(state)
+        return indicator
+
+
+STREAMS = {klass.__name__: klass for klass in (MovingAverage, WilderRSI, MACD, Bands, Chained)}
+
+
+def from_state(state):
+    return STREAMS[state['type']].restore(state)
+
+
+class IndicatorStreams(object):
+    """named streaming indicators advanced together over one price series"""
+
+    def __init__(self, indicators, last=None):
+        self.indicators = indicators
+        self.last = last  # timestamp of the last bar taken in
+
+    def __getitem__(self, name):
+        return self.indicators[name].value
+
+    def reset(self, prices):
+        """recompute every indicator from the full prices series"""
+        for indicator in self.indicators.values():
+            indicator.reset(prices.values)
+        self.last = prices.index[-1] if len(prices) else None
+
+    def advance(self, prices):
+        """advance over the bars of prices newer than the last one taken in, yields each bar's date"""
+        if self.last is not None:
+            prices = prices[prices.index > self.last]
+
+        for date, x in zip(prices.index, prices.values):
+            for indicator in self.indicators.values():
+                indicator.update(x)
+            self.last = date
+            yield date
+
+    def update(self, prices):
+        for _ in self.advance(prices):
+            pass
+
+    def state(self):
+        return {
+            'last': None if self.last is None else self.last.isoformat(),
+            'indicators': {name: indicator.state() for name, indicator in self.indicators.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls({name: from_state(s) for name, s in state['indicators'].items()},
+                   None if state['last'] is None else pd.Timestamp(state['last']))
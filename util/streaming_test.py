@@ -0,0 +1,70 @@
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from util.indicators_test import random_walk
+from util.streaming import MovingAverage, WilderRSI, MACD, Bands, Chained, IndicatorStreams, from_state
+
+
+def streamed(indicator, xs):
+    return np.array([indicator.update(x) for x in xs], dtype=float)
+
+
+def batched(indicator, xs):
+    batch = indicator.batch(xs)
+    if isinstance(batch, tuple):
+        return np.column_stack([np.asarray(b, dtype=float) for b in batch])
+    return np.asarray(batch, dtype=float)
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.prices = random_walk(300)
+
+    def assertMatchesBatch(self, indicator, atol=1e-9):
+        values = streamed(indicator, self.prices)
+        expected = batched(indicator, self.prices)
+
+        # warm-up values are only provisional, the batch back-fills them
+        w = indicator.warmup - 1
+        np.testing.assert_allclose(values[w:], expected[w:], rtol=1e-9, atol=atol)
+
+    def test_moving_average(self):
+        self.assertMatchesBatch(MovingAverage(10, 'simple'))
+        self.assertMatchesBatch(MovingAverage(10, 'exponential'))
+
+    def test_rsi(self):
+        self.assertMatchesBatch(WilderRSI(7))
+        self.assertMatchesBatch(Chained(WilderRSI(7), MovingAverage(10, 'exponential')))
+
+    def test_macd(self):
+        self.assertMatchesBatch(MACD())
+
+    def test_bands(self):
+        # both sides round to 3 decimals, a last digit may flip
+        self.assertMatchesBatch(Bands(21, 2), atol=1.001e-3)
+
+    def test_state_roundtrip(self):
+        for indicator in (WilderRSI(7), MACD(), Bands(), Chained(WilderRSI(7), MovingAverage(10, 'exponential'))):
+            indicator.reset(self.prices[:200])
+            restored = from_state(json.loads(json.dumps(indicator.state())))
+
+            np.testing.assert_allclose(streamed(restored, self.prices[200:]),
+                                       streamed(indicator, self.prices[200:]))
+
+    def test_streams_skip_seen_bars(self):
+        prices = pd.Series(self.prices, index=pd.bdate_range('2016-06-01', periods=len(self.prices)))
+        streams = IndicatorStreams({'rsi': WilderRSI(7)})
+
+        streams.reset(prices[:250])
+        streams.update(prices[240:])
+
+        self.assertEqual(streams.last, prices.index[-1])
+        self.assertAlmostEqual(streams['rsi'], WilderRSI(7).batch(self.prices)[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
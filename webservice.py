@@ -1,14 +1,99 @@
+import asyncio
+import datetime
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+import matplotlib
+matplotlib.use('Agg')
 
 from aiohttp import web
 from aiohttp_swagger import *
 
-from sort_securities import Relevancy
+from sort_securities import tickers_lookup, relevance_index, DEFAULT_WEIGHTING
+from models.cache import ChartCache, CHARTDIR
 from models.security import Security
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s %(levelname)s %(message)s')
 
+WORKERS = 4
+MAX_PENDING = 32  # distinct evaluations queued or running before we answer 503
+CHART_CACHE_BYTES = 64 * 2**20
+CONTENT_TYPES = {'svg': 'image/svg+xml', 'png': 'image/png'}
+
+# only named spans, a pandas frequency from a query could ask for billions of buckets
+SPANS = ('daily',) + tuple(Security.SPANS) + tuple(Security.INTRADAY)
+
+
+class Busy(Exception):
+    pass
+
+
+class Coalescer(object):
+    """
+    Run blocking jobs in a bounded executor off the event loop.
+
+    Jobs submitted under the same key while one is in flight share its
+    result instead of recomputing (and racing on the same DataStore files).
+    """
+    def __init__(self, executor, max_pending):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.in_flight = {}
+
+    def submit(self, key, fn, *args):
+        try:
+            future = self.in_flight[key]
+            logging.info('Joining in-flight job {}'.format(key))
+        except KeyError:
+            if len(self.in_flight) >= self.max_pending:
+                raise Busy('{} jobs pending'.format(len(self.in_flight)))
+
+            future = asyncio.get_event_loop().run_in_executor(self.executor, fn, *args)
+            self.in_flight[key] = future
+            future.add_done_callback(lambda f: self.in_flight.pop(key, None))
+
+        # a client hanging up must not cancel the job for the other waiters
+        return asyncio.shield(future)
+
+
+def render_evaluation(ticker, span, indicator, start_date, crypto, force, fmt='svg'):
+    """
+    load, evaluate and plot a security, runs in a worker process
+
+    returns the chart and the timestamp of the last bar it was drawn from
+    """
+    s = Security.load(ticker, force_fetch=force, crypto=crypto)
+
+    # Create a view of the data for the timespan we are interested in
+    with s.span(span, indicator, start_date=start_date) as so:
+        # Use our strategy to figure out when to buy and sell
+        orders = so.decide.compute_orders()
+
+        # Evaluate our strategy
+        so.eval.evaluate(orders)
+
+        # Save a plot of our work
+        plot = so.plot.plot_data(web=True, fmt=fmt)
+
+    s.save()
+    last_bar = s.intraday.last if span in Security.INTRADAY else s.daily.index[-1]
+    return last_bar, plot.getvalue()
+
+
+def etag_matches(request, key):
+    """If-None-Match holds * or a list of (possibly weak) quoted etags"""
+    tags = [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]
+    return '*' in tags or key in (tag[2:].strip('"') if tag.startswith('W/') else tag.strip('"') for tag in tags)
+
+
+def chart_response(request, key, chart, fmt='svg'):
+    headers = {'ETag': '"{}"'.format(key), 'Cache-Control': 'no-cache'}
+    if etag_matches(request, key):
+        return web.Response(status=304, headers=headers)
+    if fmt == 'png':
+        return web.Response(body=chart, content_type=CONTENT_TYPES[fmt], headers=headers)
+    return web.Response(text=chart, content_type=CONTENT_TYPES[fmt], headers=headers)
+
 
 async def evaluate(request):
     """
@@ -20,6 +105,7 @@ async def evaluate(request):
     description:
     produces:
     - image/svg+xml
+    - image/png
     parameters:
     - in: query
       name: ticker
@@ -33,7 +119,22 @@ async def evaluate(request):
       type: boolean
     - in: query
       name: span
-      description: Specify the span range (daily, weekly)
+      description: Specify the span range (daily, weekly, monthly, quarterly, hourly and 4h for crypto)
+      required: false
+      type: string
+    - in: query
+      name: indicator
+      description: Strategy to evaluate (rsi, macd)
+      required: false
+      type: string
+    - in: query
+      name: format
+      description: Chart format (svg, png)
+      required: false
+      type: string
+    - in: query
+      name: start_date
+      description: First day of the chart (YYYY-MM-DD)
       required: false
       type: string
 
@@ -46,28 +147,51 @@ async def evaluate(request):
     force = request.query.get('force', False)
     crypto = request.query.get('crypto', False)
     span = request.query.get('span', 'daily')
-    start_date = request.query.get('start_date', Security.STARTDATE)
+    indicator = request.query.get('indicator', 'rsi')
+    start_date = request.query.get('start_date')
+    fmt = request.query.get('format', 'svg')
+
+    # one spelling per day, the start date is part of the chart key
+    try:
+        start_date = Security.STARTDATE if start_date is None else \
+            datetime.datetime.strptime(start_date, '%Y-%m-%d')
+    except ValueError:
+        return web.Response(status=400, text='start_date is not a YYYY-MM-DD date')
+
+    if fmt not in CONTENT_TYPES:
+        return web.Response(status=400, text='Unknown format {}'.format(fmt))
+    if span not in SPANS:
+        return web.Response(status=400, text='Unknown span {}'.format(span))
 
     if ticker.startswith('coin'):
         ticker = ticker.replace('coin', '')
         crypto = True
 
-    s = Security.load(ticker, force_fetch=force, crypto=crypto)
-
-    # Create a view of the data for the timespan we are interested in
-    with s.span(span, start_date=start_date) as so:
-        # Use our strategy to figure out when to buy and sell
-        orders = so.decide.compute_orders()
+    if span in Security.INTRADAY and not crypto:
+        return web.Response(status=400, text='No {} span for {}, only crypto has one'.format(span, ticker))
 
-        # Evaluate our strategy
-        so.eval.evaluate(orders)
+    # when the stored data is fresh the chart for it may already be rendered
+    last_bar = None if force else Security.cached_version(ticker, crypto, span)
+    if last_bar is not None:
+        key = ChartCache.key(ticker, span, indicator, start_date, last_bar, fmt)
+        if etag_matches(request, key):
+            return chart_response(request, key, None)
 
-        # Save a plot of our work
-        plot = so.plot.plot_data(web=True)
+        chart = charts.get(key)
+        if chart is not None:
+            return chart_response(request, key, chart, fmt)
 
-    s.save()
+    job = (ticker, span, indicator, str(start_date), bool(crypto), fmt, bool(force))
+    try:
+        last_bar, chart = await evaluations.submit(job, render_evaluation, ticker, span, indicator,
+                                                   start_date, crypto, force, fmt)
+    except Busy as e:
+        logging.warning('Rejecting {} ({})'.format(job, e))
+        return web.Response(status=503, text=str(e), headers={'Retry-After': '5'})
 
-    return web.Response(text=plot.getvalue(), content_type='image/svg+xml')
+    key = ChartCache.key(ticker, span, indicator, start_date, last_bar, fmt)
+    charts.put(key, chart)
+    return chart_response(request, key, chart, fmt)
 
 async def relevance(request):
     """
@@ -76,30 +200,94 @@ async def relevance(request):
     tags:
     - Relevance
     summary: Sort a bunch of securities
-    description:
+    description: Served from the relevance index, a stale ranking is returned
+                 while a new one is computed in the background
     produces:
     - application/json
+    parameters:
+    - in: query
+      name: key
+      description: Lookup key of the securities (stocks, coins, both)
+      required: false
+      type: string
+    - in: query
+      name: limit
+      description: Number of securities to return
+      required: false
+      type: integer
+    - in: query
+      name: w_daily
+      description: Weight of the daily relevance, between 0 and 1 in tenths
+      required: false
+      type: number
+    - in: query
+      name: w_weekly
+      description: Weight of the weekly relevance, between 0 and 1 in tenths
+      required: false
+      type: number
     responses:
       "200":
         description: successful operation
     """
-    lookup_key = request.query.get('key', 'n100')
-    w_daily = float(request.query.get('w_daily', 0.4))
-    w_weekly = float(request.query.get('w_weekly', 0.6))
+    lookup_key = request.query.get('key', 'stocks')
+    try:
+        # every weighting is a ranking of its own, tenths keep them few
+        weighting = (round(float(request.query.get('w_daily', DEFAULT_WEIGHTING[0])), 1),
+                     round(float(request.query.get('w_weekly', DEFAULT_WEIGHTING[1])), 1))
+        limit = int(request.query.get('limit', 200))
+    except ValueError as e:
+        return web.Response(status=400, text=str(e))
+
+    if lookup_key not in tickers_lookup:
+        return web.Response(status=400, text='Unknown key {}'.format(lookup_key))
+    if not all(0. <= w <= 1. for w in weighting):
+        return web.Response(status=400, text='Weights are between 0 and 1')
+    if limit < 0:
+        return web.Response(status=400, text='limit is negative')
+
+    entry = rankings.get(lookup_key, weighting)
+    if rankings.is_stale(entry):
+        job = rankings.key(lookup_key, weighting)
+        try:
+            refresh = refreshes.submit(job, rankings.refresh, lookup_key, weighting)
+        except Busy as e:
+            refresh = None
+            logging.warning('Not refreshing {} ({})'.format(job, e))
 
-    r = Relevancy(key=lookup_key, weighting=(w_daily, w_weekly))
-    sorted_relevance = r.sortby_relevance(only_names=True)
-    return web.json_response(data=sorted_relevance, headers={'Access-Control-Allow-Origin': '*'})
+        if entry is None:
+            # nothing to serve yet, this one request waits for the sweep
+            if refresh is None:
+                return web.Response(status=503, text='Ranking {}'.format(job), headers={'Retry-After': '60'})
+            entry = await refresh
+
+    headers = {'Access-Control-Allow-Origin': '*', 'X-Data-Time': str(entry['data_time'])}
+    return web.json_response(data=rankings.names(entry, limit), headers=headers)
 
 async def predict_rsi(request):
     return NotImplemented()
 
 
+async def shutdown_workers(app):
+    evaluations.executor.shutdown(wait=False)
+    refreshes.executor.shutdown(wait=False)
+
+
+evaluations = Coalescer(ProcessPoolExecutor(WORKERS), MAX_PENDING)
+charts = ChartCache(CHART_CACHE_BYTES, directory=CHARTDIR)
+
+# one sweep at a time, scored serially in its thread: a process pool must
+# not fork from a threaded server, the nightly job is the parallel one
+refreshes = Coalescer(ThreadPoolExecutor(1), len(tickers_lookup))
+rankings = relevance_index(None)
+
 app = web.Application()
 app.router.add_route('GET', '/evaluate', evaluate)
 app.router.add_route('GET', '/relevance', relevance)
 app.router.add_route('GET', '/predict_rsi', predict_rsi)
 app.router.add_static('/', 'Frontend/')
+app.on_shutdown.append(shutdown_workers)
 
 setup_swagger(app)  # "/api/doc"
-web.run_app(app, port=8080)
+
+if __name__ == '__main__':
+    web.run_app(app, port=8080)